@@ -0,0 +1,325 @@
+"""
+Analyzer micro-benchmark suite
+
+Times the analyzer hot paths (preprocess_image, analyze_photo,
+compare_photos, detect_pose_quality and batched analyze_photos) on
+synthetic JPEGs at 224px, 1080p and 12MP, plus batch scoring of stored
+model outputs. For every case it reports throughput, p50/p95/p99 latency
+and peak allocation, and can write the results as JSON and compare them
+against a saved baseline.
+
+Runs are reproducible: images come from a fixed seed, the result cache
+and micro-batching are off so every call does the full work, and each
+case is warmed up before it is timed. Peak allocation is measured in a
+separate untimed call under tracemalloc, which sees Python and NumPy
+buffers (including OpenCV outputs) but not memory held inside Pillow or
+TensorFlow.
+
+Usage:
+    cd ml-service
+    python benchmarks/analyzer_suite.py --output benchmarks/baseline.json
+    # ... change code ...
+    python benchmarks/analyzer_suite.py --baseline benchmarks/baseline.json --threshold 0.15
+
+With --baseline, the exit status is 1 when a case's best per-round p50
+latency or its peak allocation grew by more than the threshold (and by
+more than 0.5 ms or 1 MB, below which differences are noise). Cases
+missing from the baseline are reported as new; --cases limits a run to
+matching cases.
+"""
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+RESOLUTIONS = {
+    '224px': (224, 224),
+    '1080p': (1920, 1080),
+    '12MP': (4000, 3000)
+}
+BATCH_SIZES = (1, 4, 8, 16)
+
+# Growth below these is noise, whatever the relative change
+MIN_LATENCY_DELTA_MS = 0.5
+MIN_ALLOC_DELTA_MB = 1.0
+
+
+def synthetic_jpeg(width, height, seed=0):
+    """
+    Create a photo-like JPEG: a lit figure on a gradient, with sensor noise.
+
+    Noise keeps the file size close to a real photo of the same resolution,
+    which matters for decode time.
+
+    Args:
+        width (int): Image width
+        height (int): Image height
+        seed (int): Noise seed
+
+    Returns:
+        bytes: Encoded JPEG
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    img = np.stack([
+        60 + xx * 120 // width,
+        50 + yy * 120 // height,
+        np.full((height, width), 90)
+    ], axis=-1).astype(np.int16)
+    img[height // 6:height * 5 // 6, width * 2 // 5:width * 3 // 5] = (205, 160, 140)
+    img += rng.integers(-12, 13, size=img.shape, dtype=np.int16)
+
+    img_bytes = io.BytesIO()
+    Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).save(img_bytes, format='JPEG', quality=90)
+    return img_bytes.getvalue()
+
+
+def build_cases(analyzer, images):
+    """
+    Define the benchmark cases.
+
+    Args:
+        analyzer (ProgressPhotoAnalyzer): Analyzer without cache or scheduler
+        images (dict): Resolution name -> list of distinct JPEGs
+
+    Returns:
+        list: (name, images per call, callable) tuples
+    """
+    cases = []
+
+    for name, photos in images.items():
+        cases.append((f'preprocess_image/{name}', 1, lambda p=photos[0]: analyzer.preprocess_image(p)))
+        cases.append((f'analyze_photo/{name}', 1, lambda p=photos[0]: analyzer.analyze_photo(p)))
+        cases.append((
+            f'compare_photos/{name}', 2,
+            lambda p=photos: analyzer.compare_photos(p[0], p[1])
+        ))
+        cases.append((f'detect_pose_quality/{name}', 1, lambda p=photos[0]: analyzer.detect_pose_quality(p)))
+
+    photos = images['1080p']
+    for batch_size in BATCH_SIZES:
+        batch = [photos[i % len(photos)] for i in range(batch_size)]
+        cases.append((
+            f'analyze_photos/1080p/batch{batch_size}', batch_size,
+            lambda b=batch: analyzer.analyze_photos(b)
+        ))
+
+    # Scoring alone, on 64 stored model outputs with per-photo metrics
+    rng = np.random.default_rng(0)
+    raw = [(tuple(row), None, None) for row in rng.random((64, 3)).astype(np.float32)]
+    metrics = [{'weight': 60 + i % 40, 'height': 160 + i % 30, 'age': 20 + i % 50} for i in range(64)]
+    cases.append(('analyses_from_raw/batch64', 64, lambda: analyzer.analyses_from_raw(raw, metrics)))
+
+    return cases
+
+
+def time_calls(fn, iterations):
+    """
+    Time consecutive calls of fn.
+
+    Returns:
+        tuple: (per-call latencies in ms, total seconds)
+    """
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    return latencies, time.perf_counter() - started
+
+
+def peak_alloc_mb(fn):
+    """Peak traced allocation of one call of fn, in MB."""
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def run_suite(cases, iterations, warmup, rounds):
+    """
+    Time every case and measure its peak allocation.
+
+    Rounds are interleaved: each round times every case once, so a slow
+    spell on a shared machine spreads over all cases instead of skewing
+    the one that happened to be running. Percentiles cover every call,
+    while best_p50_ms, the lowest per-round median, is what baselines are
+    compared on: interference only ever adds time, so the quietest round
+    is the most repeatable figure.
+
+    Args:
+        cases (list): (name, images per call, callable) tuples
+        iterations (int): Timed calls per case and round
+        warmup (int): Untimed calls per case made first
+        rounds (int): Number of rounds
+
+    Returns:
+        dict: Case name -> latency percentiles (ms), throughput
+            (images/s) and peak allocation (MB)
+    """
+    for _, _, fn in cases:
+        for _ in range(warmup):
+            fn()
+
+    timings = {name: ([], [], 0.0) for name, _, _ in cases}
+    for _ in range(rounds):
+        for name, _, fn in cases:
+            latencies, round_medians, elapsed = timings[name]
+            round_latencies, round_elapsed = time_calls(fn, iterations)
+            latencies.extend(round_latencies)
+            round_medians.append(float(np.median(round_latencies)))
+            timings[name] = (latencies, round_medians, elapsed + round_elapsed)
+
+    results = {}
+    for name, images_per_call, fn in cases:
+        latencies, round_medians, elapsed = timings[name]
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        results[name] = {
+            'images_per_call': images_per_call,
+            'calls': len(latencies),
+            'best_p50_ms': round(min(round_medians), 3),
+            'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3),
+            'mean_ms': round(float(np.mean(latencies)), 3),
+            'throughput_ips': round(images_per_call * len(latencies) / elapsed, 2),
+            'peak_alloc_mb': round(peak_alloc_mb(fn), 3)
+        }
+
+    return results
+
+
+def environment(analyzer, args):
+    """Describe the machine and settings the results were taken on."""
+    import tensorflow as tf
+
+    return {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'tensorflow': tf.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'engine': analyzer.engine.name,
+        'quality_max_side': analyzer.quality_max_side,
+        'iterations': args.iterations,
+        'rounds': args.rounds,
+        'warmup': args.warmup
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results against a baseline.
+
+    Args:
+        results (dict): Case name -> run_case() result
+        baseline (dict): Same shape, from a saved run
+        threshold (float): Allowed relative growth of best_p50_ms and
+            peak_alloc_mb, e.g. 0.10 for 10%
+
+    Returns:
+        list: Names of regressed cases
+    """
+    regressions = []
+
+    print(f"\nAgainst baseline (threshold {threshold:.0%})")
+    print(f"{'case':<38}{'best p50':>10}{'base':>10}{'change':>9}{'alloc MB':>10}{'base':>8}  status")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<38}{result['best_p50_ms']:>10.2f}{'-':>10}{'':>9}{result['peak_alloc_mb']:>10.1f}{'-':>8}  new")
+            continue
+
+        change = result['best_p50_ms'] / base['best_p50_ms'] - 1 if base['best_p50_ms'] else 0.0
+        latency_regressed = (
+            change > threshold
+            and result['best_p50_ms'] - base['best_p50_ms'] > MIN_LATENCY_DELTA_MS
+        )
+        alloc_delta = result['peak_alloc_mb'] - base['peak_alloc_mb']
+        alloc_regressed = (
+            alloc_delta > MIN_ALLOC_DELTA_MB
+            and alloc_delta > threshold * base['peak_alloc_mb']
+        )
+
+        status = 'ok'
+        if latency_regressed or alloc_regressed:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            status = 'faster'
+
+        print(
+            f"{name:<38}{result['best_p50_ms']:>10.2f}{base['best_p50_ms']:>10.2f}{change:>+9.1%}"
+            f"{result['peak_alloc_mb']:>10.1f}{base['peak_alloc_mb']:>8.1f}  {status}"
+        )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=10, help="Timed calls per case and round")
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--cases', default='', help="Only run cases whose name contains this text")
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    parser.add_argument('--baseline', help="JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.15, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    from src.photoAnalyzer import ProgressPhotoAnalyzer
+
+    # Full work on every call: no result cache, no micro-batching
+    analyzer = ProgressPhotoAnalyzer()
+    analyzer.quality_max_side = 1024
+    analyzer.warmup(BATCH_SIZES)
+
+    images = {
+        name: [synthetic_jpeg(width, height, seed) for seed in (0, 1)]
+        for name, (width, height) in RESOLUTIONS.items()
+    }
+
+    cases = [case for case in build_cases(analyzer, images) if args.cases in case[0]]
+    results = run_suite(cases, args.iterations, args.warmup, args.rounds)
+
+    print(f"\n{'case':<38}{'img/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'alloc MB':>10}")
+    for name, result in results.items():
+        print(
+            f"{name:<38}{result['throughput_ips']:>9.1f}{result['p50_ms']:>10.2f}"
+            f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['peak_alloc_mb']:>10.1f}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(analyzer, args), 'results': results}, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Batch-size bucketing benchmark
+
+Runs every batch size from 1 to --max-batch through three engine set-ups
+sharing one model:
+    - plain: KerasEngine warmed for batch size 1 only, each batch at its own size
+    - bucketed: BucketedEngine over --buckets (default: DEFAULT_BUCKETS), all warmed
+    - bucketed+xla: the same with the forward pass compiled by XLA
+
+For each it reports the first call at each batch size (where an unseen
+shape pays tracing, compilation or kernel selection) and the steady-state
+p50, plus the set-up's warm-up time.
+
+Usage:
+    cd ml-service
+    python benchmarks/batch_buckets.py --iterations 20 --max-batch 16
+    python benchmarks/batch_buckets.py --buckets 1,2,4,8,16 --setups plain,bucketed
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.inferenceEngines import DEFAULT_BUCKETS, BucketedEngine, KerasEngine
+from src.photoAnalyzer import ProgressPhotoAnalyzer
+
+
+def build(name, model, buckets):
+    """
+    Create and warm one engine set-up.
+
+    Returns:
+        tuple: (engine, warm-up milliseconds)
+    """
+    if name == 'plain':
+        engine = KerasEngine(model)
+        sizes = (1,)
+    else:
+        engine = BucketedEngine(KerasEngine(model, jit_compile=name.endswith('xla')), buckets)
+        sizes = buckets
+
+    started = time.perf_counter()
+    engine.warmup(sizes)
+    return engine, (time.perf_counter() - started) * 1000
+
+
+def measure(engine, batch, iterations):
+    """
+    Time the first call and then repeated calls at one batch size.
+
+    Returns:
+        tuple: (first call ms, steady-state p50 ms)
+    """
+    started = time.perf_counter()
+    engine.predict(batch)
+    first = (time.perf_counter() - started) * 1000
+
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        engine.predict(batch)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return first, float(np.percentile(latencies, 50))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--setups', default='plain,bucketed,bucketed+xla')
+    parser.add_argument('--buckets', default=','.join(str(size) for size in DEFAULT_BUCKETS))
+    args = parser.parse_args()
+    buckets = tuple(int(size) for size in args.buckets.split(','))
+
+    model = ProgressPhotoAnalyzer().model
+    rng = np.random.default_rng(0)
+    batches = {
+        size: rng.uniform(-1, 1, (size, 224, 224, 3)).astype(np.float32)
+        for size in range(1, args.max_batch + 1)
+    }
+
+    results = {}
+    for name in args.setups.split(','):
+        engine, warmup_ms = build(name, model, buckets)
+        results[name] = {
+            'warmup_ms': warmup_ms,
+            'sizes': {size: measure(engine, batch, args.iterations) for size, batch in batches.items()}
+        }
+        print(f"{name}: warm-up {warmup_ms:.0f} ms")
+
+    names = list(results)
+    print(f"\n{'batch':>5}" + ''.join(f"{name + ' first':>20}{name + ' p50':>18}" for name in names))
+    for size in batches:
+        row = f"{size:>5}"
+        for name in names:
+            first, p50 = results[name]['sizes'][size]
+            row += f"{first:>20.1f}{p50:>18.1f}"
+        print(row)
+
+    print(f"\n{'set-up':<14}{'warm-up ms':>12}{'worst first ms':>16}{'mean p50 ms':>13}")
+    for name in names:
+        sizes = results[name]['sizes'].values()
+        print(
+            f"{name:<14}{results[name]['warmup_ms']:>12.0f}"
+            f"{max(first for first, _ in sizes):>16.1f}{np.mean([p50 for _, p50 in sizes]):>13.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
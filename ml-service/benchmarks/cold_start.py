@@ -0,0 +1,92 @@
+"""
+Cold-start benchmark
+
+Starts fresh Python processes and times analyzer start-up through two
+paths: building MobileNetV2 from ImageNet weights (the default) and
+loading the single-file .keras artifact from src.exportModel. Each run
+reports the import, build, weight load and warm-up phases and the total
+time to first prediction.
+
+The ImageNet path is measured with the Keras weight cache already
+populated; without network access and an empty cache it fails instead.
+
+Usage:
+    cd ml-service
+    python benchmarks/cold_start.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+ML_SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Runs in a fresh interpreter so nothing is warm
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+from src.photoAnalyzer import ProgressPhotoAnalyzer
+import_ms = (time.perf_counter() - started) * 1000
+analyzer = ProgressPhotoAnalyzer(model_path=sys.argv[1] or None)
+timings = dict(analyzer.startup_timings, import_ms=import_ms)
+timings['total_ms'] = (time.perf_counter() - started) * 1000
+print(json.dumps(timings))
+'''
+
+PHASES = ('import_ms', 'build_ms', 'weight_load_ms', 'warmup_ms', 'total_ms')
+
+
+def cold_start(model_path):
+    """
+    Time analyzer start-up in a new process.
+
+    Args:
+        model_path (str): MODEL_PATH for the child ('' for the default path)
+
+    Returns:
+        dict: Milliseconds per phase and in total
+    """
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, model_path],
+        cwd=ML_SERVICE_DIR,
+        env=dict(os.environ, PYTHONPATH=ML_SERVICE_DIR, TF_CPP_MIN_LOG_LEVEL='3'),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--artifact', default=None, help="Existing .keras artifact (exported if omitted)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        artifact = args.artifact
+        if artifact is None:
+            artifact = os.path.join(tmp, 'fitness_model.keras')
+            subprocess.run(
+                [sys.executable, '-m', 'src.exportModel', '--output', artifact],
+                cwd=ML_SERVICE_DIR,
+                env=dict(os.environ, PYTHONPATH=ML_SERVICE_DIR, TF_CPP_MIN_LOG_LEVEL='3'),
+                capture_output=True,
+                check=True
+            )
+
+        print(f"\nMedian of {args.runs} fresh processes, ms")
+        print(f"{'path':<16}" + ''.join(f"{phase[:-3]:>13}" for phase in PHASES))
+        for name, model_path in (('imagenet build', ''), ('.keras artifact', artifact)):
+            runs = [cold_start(model_path) for _ in range(args.runs)]
+            medians = [np.median([run[phase] for run in runs]) for phase in PHASES]
+            print(f"{name:<16}" + ''.join(f"{value:>13.0f}" for value in medians))
+
+
+if __name__ == '__main__':
+    main()
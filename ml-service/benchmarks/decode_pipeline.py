@@ -0,0 +1,95 @@
+"""
+Upload decode benchmark
+
+Compares full-resolution decode against draft-mode (DCT-scaled) JPEG
+decode for the preprocessing step, reporting latency and the size of the
+decoded RGB buffer that each request has to hold.
+
+Usage:
+    cd ml-service
+    python benchmarks/decode_pipeline.py --megapixels 12 --iterations 20
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.photoAnalyzer import ProgressPhotoAnalyzer
+
+
+def make_jpeg(megapixels):
+    """
+    Create a synthetic photo-like JPEG.
+
+    Args:
+        megapixels (float): Target resolution (4:3 aspect ratio)
+
+    Returns:
+        bytes: Encoded JPEG
+    """
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    yy, xx = np.mgrid[0:height, 0:width]
+    img_array = np.stack([
+        (xx * 255 // width),
+        (yy * 255 // height),
+        np.full((height, width), 96)
+    ], axis=-1).astype(np.uint8)
+    img_array[height // 4:height * 3 // 4, width // 3:width * 2 // 3] = (210, 170, 150)
+
+    img_bytes = io.BytesIO()
+    Image.fromarray(img_array).save(img_bytes, format='JPEG', quality=90)
+    return img_bytes.getvalue()
+
+
+def run_mode(analyzer, fast_decode, data, iterations):
+    """
+    Time preprocessing in one decode mode.
+
+    Returns:
+        tuple: (p50 latency in ms, decoded RGB buffer in MB)
+    """
+    analyzer.fast_decode = fast_decode
+    draft_size = analyzer.img_size if fast_decode else None
+
+    decoded = analyzer._load_image(data, draft_size=draft_size)
+    buffer_mb = decoded.width * decoded.height * 3 / (1024 * 1024)
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        analyzer.preprocess_image(data)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return np.percentile(latencies, 50), buffer_mb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    # Preprocessing only; skip building the model
+    analyzer = ProgressPhotoAnalyzer.__new__(ProgressPhotoAnalyzer)
+    analyzer.img_size = (224, 224)
+
+    data = make_jpeg(args.megapixels)
+    print(f"\n{args.megapixels:g}MP JPEG, {len(data) / 1024:.0f} KB, {args.iterations} iterations")
+    print(f"{'mode':<14}{'p50 ms':>10}{'decoded MB':>12}")
+
+    for name, fast_decode in (('full decode', False), ('draft decode', True)):
+        p50, buffer_mb = run_mode(analyzer, fast_decode, data, args.iterations)
+        print(f"{name:<14}{p50:>10.1f}{buffer_mb:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
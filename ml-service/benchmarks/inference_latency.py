@@ -0,0 +1,72 @@
+"""
+Single-image inference latency benchmark
+
+Compares Keras model.predict() against the compiled KerasEngine
+for batch size 1 on the current device and prints p50/p95 latency.
+
+Usage:
+    cd ml-service
+    python benchmarks/inference_latency.py --iterations 200
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.photoAnalyzer import ProgressPhotoAnalyzer
+
+
+def measure(fn, iterations, warmup=5):
+    """
+    Time repeated calls of fn.
+
+    Args:
+        fn (callable): Function to benchmark
+        iterations (int): Number of timed calls
+        warmup (int): Untimed calls made first
+
+    Returns:
+        np.ndarray: Per-call latencies in milliseconds
+    """
+    for _ in range(warmup):
+        fn()
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=100)
+    args = parser.parse_args()
+
+    analyzer = ProgressPhotoAnalyzer()
+    batch = np.random.uniform(-1, 1, (1, 224, 224, 3)).astype(np.float32)
+
+    results = {
+        'model.predict': measure(lambda: analyzer.model.predict(batch, verbose=0), args.iterations),
+        'KerasEngine': measure(lambda: analyzer.engine.predict(batch), args.iterations),
+    }
+
+    print(f"\nBatch size 1, {args.iterations} iterations")
+    print(f"{'path':<18}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, latencies in results.items():
+        print(f"{name:<18}{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 95):>10.2f}")
+
+    speedup = np.percentile(results['model.predict'], 50) / np.percentile(results['KerasEngine'], 50)
+    print(f"\np50 speedup: {speedup:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,445 @@
+"""
+Open-loop load test with a realistic request mix
+
+Replays a weighted mix of analyze (multipart and base64, with and without
+body metrics or pose quality), compare and batch-analyze requests at fixed
+arrival rates. The rates step up and each step runs for a fixed time.
+Arrivals are open-loop: requests are sent on a Poisson schedule whether
+or not earlier ones have finished. Latency is measured from the scheduled
+send time, so a saturated server shows up as growing latency instead of
+a quietly lower request rate.
+
+For every rate it reports achieved throughput, latency percentiles and the
+error rate, then names the knee: the last rate the service sustained.
+
+By default the service is launched locally under gunicorn with the
+Dockerfile's settings; --server picks uvicorn (src.asgi) or the Flask app
+in this process, and --url targets a server that is already running.
+Everything runs offline on one machine. On a single box the generator
+competes with the server for CPU; pin them apart where possible:
+    taskset -c 0 python benchmarks/load_test.py --url http://127.0.0.1:5001 ...
+
+Usage:
+    cd ml-service
+    python benchmarks/load_test.py --rates 1,2,4,8 --duration 30
+    python benchmarks/load_test.py --server uvicorn --mix analyze=6,compare=2,batch=1
+    python benchmarks/load_test.py --workers 2 --model-server
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from analyzer_suite import synthetic_jpeg
+
+ML_SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Request kind -> default weight in the mix
+DEFAULT_MIX = {
+    'analyze': 3,
+    'analyze_metrics': 3,
+    'analyze_quality': 1,
+    'analyze_base64': 2,
+    'compare': 1,
+    'compare_base64': 1,
+    'batch': 1
+}
+METRICS = {'weight': '82', 'height': '180', 'age': '34', 'gender': 'male'}
+BATCH_PHOTOS = 5
+
+
+class PhotoPool:
+    """
+    Synthetic photos for requests.
+
+    A few base JPEGs are generated once. Each request gets a unique copy
+    (bytes appended after the JPEG end marker, which decoders ignore), so
+    the result cache only hits for the requested fraction of photos.
+    """
+
+    def __init__(self, size, width, height, cache_hit_ratio, seed=0):
+        self.photos = [synthetic_jpeg(width, height, seed + i) for i in range(size)]
+        self.cache_hit_ratio = cache_hit_ratio
+        self._rng = np.random.default_rng(seed)
+        self._counter = 0
+
+    def take(self):
+        """One photo: a repeat with probability cache_hit_ratio, else unique bytes."""
+        photo = self.photos[self._rng.integers(len(self.photos))]
+        if self._rng.random() < self.cache_hit_ratio:
+            return photo
+        self._counter += 1
+        return photo + f'load-test-{self._counter}'.encode()
+
+
+def build_request(kind, pool):
+    """
+    Build the arguments of one request.
+
+    Args:
+        kind (str): Request kind from DEFAULT_MIX
+        pool (PhotoPool): Photo source
+
+    Returns:
+        tuple: (path, httpx request keyword arguments)
+    """
+    if kind == 'analyze':
+        return '/api/ml/analyze', {'files': {'photo': ('photo.jpg', pool.take(), 'image/jpeg')}}
+    if kind == 'analyze_metrics':
+        return '/api/ml/analyze', {
+            'files': {'photo': ('photo.jpg', pool.take(), 'image/jpeg')},
+            'data': METRICS
+        }
+    if kind == 'analyze_quality':
+        return '/api/ml/analyze?include_quality=true', {
+            'files': {'photo': ('photo.jpg', pool.take(), 'image/jpeg')},
+            'data': METRICS
+        }
+    if kind == 'analyze_base64':
+        return '/api/ml/analyze', {
+            'json': dict(METRICS, image=base64.b64encode(pool.take()).decode())
+        }
+    if kind == 'compare':
+        return '/api/ml/compare', {
+            'files': {
+                'photo1': ('before.jpg', pool.take(), 'image/jpeg'),
+                'photo2': ('after.jpg', pool.take(), 'image/jpeg')
+            },
+            'data': {'height': '180', 'weight1': '86', 'weight2': '82'}
+        }
+    if kind == 'compare_base64':
+        return '/api/ml/compare', {
+            'json': {
+                'photo1': base64.b64encode(pool.take()).decode(),
+                'photo2': base64.b64encode(pool.take()).decode(),
+                'height': 180,
+                'weight1': 86,
+                'weight2': 82
+            }
+        }
+    if kind == 'batch':
+        return '/api/ml/batch-analyze', {
+            'files': [
+                ('photos[]', (f'{i}.jpg', pool.take(), 'image/jpeg'))
+                for i in range(BATCH_PHOTOS)
+            ]
+        }
+    raise ValueError(f"Unknown request kind: {kind}")
+
+
+def parse_mix(text):
+    """Parse 'analyze=3,compare=1' into a kind -> weight dict."""
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in text.split(','):
+        kind, _, weight = item.partition('=')
+        kind = kind.strip()
+        if kind not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown request kind '{kind}'; choose from {', '.join(DEFAULT_MIX)}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+async def send(client, kind, path, kwargs, scheduled, records):
+    """Send one request and record (kind, latency from scheduled time, error)."""
+    try:
+        response = await client.post(path, **kwargs)
+        error = None if response.status_code < 400 else str(response.status_code)
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+    records.append((kind, time.perf_counter() - scheduled, error))
+
+
+async def run_stage(client, rate, duration, mix, pool, rng):
+    """
+    Offer Poisson arrivals at one rate for duration seconds.
+
+    Returns:
+        tuple: (records, seconds until the last response arrived)
+    """
+    kinds = list(mix)
+    weights = np.array([mix[kind] for kind in kinds], dtype=float)
+    weights /= weights.sum()
+
+    records = []
+    tasks = []
+    started = time.perf_counter()
+    next_arrival = started
+
+    while True:
+        next_arrival += rng.exponential(1.0 / rate)
+        if next_arrival - started >= duration:
+            break
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        kind = kinds[rng.choice(len(kinds), p=weights)]
+        path, kwargs = build_request(kind, pool)
+        tasks.append(asyncio.create_task(send(client, kind, path, kwargs, next_arrival, records)))
+
+    await asyncio.gather(*tasks)
+    return records, time.perf_counter() - started
+
+
+def summarize(records, rate, duration, elapsed):
+    """
+    Throughput, latency and errors for one stage.
+
+    Poisson arrivals send slightly more or fewer requests than rate times
+    duration, so achieved throughput is judged against sent_rps, the rate
+    actually sent.
+
+    Returns:
+        dict: Stage summary, with a per-kind breakdown
+    """
+    def latency_stats(latencies):
+        if not latencies:
+            return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+        p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+        return {'p50_ms': round(float(p50), 1), 'p95_ms': round(float(p95), 1), 'p99_ms': round(float(p99), 1)}
+
+    ok = [latency for _, latency, error in records if error is None]
+    errors = {}
+    for _, _, error in records:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+
+    by_kind = {}
+    for kind in sorted({kind for kind, _, _ in records}):
+        kind_records = [record for record in records if record[0] == kind]
+        by_kind[kind] = dict(
+            latency_stats([latency for _, latency, error in kind_records if error is None]),
+            requests=len(kind_records),
+            errors=sum(1 for _, _, error in kind_records if error is not None)
+        )
+
+    return dict(
+        latency_stats(ok),
+        offered_rps=rate,
+        sent_rps=round(len(records) / duration, 2),
+        requests=len(records),
+        achieved_rps=round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        error_rate=round(1 - len(ok) / len(records), 4) if records else 0.0,
+        errors=errors,
+        by_kind=by_kind
+    )
+
+
+def find_knee(stages, slo_ms, max_error_rate=0.01, min_achieved=0.9):
+    """
+    Last rate the service sustained.
+
+    A stage is sustained when its achieved throughput stays within 10% of
+    the rate sent, at most 1% of requests fail and p99 meets the SLO.
+
+    Returns:
+        tuple: (last sustained stage or None, first failing stage or None)
+    """
+    sustained = None
+    for stage in stages:
+        ok = (
+            stage['requests'] > 0
+            and stage['achieved_rps'] >= min_achieved * stage['sent_rps']
+            and stage['error_rate'] <= max_error_rate
+            and stage['p99_ms'] is not None
+            and stage['p99_ms'] <= slo_ms
+        )
+        if not ok:
+            return sustained, stage
+        sustained = stage
+    return sustained, None
+
+
+def free_port():
+    """An unused local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, workers, threads, model_server=False):
+    """
+    Launch the service locally.
+
+    Args:
+        kind (str): 'gunicorn', 'uvicorn' or 'flask' (in this process)
+        workers (int): gunicorn/uvicorn worker processes
+        threads (int): gunicorn threads per worker
+        model_server (bool): Share one model server between the gunicorn
+            workers (see gunicorn.conf.py)
+
+    Returns:
+        tuple: (base URL, stop callable)
+    """
+    port = free_port()
+
+    if kind == 'flask':
+        from werkzeug.serving import make_server
+        from src.app import app
+
+        server = make_server('127.0.0.1', port, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{port}', server.shutdown
+
+    if kind == 'gunicorn':
+        command = [
+            sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+            '--workers', str(workers), '--threads', str(threads), '--timeout', '120',
+            'src.app:app'
+        ]
+    else:
+        command = [
+            sys.executable, '-m', 'uvicorn', 'src.asgi:app', '--host', '127.0.0.1',
+            '--port', str(port), '--workers', str(workers), '--log-level', 'warning'
+        ]
+
+    env = dict(os.environ, PYTHONPATH=ML_SERVICE_DIR, TF_CPP_MIN_LOG_LEVEL='3')
+    if model_server:
+        env.update(ML_MODEL_SERVER='true', ML_MODEL_SOCKET=f'/tmp/ml-model-{port}.sock')
+
+    process = subprocess.Popen(
+        command,
+        cwd=ML_SERVICE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    def stop():
+        process.terminate()
+        process.wait(timeout=30)
+
+    return f'http://127.0.0.1:{port}', stop
+
+
+def wait_ready(url, timeout):
+    """Poll /ready until the model is warm."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'{url}/ready', timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"{url} not ready after {timeout}s")
+
+
+async def run(url, args, mix, pool):
+    """Run every stage in order and return their summaries."""
+    rng = np.random.default_rng(args.seed)
+    limits = httpx.Limits(max_connections=args.max_connections)
+    stages = []
+
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        # Untimed warm-up so connection set-up is not measured
+        for kind in mix:
+            path, kwargs = build_request(kind, pool)
+            await client.post(path, **kwargs)
+
+        print(f"\n{'offered':>8}{'sent':>8}{'achieved':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for rate in args.rates:
+            records, elapsed = await run_stage(client, rate, args.duration, mix, pool, rng)
+            stage = summarize(records, rate, args.duration, elapsed)
+            stages.append(stage)
+            print(
+                f"{rate:>8g}{stage['sent_rps']:>8.2f}{stage['achieved_rps']:>10.2f}"
+                + ''.join(
+                    f"{stage[key]:>9.0f}" if stage[key] is not None else f"{'-':>9}"
+                    for key in ('p50_ms', 'p95_ms', 'p99_ms')
+                )
+                + f"{stage['error_rate']:>8.1%}"
+            )
+
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help="Existing server to test instead of launching one")
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn', 'flask'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument('--model-server', action='store_true',
+                        help="Share one model server between the gunicorn workers")
+    parser.add_argument('--rates', default='1,2,4,8', help="Offered requests/s, one stage each")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds per stage")
+    parser.add_argument('--mix', default='', help="Weights, e.g. analyze=3,compare=1,batch=1")
+    parser.add_argument('--width', type=int, default=1600)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--cache-hit-ratio', type=float, default=0.1, help="Share of repeated photos")
+    parser.add_argument('--slo-ms', type=float, default=1000, help="p99 latency a sustained rate must meet")
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--max-connections', type=int, default=256)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write stage summaries as JSON to this path")
+    args = parser.parse_args()
+    args.rates = sorted(float(rate) for rate in args.rates.split(','))
+    if args.model_server and args.server != 'gunicorn':
+        parser.error("--model-server needs --server gunicorn")
+
+    mix = parse_mix(args.mix)
+    pool = PhotoPool(8, args.width, args.height, args.cache_hit_ratio, seed=args.seed)
+
+    stop = None
+    url = args.url
+    if url is None:
+        url, stop = start_server(args.server, args.workers, args.threads, args.model_server)
+    try:
+        wait_ready(url, timeout=300)
+        print(f"Target {url}, mix " + ', '.join(f"{kind}={weight:g}" for kind, weight in mix.items()))
+        stages = asyncio.run(run(url, args, mix, pool))
+    finally:
+        if stop is not None:
+            stop()
+
+    sustained, failed = find_knee(stages, args.slo_ms)
+    if sustained is None:
+        print(f"\nKnee: below {args.rates[0]:g} rps; the lowest rate already missed the targets")
+    elif failed is None:
+        print(f"\nKnee: not reached; sustained every rate up to {sustained['offered_rps']:g} rps")
+    else:
+        print(
+            f"\nKnee: sustained {sustained['offered_rps']:g} rps, "
+            f"saturated at {failed['offered_rps']:g} rps"
+        )
+
+    report = sustained or (stages[0] if stages else None)
+    if report is not None:
+        print(f"\nBy request kind at {report['offered_rps']:g} rps")
+        print(f"{'kind':<18}{'requests':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+        for kind, stats in report['by_kind'].items():
+            p50 = f"{stats['p50_ms']:>9.0f}" if stats['p50_ms'] is not None else f"{'-':>9}"
+            p95 = f"{stats['p95_ms']:>9.0f}" if stats['p95_ms'] is not None else f"{'-':>9}"
+            print(f"{kind:<18}{stats['requests']:>9}{p50}{p95}{stats['errors']:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'target': url,
+                'server': None if args.url else args.server,
+                'mix': mix,
+                'slo_ms': args.slo_ms,
+                'knee_rps': sustained['offered_rps'] if sustained else None,
+                'stages': stages
+            }, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Upload protocol benchmark
+
+Sends the same photo to /api/ml/analyze as multipart form data, as base64
+in a JSON body and as a raw application/octet-stream body, and reports
+the bytes on the wire and the server CPU time per request.
+
+Bodies are encoded once up front, so the timings cover request parsing,
+base64 decoding and header validation on the server. The photo is
+analyzed once before timing; after that every request is answered from
+the result cache, so the model does not dominate the numbers.
+
+Usage:
+    cd ml-service
+    python benchmarks/upload_protocols.py --megapixels 12 --iterations 50
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from werkzeug.datastructures import FileStorage, MultiDict
+from werkzeug.test import encode_multipart
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from decode_pipeline import make_jpeg
+from src.app import app, _ready
+
+METRICS = {'weight': '80', 'height': '180', 'age': '30'}
+
+
+def build_requests(photo):
+    """
+    Encode the photo once per protocol.
+
+    Returns:
+        dict: protocol -> (url, Content-Type, body bytes)
+    """
+    form = MultiDict(METRICS)
+    form.add('photo', FileStorage(io.BytesIO(photo), filename='photo.jpg'))
+    boundary, multipart_body = encode_multipart(form)
+
+    json_body = json.dumps(dict(METRICS, image=base64.b64encode(photo).decode())).encode()
+
+    query = '&'.join(f'{name}={value}' for name, value in METRICS.items())
+
+    return {
+        'multipart': (
+            '/api/ml/analyze',
+            f'multipart/form-data; boundary={boundary}',
+            multipart_body
+        ),
+        'base64 json': ('/api/ml/analyze', 'application/json', json_body),
+        'raw body': (f'/api/ml/analyze?{query}', 'application/octet-stream', photo)
+    }
+
+
+def run_protocol(client, url, content_type, body, iterations):
+    """
+    Time requests of one protocol.
+
+    Returns:
+        tuple: (median CPU ms, median wall ms) per request
+    """
+    cpu = []
+    wall = []
+    for _ in range(iterations):
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        response = client.post(url, data=body, content_type=content_type)
+        wall.append((time.perf_counter() - wall_start) * 1000)
+        cpu.append((time.process_time() - cpu_start) * 1000)
+        assert response.status_code == 200, response.get_json()
+
+    return np.median(cpu), np.median(wall)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    if not _ready.wait(300):
+        sys.exit("Model did not become ready")
+
+    photo = make_jpeg(args.megapixels)
+    requests = build_requests(photo)
+
+    with app.test_client() as client:
+        # Fill the result cache so timed requests skip the model
+        url, content_type, body = requests['raw body']
+        client.post(url, data=body, content_type=content_type)
+
+        print(f"\n{args.megapixels:g}MP JPEG, {len(photo) / 1024:.0f} KB, {args.iterations} iterations")
+        print(f"{'protocol':<14}{'body KB':>10}{'vs file':>10}{'cpu ms':>10}{'wall ms':>10}")
+
+        for name, (url, content_type, body) in requests.items():
+            cpu_ms, wall_ms = run_protocol(client, url, content_type, body, args.iterations)
+            print(
+                f"{name:<14}{len(body) / 1024:>10.0f}{len(body) / len(photo):>9.2f}x"
+                f"{cpu_ms:>10.2f}{wall_ms:>10.2f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Gunicorn settings for the ML service
+
+With ML_MODEL_SERVER=true (the Docker image's default) the master starts
+one model server process (src.modelServer) before forking its workers and
+points them at it with ML_ENGINE=remote, so the container holds a single
+model and a single TensorFlow runtime however many workers it runs. A
+thread in the master restarts the server when it exits; if it keeps
+exiting (ML_MODEL_SERVER_MAX_RESTARTS times in a row, each within a
+minute of starting), gunicorn shuts down instead, so the container's
+restart policy takes over. Workers report not ready on /ready while the
+server is down. The server is stopped with the master.
+
+The master also gives the workers and the model server a shared metrics
+directory (ML_METRICS_DIR, a fresh temporary directory unless set), so
+/metrics on any worker reports the whole container (see src.metrics).
+Likewise, unless ML_STORE_PATH is set (empty disables it), the workers
+share a raw-output store in a temporary directory, so an image_id from
+one worker's analysis is found by the others (rescore, timeline).
+
+Command-line flags (bind, workers, threads, timeout) still apply; gunicorn
+reads this file from the working directory by default.
+"""
+
+import glob
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+MODEL_SERVER = os.environ.get('ML_MODEL_SERVER', 'false').lower() == 'true'
+MODEL_SOCKET = os.environ.get('ML_MODEL_SOCKET', '/tmp/ml-model.sock')
+MODEL_SERVER_MAX_RESTARTS = int(os.environ.get('ML_MODEL_SERVER_MAX_RESTARTS', '5'))
+MODEL_SERVER_COMMAND = [sys.executable, '-m', 'src.modelServer', '--socket', MODEL_SOCKET]
+# An exit within this many seconds of starting counts towards the limit
+MODEL_SERVER_MIN_UPTIME = 60.0
+# Wait before restart n is n times this, up to 30 s
+RESTART_BACKOFF_SECONDS = 1.0
+
+_model_server = None
+_model_server_lock = threading.Lock()
+_stopping = threading.Event()
+_metrics_dir = None
+_store_dir = None
+
+
+def _prepare_metrics_dir():
+    """Share a metrics directory with the processes started from here."""
+    global _metrics_dir
+    directory = os.environ.get('ML_METRICS_DIR')
+    if directory:
+        # Values of an earlier run would be added to this one's
+        for pattern in ('metrics-*.json*', 'aggregate.json*'):
+            for path in glob.glob(os.path.join(directory, pattern)):
+                os.unlink(path)
+    else:
+        directory = _metrics_dir = tempfile.mkdtemp(prefix='ml-metrics-')
+        os.environ['ML_METRICS_DIR'] = directory
+
+
+def _prepare_store_path():
+    """Share a raw-output store between the workers when none is configured."""
+    global _store_dir
+    if 'ML_STORE_PATH' not in os.environ:
+        _store_dir = tempfile.mkdtemp(prefix='ml-store-')
+        os.environ['ML_STORE_PATH'] = os.path.join(_store_dir, 'analyses.db')
+
+
+def _start_model_server(env):
+    """Launch the model server process."""
+    global _model_server
+    # Its own session: a Ctrl-C meant for gunicorn must not stop it before on_exit does
+    _model_server = subprocess.Popen(
+        MODEL_SERVER_COMMAND,
+        env=env,
+        start_new_session=True
+    )
+    return _model_server
+
+
+def _halt_master():
+    """Ask the master for a graceful shutdown, as a SIGTERM from outside would."""
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def _supervise_model_server(server, env):
+    """Restart the model server whenever it exits, until on_exit (thread target)."""
+    failures = 0
+    while True:
+        process = _model_server
+        started = time.monotonic()
+        status = process.wait()
+        if _stopping.is_set():
+            return
+
+        failures = failures + 1 if time.monotonic() - started < MODEL_SERVER_MIN_UPTIME else 1
+        if failures > MODEL_SERVER_MAX_RESTARTS:
+            server.log.error(
+                "Model server exited with status %s %d times in a row; shutting down",
+                status, failures
+            )
+            _halt_master()
+            return
+
+        server.log.error("Model server exited with status %s; restarting", status)
+        if _stopping.wait(min(RESTART_BACKOFF_SECONDS * failures, 30.0)):
+            return
+        with _model_server_lock:
+            if _stopping.is_set():
+                return
+            process = _start_model_server(env)
+        server.log.info("Restarted model server (pid %s)", process.pid)
+
+
+def on_starting(server):
+    """Start the model server and switch workers to the remote engine."""
+    _prepare_metrics_dir()
+    _prepare_store_path()
+    if not MODEL_SERVER:
+        return
+
+    # The server needs the local engine settings, also when restarted
+    env = dict(os.environ)
+    process = _start_model_server(env)
+    server.log.info("Started model server (pid %s) on %s", process.pid, MODEL_SOCKET)
+    threading.Thread(
+        target=_supervise_model_server,
+        args=(server, env),
+        name='model-server-supervisor',
+        daemon=True
+    ).start()
+
+    # Inherited by the workers forked after this hook
+    os.environ['ML_ENGINE'] = 'remote'
+    os.environ['ML_ENGINE_PATH'] = MODEL_SOCKET
+
+
+def on_exit(server):
+    """Stop the model server with the master."""
+    with _model_server_lock:
+        _stopping.set()
+        process = _model_server
+
+    if process is not None:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    for directory in (_metrics_dir, _store_dir):
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
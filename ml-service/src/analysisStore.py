@@ -0,0 +1,386 @@
+"""
+Persistent store for raw model outputs and pose quality
+
+A SQLite file keyed by the same content hash as the in-memory result
+cache (see src.resultCache). Entries hold the raw (body_fat, muscle,
+posture) head outputs, so a photo analyzed once is never run through the
+model again, across requests and restarts. The progress timeline relies
+on it: a user's earlier photos are looked up here and only a new photo
+costs a forward pass.
+
+Raw outputs are also keyed by model version, so a redeploy with new
+weights or another engine never serves outputs of the previous model;
+the old rows age out through eviction. Pose-quality metrics depend only
+on the pixels they were computed from, so they are kept per image,
+analysis resolution and decode mode.
+
+The database runs in WAL mode, so the gunicorn workers of a container
+(each with its own connections) read while another one writes, and
+writers wait on each other up to the busy timeout instead of failing.
+Lookups are plain reads: refreshing an entry's last_used_at is deferred
+and written in batches, so a read never waits for the write lock.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Bumped when the tables change; older files are dropped and recreated,
+# which only costs the forward passes to refill them
+SCHEMA_VERSION = 3
+
+# A lookup refreshes an entry's last_used_at only when it is older than
+# this, and refreshes are written with the next write, or in one batch
+# once this many are pending
+TOUCH_INTERVAL = 60.0
+TOUCH_BATCH = 256
+
+# Writes check the table size once per this share of max_entries rows
+EVICT_CHECK_FRACTION = 0.05
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS raw_outputs (
+    image_id TEXT NOT NULL,
+    model_version TEXT NOT NULL,
+    body_fat REAL NOT NULL,
+    muscle REAL NOT NULL,
+    posture REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    PRIMARY KEY (image_id, model_version)
+);
+CREATE INDEX IF NOT EXISTS raw_outputs_last_used ON raw_outputs (last_used_at);
+CREATE TABLE IF NOT EXISTS pose_quality (
+    image_id TEXT NOT NULL,
+    max_side INTEGER NOT NULL,
+    decode TEXT NOT NULL,
+    metrics TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    PRIMARY KEY (image_id, max_side, decode)
+);
+CREATE INDEX IF NOT EXISTS pose_quality_last_used ON pose_quality (last_used_at);
+"""
+
+
+class AnalysisStore:
+    """
+    Thread- and process-safe SQLite store of analyses by image content key.
+
+    Each thread gets its own connection. Outputs come back as float32, the
+    precision the model produced them in, so scores computed from stored
+    outputs match those computed right after inference. Lookups refresh
+    an entry's last_used_at (at most once per touch_interval, written
+    later in batches), and writes evict the least recently used entries
+    beyond max_entries. The size is checked once per few percent of
+    max_entries rows written, so a table can briefly exceed it by that
+    much per process.
+    """
+
+    def __init__(self, path, model_version='', max_entries=None, timeout=30.0,
+                 touch_interval=TOUCH_INTERVAL):
+        """
+        Open (and if needed create) the store.
+
+        Args:
+            path (str): SQLite database file, or ':memory:' for tests
+            model_version (str): Version raw outputs are read and written
+                under (see inferenceEngines.model_version)
+            max_entries (int, optional): Maximum rows per table; None for
+                no bound
+            timeout (float): Seconds to wait for a lock held by another
+                connection
+            touch_interval (float): Seconds within which repeated lookups
+                of an entry do not refresh its last_used_at again
+        """
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+
+        self.path = path
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shared = None
+
+        # Deferred last_used_at refreshes: table -> {primary key: time}
+        self._touches = {'raw_outputs': {}, 'pose_quality': {}}
+        self._pending_lock = threading.Lock()
+        # Rows written per table since its size was last checked
+        self._evict_every = max(1, int((max_entries or 0) * EVICT_CHECK_FRACTION))
+        self._written = {'raw_outputs': 0, 'pose_quality': 0}
+
+        # An in-memory database exists per connection, so share one
+        if path == ':memory:':
+            self._shared = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(path, timeout=timeout)
+            # Persistent in the file; readers no longer block on writers
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.close()
+
+        self._migrate()
+
+    def _migrate(self):
+        """Create the tables, replacing those of older schema versions."""
+        if self._shared is not None:
+            conn = self._shared
+        else:
+            conn = self._local.conn = self._connect()
+        with self._lock:
+            # Take the write lock first so concurrently starting workers migrate once
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+                    conn.execute('DROP TABLE IF EXISTS raw_outputs')
+                    conn.execute('DROP TABLE IF EXISTS pose_quality')
+                    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+                for statement in SCHEMA.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def _connect(self):
+        """Open a connection to the database file."""
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        # Safe with WAL: a crash may lose the last commits, never corrupt the file
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _connection(self):
+        """The calling thread's connection."""
+        if self._shared is not None:
+            return _Locked(self._shared, self._lock)
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def get(self, key):
+        """
+        Look up the raw outputs for an image under this model version.
+
+        Args:
+            key (str): Content key from content_key()
+
+        Returns:
+            tuple: (body_fat, muscle, posture) raw outputs, or None
+        """
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT body_fat, muscle, posture, last_used_at FROM raw_outputs '
+                'WHERE image_id = ? AND model_version = ?',
+                (key, self.model_version)
+            ).fetchone()
+        if row is None:
+            return None
+        self._touch('raw_outputs', (key, self.model_version), row[3])
+        return tuple(np.float32(value) for value in row[:3])
+
+    def put_many(self, items):
+        """
+        Store raw outputs for several images in one transaction.
+
+        Args:
+            items (list): (content key, (body_fat, muscle, posture)) pairs
+        """
+        now = time.time()
+        rows = [
+            (key, self.model_version, *(float(value) for value in outputs), now, now)
+            for key, outputs in items
+        ]
+        if not rows:
+            return
+        with self._connection() as conn:
+            self._write_touches(conn)
+            # An upsert keeps created_at, and a newer last_used_at written meanwhile
+            conn.executemany(
+                'INSERT INTO raw_outputs VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (image_id, model_version) DO UPDATE SET '
+                'body_fat = excluded.body_fat, muscle = excluded.muscle, posture = excluded.posture, '
+                'last_used_at = max(last_used_at, excluded.last_used_at)',
+                rows
+            )
+            self._evict(conn, 'raw_outputs', len(rows))
+
+    def put(self, key, outputs):
+        """
+        Store the raw outputs for an image.
+
+        Args:
+            key (str): Content key from content_key()
+            outputs (tuple): (body_fat, muscle, posture) raw outputs
+        """
+        self.put_many([(key, outputs)])
+
+    def get_quality(self, key, max_side=None, decode=''):
+        """
+        Look up pose-quality metrics for an image.
+
+        Args:
+            key (str): Content key from content_key()
+            max_side (int, optional): Resolution the metrics were computed at
+            decode (str): How the image was decoded, e.g. 'full' or a JPEG
+                draft size
+
+        Returns:
+            dict: Metrics from detect_pose_quality(), or None
+        """
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT metrics, last_used_at FROM pose_quality '
+                'WHERE image_id = ? AND max_side = ? AND decode = ?',
+                (key, max_side or 0, decode)
+            ).fetchone()
+        if row is None:
+            return None
+        self._touch('pose_quality', (key, max_side or 0, decode), row[1])
+        return json.loads(row[0])
+
+    def put_quality(self, key, metrics, max_side=None, decode=''):
+        """
+        Store pose-quality metrics for an image.
+
+        Args:
+            key (str): Content key from content_key()
+            metrics (dict): Metrics from detect_pose_quality()
+            max_side (int, optional): Resolution the metrics were computed at
+            decode (str): How the image was decoded (see get_quality)
+        """
+        now = time.time()
+        with self._connection() as conn:
+            self._write_touches(conn)
+            conn.execute(
+                'INSERT INTO pose_quality VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (image_id, max_side, decode) DO UPDATE SET '
+                'metrics = excluded.metrics, last_used_at = max(last_used_at, excluded.last_used_at)',
+                (key, max_side or 0, decode, json.dumps(metrics), now, now)
+            )
+            self._evict(conn, 'pose_quality', 1)
+
+    def flush(self):
+        """Write pending last_used_at refreshes now."""
+        with self._connection() as conn:
+            self._write_touches(conn)
+
+    def _touch(self, table, primary_key, last_used_at):
+        """Queue a last_used_at refresh for a row that was just read."""
+        now = time.time()
+        if now - last_used_at < self.touch_interval:
+            return
+        with self._pending_lock:
+            self._touches[table][primary_key] = now
+            due = sum(len(pending) for pending in self._touches.values()) >= TOUCH_BATCH
+        if due:
+            self.flush()
+
+    def _write_touches(self, conn):
+        """Write the queued refreshes in the transaction of conn."""
+        with self._pending_lock:
+            raw, quality = self._touches['raw_outputs'], self._touches['pose_quality']
+            self._touches = {'raw_outputs': {}, 'pose_quality': {}}
+        if raw:
+            conn.executemany(
+                'UPDATE raw_outputs SET last_used_at = max(last_used_at, ?) '
+                'WHERE image_id = ? AND model_version = ?',
+                [(used, *primary_key) for primary_key, used in raw.items()]
+            )
+        if quality:
+            conn.executemany(
+                'UPDATE pose_quality SET last_used_at = max(last_used_at, ?) '
+                'WHERE image_id = ? AND max_side = ? AND decode = ?',
+                [(used, *primary_key) for primary_key, used in quality.items()]
+            )
+
+    def recent(self, limit):
+        """
+        Most recently used raw outputs under this model version.
+
+        Used to preload the in-memory cache at start-up.
+
+        Args:
+            limit (int): Maximum number of entries
+
+        Returns:
+            list: (content key, (body_fat, muscle, posture)) pairs, most
+                recently used first
+        """
+        with self._connection() as conn:
+            rows = conn.execute(
+                'SELECT image_id, body_fat, muscle, posture FROM raw_outputs '
+                'WHERE model_version = ? ORDER BY last_used_at DESC LIMIT ?',
+                (self.model_version, limit)
+            ).fetchall()
+        return [(row[0], tuple(np.float32(value) for value in row[1:])) for row in rows]
+
+    def _evict(self, conn, table, written):
+        """
+        Drop the least recently used rows of a table beyond max_entries.
+
+        Counting is linear in the table size, so it only happens once
+        enough rows were written since the last check.
+        """
+        if self.max_entries is None:
+            return
+        with self._pending_lock:
+            self._written[table] += written
+            if self._written[table] < self._evict_every:
+                return
+            self._written[table] = 0
+
+        excess = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                f'DELETE FROM {table} WHERE rowid IN '
+                f'(SELECT rowid FROM {table} ORDER BY last_used_at LIMIT ?)',
+                (excess,)
+            )
+
+    def stats(self):
+        """
+        Report the store's size.
+
+        Returns:
+            dict: path, size (raw output entries, all model versions),
+                quality_size, max_entries and model_version
+        """
+        with self._connection() as conn:
+            quality_size = conn.execute('SELECT COUNT(*) FROM pose_quality').fetchone()[0]
+        return {
+            'path': self.path,
+            'size': len(self),
+            'quality_size': quality_size,
+            'max_entries': self.max_entries,
+            'model_version': self.model_version
+        }
+
+    def __len__(self):
+        with self._connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM raw_outputs').fetchone()[0]
+
+
+class _Locked:
+    """Transaction context on a connection shared between threads."""
+
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        return self.conn.__enter__()
+
+    def __exit__(self, *exc_info):
+        try:
+            return self.conn.__exit__(*exc_info)
+        finally:
+            self.lock.release()
@@ -2,35 +2,257 @@
 Flask REST API for Progress Photo Analysis ML Service
 
 Provides endpoints for:
-- Health checks
+- Liveness and readiness checks
 - Single photo analysis
+- Re-scoring a cached photo with new body metrics
 - Photo comparison
-- Batch processing
+- Batch processing, including NDJSON streaming for large batches
+- Progress timelines over a user's photo history
+- Prometheus metrics
+
+An async front-end serving the same routes lives in src.asgi.
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+import datetime
+import functools
+import json
+import math
 import os
+import threading
+import time
 import traceback
 from PIL import Image
 import io
 import base64
 
+# TensorFlow is imported here for local engines; time it as its own phase.
+# Workers using the shared model server (ML_ENGINE=remote) never load it.
+_import_started = time.perf_counter()
+if os.environ.get('ML_ENGINE', 'keras') != 'remote':
+    import tensorflow
 from src.photoAnalyzer import get_analyzer
+from src.progressTimeline import DEFAULT_SMOOTHING_DAYS
+from src.uploadStream import UploadBatcher, label_results
+from src.metrics import CONTENT_TYPE, record_request, record_startup, render, set_endpoint, timed
+from src.microBatcher import warmup_batch_sizes
+IMPORT_MS = round((time.perf_counter() - _import_started) * 1000, 1)
+
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that times response serialization as a metrics stage."""
+    
+    def dumps(self, obj, **kwargs):
+        with timed('serialize'):
+            return super().dumps(obj, **kwargs)
+
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app)  # Enable CORS for cross-origin requests from Node.js backend
 
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB max file size
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp', 'gif'}
 
-# Initialize ML model
-print("Initializing ML model...")
-analyzer = get_analyzer()
-print("ML model ready!")
+# Views whose whole body is read up front (timed as the upload_read stage)
+UPLOAD_VIEWS = {'analyze_photo', 'compare_photos', 'batch_analyze', 'progress_timeline'}
+
+# Micro-batching: concurrent request threads share forward passes
+MICRO_BATCHING = os.environ.get('ML_MICRO_BATCHING', 'true').lower() == 'true'
+MAX_BATCH_SIZE = int(os.environ.get('ML_MAX_BATCH_SIZE', '8'))
+MAX_BATCH_WAIT_MS = float(os.environ.get('ML_MAX_BATCH_WAIT_MS', '5'))
+MAX_BATCH_QUEUE = int(os.environ.get('ML_MAX_BATCH_QUEUE', '0'))
+
+# Decode/preprocess worker processes feeding the scheduler (0 = in-process)
+PREPROCESS_WORKERS = int(os.environ.get('ML_PREPROCESS_WORKERS', '0'))
+PREPROCESS_QUEUE = int(os.environ.get('ML_PREPROCESS_QUEUE', '16'))
+
+# Raw-output cache keyed by image content hash
+CACHE_ENABLED = os.environ.get('ML_CACHE_ENABLED', 'true').lower() == 'true'
+CACHE_MAX_ENTRIES = int(os.environ.get('ML_CACHE_MAX_ENTRIES', '4096'))
+CACHE_TTL_SECONDS = float(os.environ.get('ML_CACHE_TTL_SECONDS', '3600'))
+
+# Raw-output store shared by workers and surviving restarts (empty =
+# disabled; gunicorn.conf.py sets a temporary one when unset)
+STORE_PATH = os.environ.get('ML_STORE_PATH', '')
+STORE_MAX_ENTRIES = int(os.environ.get('ML_STORE_MAX_ENTRIES', '100000'))
+STORE_PRELOAD = os.environ.get('ML_STORE_PRELOAD', 'true').lower() == 'true'
+
+# Longest side pose quality is computed at (0 = full resolution)
+QUALITY_MAX_SIDE = int(os.environ.get('ML_QUALITY_MAX_SIDE', '1024'))
+
+# Streaming batch analysis (/api/ml/batch-analyze/stream)
+STREAM_MAX_PHOTOS = int(os.environ.get('ML_STREAM_MAX_PHOTOS', '1000'))
+STREAM_MAX_CONTENT_LENGTH = int(os.environ.get('ML_STREAM_MAX_MB', '2048')) * 1024 * 1024
+STREAM_BATCH_SIZE = MAX_BATCH_SIZE
+STREAM_READ_SIZE = 64 * 1024
+
+# Progress timeline (/api/ml/timeline)
+TIMELINE_MAX_PHOTOS = int(os.environ.get('ML_TIMELINE_MAX_PHOTOS', '200'))
+
+# Seconds a request waits for a model that is still warming up
+READY_TIMEOUT_SECONDS = float(os.environ.get('ML_READY_TIMEOUT_SECONDS', '30'))
+# Wait before the first start-up retry; doubles per failure up to the maximum
+STARTUP_RETRY_SECONDS = float(os.environ.get('ML_STARTUP_RETRY_SECONDS', '5'))
+STARTUP_RETRY_MAX_SECONDS = 60.0
+
+
+# Model state; filled in by the start-up thread so the port opens at once
+# and liveness checks pass while the model loads and warms up
+analyzer = None
+startup = {
+    'ready': False,
+    'error': None,
+    'timings': {'import_ms': IMPORT_MS}
+}
+_ready = threading.Event()
+
+
+def _start_model():
+    """
+    Start the model, retrying in the background until it is ready.
+    
+    A failed attempt is reported on /health and /ready, and requests get
+    503 instead of waiting, until a later attempt succeeds. Retries back
+    off from STARTUP_RETRY_SECONDS up to STARTUP_RETRY_MAX_SECONDS.
+    """
+    delay = STARTUP_RETRY_SECONDS
+    while not _try_start_model():
+        time.sleep(delay)
+        delay = min(delay * 2, STARTUP_RETRY_MAX_SECONDS)
+
+
+def _try_start_model():
+    """
+    Build, load and warm up the model, then mark the service ready.
+    
+    Returns:
+        bool: Whether the model is ready
+    """
+    global analyzer
+    
+    try:
+        print("Initializing ML model...")
+        instance = get_analyzer()
+        instance.quality_max_side = QUALITY_MAX_SIDE or None
+        # With the remote engine the model server batches across all workers
+        if MICRO_BATCHING and instance.engine.name != 'remote':
+            instance.enable_micro_batching(
+                max_batch_size=MAX_BATCH_SIZE,
+                max_wait_ms=MAX_BATCH_WAIT_MS,
+                max_queue=MAX_BATCH_QUEUE
+            )
+        if PREPROCESS_WORKERS > 0:
+            instance.enable_preprocess_pool(
+                workers=PREPROCESS_WORKERS,
+                queue_size=PREPROCESS_QUEUE
+            )
+        if CACHE_ENABLED:
+            instance.enable_cache(
+                max_entries=CACHE_MAX_ENTRIES,
+                ttl_seconds=CACHE_TTL_SECONDS
+            )
+        if STORE_PATH:
+            instance.enable_store(
+                STORE_PATH,
+                max_entries=STORE_MAX_ENTRIES or None,
+                preload=STORE_PRELOAD
+            )
+        
+        # Batch-analyze accepts up to 10 photos in one forward pass
+        instance.warmup(warmup_batch_sizes(max(MAX_BATCH_SIZE, 10)))
+        
+        startup['timings'].update(instance.startup_timings)
+        analyzer = instance
+        startup['error'] = None
+        startup['ready'] = True
+        print("ML model ready! Startup (ms): " + ', '.join(
+            f"{phase[:-3]}={value}" for phase, value in startup['timings'].items()
+        ))
+        return True
+    except Exception as e:
+        startup['error'] = str(e)
+        print(f"ML model failed to start, retrying: {str(e)}")
+        print(traceback.format_exc())
+        return False
+    finally:
+        _ready.set()
+
+
+threading.Thread(target=_start_model, name='ml-startup', daemon=True).start()
+
+
+def requires_model(view):
+    """
+    Wait for the model to be ready before handling a request.
+    
+    Requests arriving during warm-up wait up to READY_TIMEOUT_SECONDS and
+    then get 503, as do all requests while start-up is failing.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _ready.wait(READY_TIMEOUT_SECONDS) or analyzer is None:
+            return jsonify({
+                'success': False,
+                'error': 'Model not ready'
+            }), 503
+        return view(*args, **kwargs)
+    
+    return wrapper
+
+
+def parse_metrics(source, suffix='', defaults=None, strict=False):
+    """
+    Extract optional body metrics from form fields or a JSON body.
+    
+    Missing values are ignored. Malformed values are ignored too, unless
+    strict is set.
+    
+    Args:
+        source: request.form or a parsed JSON dict
+        suffix (str): Field name suffix, e.g. '1' to read 'weight1'
+        defaults (dict, optional): Metrics used for fields that are absent
+        strict (bool): Raise ValueError on malformed values instead of
+            ignoring them
+        
+    Returns:
+        dict: 'weight', 'height', 'age' and 'gender' keyword arguments
+        
+    Raises:
+        ValueError: With strict, for a non-numeric or non-positive weight,
+            height or age, or a gender other than 'male' or 'female'
+    """
+    metrics = dict(defaults or {'weight': None, 'height': None, 'age': None, 'gender': 'male'})
+    
+    for name, cast in (('weight', float), ('height', float), ('age', int)):
+        value = source.get(name + suffix)
+        if value is None or value == '':
+            continue
+        try:
+            if isinstance(value, bool):
+                raise TypeError(name)
+            parsed = cast(value)
+        except (ValueError, TypeError):
+            if strict:
+                raise ValueError(f"{name + suffix} must be a number")
+            continue
+        if strict and not (math.isfinite(parsed) and parsed > 0):
+            raise ValueError(f"{name + suffix} must be a positive number")
+        metrics[name] = parsed
+    
+    gender = source.get('gender' + suffix)
+    if gender:
+        if strict and (not isinstance(gender, str) or gender.lower() not in ('male', 'female')):
+            raise ValueError(f"gender{suffix} must be 'male' or 'female'")
+        metrics['gender'] = str(gender).lower()
+    
+    return metrics
 
 
 def allowed_file(filename):
@@ -47,23 +269,278 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-@app.route('/health', methods=['GET'])
-def health_check():
+def is_raw_upload(mimetype):
     """
-    Health check endpoint for Docker healthcheck.
+    Check if a request body is a bare image rather than a form or JSON.
     
+    Args:
+        mimetype (str): Request Content-Type without parameters
+        
     Returns:
-        JSON response with service status
+        bool: True for application/octet-stream and image/* bodies
     """
-    return jsonify({
+    return mimetype == 'application/octet-stream' or mimetype.startswith('image/')
+
+
+def check_image(image):
+    """
+    Validate the header of an encoded image.
+    
+    Only the header is parsed; pixels are decoded on a cache miss.
+    
+    Args:
+        image (bytes): Encoded image file
+        
+    Returns:
+        bytes: The same image
+        
+    Raises:
+        ValueError: If the body is empty
+        PIL.UnidentifiedImageError: If it is not a supported image
+    """
+    if not image:
+        raise ValueError('empty body')
+    Image.open(io.BytesIO(image)).close()
+    return image
+
+
+def split_photo_pair(body, photo1_size):
+    """
+    Split a raw compare body into its two photos.
+    
+    Args:
+        body (bytes): photo1 followed directly by photo2
+        photo1_size (str): Byte length of photo1 (query parameter)
+        
+    Returns:
+        tuple: (photo1 bytes, photo2 bytes)
+        
+    Raises:
+        ValueError: If photo1_size is missing or out of range
+    """
+    size = int(photo1_size or 0)
+    if not 0 < size < len(body):
+        raise ValueError(f'photo1_size must be between 1 and {len(body) - 1}')
+    return body[:size], body[size:]
+
+
+def parse_date(value):
+    """
+    Parse an ISO 8601 date ('2024-05-01') or date and time.
+    
+    Raises:
+        ValueError: If the value is not an ISO 8601 date
+    """
+    text = str(value)
+    if len(text) == 10:
+        return datetime.date.fromisoformat(text)
+    return datetime.datetime.fromisoformat(text)
+
+
+def parse_timeline(source, files):
+    """
+    Read a timeline request shared by the Flask and ASGI front-ends.
+    
+    Args:
+        source: Parsed JSON dict or form with 'photos' (a list, or a JSON
+            string in a form), shared body metrics and 'smoothing_days'
+        files (dict): Uploaded field name -> encoded image, for entries
+            that name a 'file'
+            
+    Returns:
+        tuple: (analyze_timeline() items, smoothing_days)
+        
+    Raises:
+        ValueError: With a message for the client
+    """
+    entries = source.get('photos')
+    if isinstance(entries, str):
+        try:
+            entries = json.loads(entries)
+        except ValueError:
+            raise ValueError("'photos' must be a JSON list")
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("'photos' must be a non-empty list")
+    if len(entries) > TIMELINE_MAX_PHOTOS:
+        raise ValueError(f'Maximum {TIMELINE_MAX_PHOTOS} photos per timeline')
+    
+    try:
+        smoothing_days = float(source.get('smoothing_days') or DEFAULT_SMOOTHING_DAYS)
+    except (TypeError, ValueError):
+        smoothing_days = 0
+    if not smoothing_days > 0:
+        raise ValueError("'smoothing_days' must be a positive number")
+    
+    shared_metrics = parse_metrics(source)
+    items = []
+    
+    for idx, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f'photos[{idx}] must be an object')
+        
+        try:
+            item = {'date': parse_date(entry.get('date'))}
+        except ValueError:
+            raise ValueError(f"photos[{idx}]: 'date' must be an ISO 8601 date")
+        item['metrics'] = parse_metrics(entry, defaults=shared_metrics)
+        
+        if entry.get('image_id'):
+            item['image_id'] = str(entry['image_id'])
+        elif entry.get('file'):
+            if entry['file'] not in files:
+                raise ValueError(f"photos[{idx}]: no uploaded file '{entry['file']}'")
+            item['image'] = files[entry['file']]
+        elif entry.get('image'):
+            try:
+                item['image'] = check_image(base64.b64decode(entry['image']))
+            except Exception as e:
+                raise ValueError(f'photos[{idx}]: invalid base64 image data: {str(e)}')
+        else:
+            raise ValueError(f"photos[{idx}]: 'image_id', 'image' or 'file' required")
+        
+        items.append(item)
+    
+    return items, smoothing_days
+
+
+def metrics_text():
+    """
+    Prometheus exposition text shared by the Flask and ASGI front-ends.
+    
+    Returns:
+        str: All metrics, including start-up phase timings and readiness
+    """
+    record_startup(startup['timings'], startup['ready'])
+    return render()
+
+
+def health_status():
+    """
+    Liveness payload shared by the Flask and ASGI front-ends.
+    
+    Returns:
+        tuple: (response dict, HTTP status)
+    """
+    if startup['error']:
+        return {
+            'status': 'unhealthy',
+            'service': 'ml-service',
+            'model_loaded': False,
+            'error': startup['error'],
+            'version': '1.0.0'
+        }, 503
+    
+    return {
         'status': 'healthy',
         'service': 'ml-service',
         'model_loaded': analyzer is not None,
+        'ready': startup['ready'],
+        'cache': analyzer.cache.stats() if analyzer is not None and analyzer.cache is not None else None,
+        'store': analyzer.store.stats() if analyzer is not None and analyzer.store is not None else None,
+        'preprocess_pool': (
+            analyzer.preprocess_pool.stats()
+            if analyzer is not None and analyzer.preprocess_pool is not None else None
+        ),
         'version': '1.0.0'
-    }), 200
+    }, 200
+
+
+def readiness_status():
+    """
+    Readiness payload shared by the Flask and ASGI front-ends.
+    
+    With the remote engine, the service is only ready while the shared
+    model server answers.
+    
+    Returns:
+        tuple: (response dict, HTTP status)
+    """
+    ready = startup['ready']
+    error = startup['error']
+    
+    ping = getattr(analyzer.engine, 'ping', None) if ready else None
+    if ping is not None:
+        if ping():
+            # A restarted server may serve other weights
+            analyzer.sync_model_version()
+        else:
+            ready = False
+            error = f"Model server at {analyzer.engine.socket_path} is not answering"
+    
+    return {
+        'ready': ready,
+        'startup_ms': startup['timings'],
+        'error': error
+    }, 200 if ready else 503
+
+
+@app.before_request
+def start_request_metrics():
+    """Label the request's metrics with its route and time the upload read."""
+    g.request_started = time.perf_counter()
+    set_endpoint(request.url_rule.rule if request.url_rule else 'unmatched')
+    
+    if request.endpoint in UPLOAD_VIEWS:
+        with timed('upload_read'):
+            request.get_data(parse_form_data=True)
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and record its latency up to the response headers."""
+    started = g.get('request_started')
+    if started is not None:
+        record_request(
+            request.url_rule.rule if request.url_rule else 'unmatched',
+            request.method,
+            response.status_code,
+            time.perf_counter() - started
+        )
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Metrics in the Prometheus text format.
+    
+    Returns:
+        Per-endpoint request, error, batch size and cache counters,
+        per-stage latency histograms and start-up phase timings
+    """
+    return Response(metrics_text(), content_type=CONTENT_TYPE)
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """
+    Liveness check: the process is up and start-up has not failed.
+    
+    Stays 200 while the model is still warming up; use /ready to decide
+    whether to route traffic.
+    
+    Returns:
+        JSON response with service status
+    """
+    payload, status = health_status()
+    return jsonify(payload), status
+
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness check: the model is loaded and warmed up.
+    
+    Returns:
+        JSON with 'ready' and start-up timings per phase in milliseconds;
+        503 until warm-up has finished
+    """
+    payload, status = readiness_status()
+    return jsonify(payload), status
 
 
 @app.route('/api/ml/analyze', methods=['POST'])
+@requires_model
 def analyze_photo():
     """
     Analyze a single progress photo.
@@ -72,6 +549,9 @@ def analyze_photo():
         - Multipart form data with 'photo' file
         OR
         - JSON with base64 encoded image
+        OR
+        - Raw image body (application/octet-stream or image/*) with body
+          metrics as query parameters
         
     Returns:
         JSON with analysis results:
@@ -88,9 +568,22 @@ def analyze_photo():
     """
     try:
         image = None
+        source = request.form
+        
+        # Handle a raw image body: no form parsing, no base64 inflation
+        if is_raw_upload(request.mimetype):
+            try:
+                image = check_image(request.get_data(cache=False))
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': f'Invalid image data: {str(e)}'
+                }), 400
+            
+            source = request.args
         
         # Handle file upload
-        if 'photo' in request.files:
+        elif 'photo' in request.files:
             file = request.files['photo']
             
             if file.filename == '':
@@ -105,12 +598,13 @@ def analyze_photo():
                     'error': 'Invalid file type. Allowed: png, jpg, jpeg, webp, gif'
                 }), 400
             
-            # Read image from upload
-            image = Image.open(file.stream)
+            # Read encoded bytes; the analyzer only decodes on a cache miss
+            image = file.read()
         
         # Handle base64 encoded image
         elif request.is_json:
             data = request.get_json()
+            source = data
             
             if 'image' not in data:
                 return jsonify({
@@ -120,8 +614,7 @@ def analyze_photo():
             
             # Decode base64 image
             try:
-                image_data = base64.b64decode(data['image'])
-                image = Image.open(io.BytesIO(image_data))
+                image = check_image(base64.b64decode(data['image']))
             except Exception as e:
                 return jsonify({
                     'success': False,
@@ -133,53 +626,20 @@ def analyze_photo():
                 'error': 'No image data provided'
             }), 400
         
-        # Extract optional body metrics from form data or JSON
-        weight = None
-        height = None
-        age = None
-        gender = 'male'
-        
-        if 'weight' in request.form:
-            try:
-                weight = float(request.form['weight'])
-            except (ValueError, TypeError):
-                pass
-        
-        if 'height' in request.form:
-            try:
-                height = float(request.form['height'])
-            except (ValueError, TypeError):
-                pass
-        
-        if 'age' in request.form:
-            try:
-                age = int(request.form['age'])
-            except (ValueError, TypeError):
-                pass
-        
-        if 'gender' in request.form:
-            gender = request.form['gender'].lower()
+        # Extract optional body metrics from form data, JSON or the query
+        metrics = parse_metrics(source)
         
-        # If JSON request, check for metrics in JSON body
-        if request.is_json:
-            data = request.get_json()
-            weight = data.get('weight')
-            height = data.get('height')
-            age = data.get('age')
-            gender = data.get('gender', 'male').lower()
+        # One lazily decoded image shared by the model and pose quality; the
+        # model input never depends on include_quality
+        include_quality = request.args.get('include_quality') == 'true'
+        decoded = analyzer.decode(image)
         
         # Perform analysis with optional body metrics
-        analysis = analyzer.analyze_photo(
-            image, 
-            weight=weight, 
-            height=height, 
-            age=age, 
-            gender=gender
-        )
+        analysis = analyzer.analyze_photo(decoded, **metrics)
         
         # Optional: Add pose quality analysis
-        if request.args.get('include_quality') == 'true':
-            quality = analyzer.detect_pose_quality(image)
+        if include_quality:
+            quality = analyzer.detect_pose_quality(decoded)
             analysis['pose_quality'] = quality
         
         return jsonify({
@@ -197,7 +657,74 @@ def analyze_photo():
         }), 500
 
 
+@app.route('/api/ml/rescore', methods=['POST'])
+@requires_model
+def rescore_photo():
+    """
+    Re-score a previously analyzed photo with new body metrics.
+    
+    Uses the cached visual outputs of the photo, so no image is sent and
+    the model does not run again.
+    
+    Expects:
+        - JSON with 'image_id' (from an earlier analysis) and optional
+          'weight', 'height', 'age', 'gender'
+        
+    Returns:
+        JSON with analysis results (same schema as /api/ml/analyze)
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({
+                'success': False,
+                'error': 'Expected a JSON object'
+            }), 400
+        
+        if not data.get('image_id'):
+            return jsonify({
+                'success': False,
+                'error': 'image_id required'
+            }), 400
+        if not isinstance(data['image_id'], str):
+            return jsonify({
+                'success': False,
+                'error': 'image_id must be a string'
+            }), 400
+        
+        try:
+            metrics = parse_metrics(data, strict=True)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        try:
+            analysis = analyzer.rescore(data['image_id'], **metrics)
+        except KeyError:
+            return jsonify({
+                'success': False,
+                'error': 'Unknown or expired image_id; analyze the photo again'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'analysis': analysis
+        }), 200
+        
+    except Exception as e:
+        print(f"Error re-scoring photo: {str(e)}")
+        print(traceback.format_exc())
+        
+        return jsonify({
+            'success': False,
+            'error': f'Re-scoring failed: {str(e)}'
+        }), 500
+
+
 @app.route('/api/ml/compare', methods=['POST'])
+@requires_model
 def compare_photos():
     """
     Compare two progress photos to show improvement.
@@ -206,6 +733,13 @@ def compare_photos():
         - Multipart form data with 'photo1' and 'photo2' files
         OR
         - JSON with base64 encoded images
+        OR
+        - Raw body (application/octet-stream) holding photo1 then photo2,
+          with the 'photo1_size' query parameter giving photo1's length
+          and body metrics as query parameters
+        Optional body metrics: 'weight1', 'height1', 'age1', 'gender1' for the
+        first photo, the same with suffix 2 for the second, or unsuffixed
+        fields applied to both.
         
     Returns:
         JSON with comparison results including deltas
@@ -213,9 +747,27 @@ def compare_photos():
     try:
         photo1 = None
         photo2 = None
+        source = request.form
+        
+        # Handle a raw body holding both photos back to back
+        if is_raw_upload(request.mimetype):
+            try:
+                photo1, photo2 = split_photo_pair(
+                    request.get_data(cache=False),
+                    request.args.get('photo1_size')
+                )
+                check_image(photo1)
+                check_image(photo2)
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': f'Invalid image data: {str(e)}'
+                }), 400
+            
+            source = request.args
         
         # Handle file uploads
-        if 'photo1' in request.files and 'photo2' in request.files:
+        elif 'photo1' in request.files and 'photo2' in request.files:
             file1 = request.files['photo1']
             file2 = request.files['photo2']
             
@@ -225,12 +777,13 @@ def compare_photos():
                     'error': 'Invalid file types'
                 }), 400
             
-            photo1 = Image.open(file1.stream)
-            photo2 = Image.open(file2.stream)
+            photo1 = file1.read()
+            photo2 = file2.read()
         
         # Handle JSON with base64
         elif request.is_json:
             data = request.get_json()
+            source = data
             
             if 'photo1' not in data or 'photo2' not in data:
                 return jsonify({
@@ -239,10 +792,8 @@ def compare_photos():
                 }), 400
             
             try:
-                image1_data = base64.b64decode(data['photo1'])
-                image2_data = base64.b64decode(data['photo2'])
-                photo1 = Image.open(io.BytesIO(image1_data))
-                photo2 = Image.open(io.BytesIO(image2_data))
+                photo1 = check_image(base64.b64decode(data['photo1']))
+                photo2 = check_image(base64.b64decode(data['photo2']))
             except Exception as e:
                 return jsonify({
                     'success': False,
@@ -254,8 +805,19 @@ def compare_photos():
                 'error': 'No photos provided'
             }), 400
         
-        # Perform comparison
-        comparison = analyzer.compare_photos(photo1, photo2)
+        # Body metrics per photo: 'weight1'/'weight2' etc., falling back
+        # to unsuffixed fields shared by both photos
+        shared_metrics = parse_metrics(source)
+        before_metrics = parse_metrics(source, suffix='1', defaults=shared_metrics)
+        after_metrics = parse_metrics(source, suffix='2', defaults=shared_metrics)
+        
+        # Perform comparison (both photos in one forward pass)
+        comparison = analyzer.compare_photos(
+            photo1,
+            photo2,
+            before_metrics=before_metrics,
+            after_metrics=after_metrics
+        )
         
         return jsonify({
             'success': True,
@@ -273,6 +835,7 @@ def compare_photos():
 
 
 @app.route('/api/ml/batch-analyze', methods=['POST'])
+@requires_model
 def batch_analyze():
     """
     Analyze multiple photos at once.
@@ -298,35 +861,29 @@ def batch_analyze():
                 'error': 'Maximum 10 photos per batch'
             }), 400
         
-        results = []
+        results = [None] * len(files)
+        images = []
+        image_indices = []
         
         for idx, file in enumerate(files):
             if not allowed_file(file.filename):
-                results.append({
+                results[idx] = {
                     'index': idx,
                     'filename': file.filename,
                     'success': False,
                     'error': 'Invalid file type'
-                })
+                }
                 continue
             
-            try:
-                image = Image.open(file.stream)
-                analysis = analyzer.analyze_photo(image)
-                
-                results.append({
-                    'index': idx,
-                    'filename': file.filename,
-                    'success': True,
-                    'analysis': analysis
-                })
-            except Exception as e:
-                results.append({
-                    'index': idx,
-                    'filename': file.filename,
-                    'success': False,
-                    'error': str(e)
-                })
+            # Undecodable files fail their own entry inside analyze_photos
+            images.append(file.read())
+            image_indices.append(idx)
+        
+        # Analyze all valid photos in a single forward pass
+        for idx, item in zip(image_indices, analyzer.analyze_photos(images)):
+            item['index'] = idx
+            item['filename'] = files[idx].filename
+            results[idx] = item
         
         return jsonify({
             'success': True,
@@ -344,6 +901,159 @@ def batch_analyze():
         }), 500
 
 
+@app.route('/api/ml/timeline', methods=['POST'])
+@requires_model
+def progress_timeline():
+    """
+    Progress timeline over a user's photo history.
+    
+    Earlier photos are referenced by the image_id of a previous analysis
+    and read from the cache or persistent store; uploaded photos the
+    service has already seen are looked up the same way. Only new photos
+    run through the model, so adding one photo to a long history costs a
+    single inference.
+    
+    Expects:
+        - JSON with 'photos': a list of {'date', and 'image_id' or base64
+          'image', plus optional 'weight', 'height', 'age', 'gender'}.
+          Top-level body metrics apply to every photo, and
+          'smoothing_days' (default 14) sets the trend half-life
+        - Or multipart form data with the same list as a JSON string in a
+          'photos' field, where entries may name an uploaded file with
+          'file' instead
+        
+    Returns:
+        JSON with 'timeline': the photos in date order with their
+        analyses, deltas between consecutive photos and smoothed trends
+    """
+    try:
+        if request.is_json:
+            data = request.get_json(silent=True)
+            source = data if isinstance(data, dict) else {}
+            files = {}
+        else:
+            source = request.form
+            files = {}
+            for name, file in request.files.items():
+                if not allowed_file(file.filename):
+                    return jsonify({
+                        'success': False,
+                        'error': 'Invalid file type. Allowed: png, jpg, jpeg, webp, gif'
+                    }), 400
+                files[name] = file.read()
+        
+        try:
+            items, smoothing_days = parse_timeline(source, files)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        timeline = analyzer.analyze_timeline(items, smoothing_days)
+        
+        return jsonify({
+            'success': True,
+            'timeline': timeline
+        }), 200
+        
+    except Exception as e:
+        print(f"Error building timeline: {str(e)}")
+        print(traceback.format_exc())
+        
+        return jsonify({
+            'success': False,
+            'error': f'Timeline failed: {str(e)}'
+        }), 500
+
+
+def stream_boundary():
+    """
+    Multipart boundary of a streamed batch request.
+    
+    Returns:
+        tuple: (boundary or None, error response or None)
+    """
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        return None, (jsonify({
+            'success': False,
+            'error': "Multipart form data with 'photos[]' files required"
+        }), 400)
+    
+    if request.content_length is not None and request.content_length > STREAM_MAX_CONTENT_LENGTH:
+        return None, (jsonify({
+            'success': False,
+            'error': f'Request too large. Maximum size is {STREAM_MAX_CONTENT_LENGTH // (1024 * 1024)}MB'
+        }), 413)
+    
+    return boundary, None
+
+
+def ndjson(item):
+    """One NDJSON line."""
+    return app.json.dumps(item) + '\n'
+
+
+@app.route('/api/ml/batch-analyze/stream', methods=['POST'])
+@requires_model
+def batch_analyze_stream():
+    """
+    Analyze a large batch of photos, streaming one result per line.
+    
+    Photos are parsed from the request body as it arrives, analyzed in
+    batches of up to ML_MAX_BATCH_SIZE and emitted as soon as their batch
+    is done, so results start flowing before the upload has finished and
+    memory use does not grow with the number of photos.
+    
+    Expects:
+        - Multipart form data with multiple 'photos[]' files (up to
+          ML_STREAM_MAX_PHOTOS)
+        
+    Returns:
+        application/x-ndjson, one line per photo in the batch-analyze item
+        shape ('index', 'filename', 'success', 'analysis' or 'error'),
+        ordered by completion. A line without 'index' reports a failure
+        of the request itself.
+    """
+    request.max_content_length = STREAM_MAX_CONTENT_LENGTH
+    boundary, error_response = stream_boundary()
+    if error_response is not None:
+        return error_response
+    
+    stream = request.stream
+    
+    def generate():
+        batcher = UploadBatcher(
+            boundary,
+            batch_size=STREAM_BATCH_SIZE,
+            max_photos=STREAM_MAX_PHOTOS,
+            max_file_size=app.config['MAX_CONTENT_LENGTH'],
+            allowed=allowed_file
+        )
+        
+        try:
+            while not batcher.stopped:
+                chunk = stream.read(STREAM_READ_SIZE)
+                items, batches = batcher.feed(chunk or None)
+                
+                for item in items:
+                    yield ndjson(item)
+                for batch in batches:
+                    results = analyzer.analyze_photos([data for _, _, data in batch])
+                    for item in label_results(batch, results):
+                        yield ndjson(item)
+                
+                if not chunk:
+                    break
+        except Exception as e:
+            print(f"Error in streaming batch analysis: {str(e)}")
+            print(traceback.format_exc())
+            yield ndjson({'success': False, 'error': f'Batch analysis failed: {str(e)}'})
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @app.errorhandler(413)
 def request_entity_too_large(error):
     """Handle file too large error."""
@@ -0,0 +1,595 @@
+"""
+ASGI front-end for the ML service
+
+Serves the same routes and JSON responses as the Flask app in src.app, and
+shares its configuration, model start-up and analyzer, but never blocks
+the event loop:
+- uploads are read asynchronously, so slow clients only hold a connection
+- decoding and preprocessing run on a bounded thread pool
+- forward passes go through the analyzer's micro-batching scheduler (the
+  single inference dispatcher) and are awaited, not waited on by a thread
+
+One worker process handles hundreds of concurrent connections:
+    uvicorn src.asgi:app --host 0.0.0.0 --port 5001
+"""
+
+import asyncio
+import base64
+import contextvars
+import functools
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import src.app as service
+from src.metrics import CONTENT_TYPE, record_request, set_endpoint, timed
+from src.uploadStream import UploadBatcher, label_results
+
+# Threads for decoding and preprocessing; the forward pass has its own
+DECODE_WORKERS = int(os.environ.get('ML_DECODE_WORKERS', str(os.cpu_count() or 4)))
+DECODE_POOL = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix='ml-decode')
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that times serialization as a metrics stage."""
+
+    def render(self, content):
+        with timed('serialize'):
+            return super().render(content)
+
+
+def error(message, status):
+    """JSON error response in the Flask app's format."""
+    return TimedJSONResponse({'success': False, 'error': message}, status_code=status)
+
+
+async def run_blocking(fn, *args):
+    """Run CPU-bound work on the decode pool, keeping the request's metrics labels."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        DECODE_POOL, functools.partial(context.run, fn, *args)
+    )
+
+
+async def ready_analyzer():
+    """
+    Wait (without blocking the loop) for the model to finish warming up.
+
+    Returns:
+        ProgressPhotoAnalyzer or None: None if not ready within
+            ML_READY_TIMEOUT_SECONDS or if start-up failed
+    """
+    if not service._ready.is_set():
+        await asyncio.get_running_loop().run_in_executor(
+            None, service._ready.wait, service.READY_TIMEOUT_SECONDS
+        )
+    return service.analyzer
+
+
+async def infer(analyzer, images):
+    """
+    Raw head outputs for a list of images.
+
+    Preprocessing runs on the decode pool; the forward pass is queued on
+    the scheduler and its future awaited.
+
+    Returns:
+        list: analyzer.submit_raw() results
+    """
+    future = await run_blocking(analyzer.submit_raw, images)
+    return await asyncio.wrap_future(future)
+
+
+def decode_base64(value):
+    """
+    Decode a base64 image and validate its header.
+
+    Returns:
+        bytes: Encoded image file
+    """
+    return service.check_image(base64.b64decode(value))
+
+
+def raw_content_type(request):
+    """True when the body is a bare image (see src.app.is_raw_upload)."""
+    mimetype = request.headers.get('content-type', '').partition(';')[0].strip().lower()
+    return service.is_raw_upload(mimetype)
+
+
+async def read_request(request):
+    """
+    Parse a multipart form or a JSON body.
+
+    Returns:
+        tuple: (form or None, JSON dict or None)
+    """
+    content_type = request.headers.get('content-type', '')
+    with timed('upload_read'):
+        if content_type.startswith('multipart/form-data'):
+            return await request.form(), None
+        if content_type.startswith('application/json'):
+            return None, await request.json()
+    return None, None
+
+
+async def read_body(request):
+    """Read a raw request body."""
+    with timed('upload_read'):
+        return await request.body()
+
+
+def upload(form, name):
+    """The uploaded file for a form field, or None."""
+    if form is None:
+        return None
+    value = form.get(name)
+    return value if isinstance(value, UploadFile) else None
+
+
+async def metrics_endpoint(request):
+    """Prometheus metrics (see src.app.metrics_endpoint)."""
+    return Response(service.metrics_text(), media_type=CONTENT_TYPE)
+
+
+async def health_check(request):
+    """Liveness check (see src.app.health_check)."""
+    payload, status = service.health_status()
+    return TimedJSONResponse(payload, status_code=status)
+
+
+async def readiness_check(request):
+    """Readiness check (see src.app.readiness_check)."""
+    # May wait on the model server
+    payload, status = await run_blocking(service.readiness_status)
+    return TimedJSONResponse(payload, status_code=status)
+
+
+async def analyze_photo(request):
+    """Analyze a single progress photo (see src.app.analyze_photo)."""
+    analyzer = await ready_analyzer()
+    if analyzer is None:
+        return error('Model not ready', 503)
+
+    try:
+        raw = raw_content_type(request)
+        form, data = (None, None) if raw else await read_request(request)
+        photo = upload(form, 'photo')
+
+        if raw:
+            try:
+                image = await run_blocking(service.check_image, await read_body(request))
+            except Exception as e:
+                return error(f'Invalid image data: {str(e)}', 400)
+
+        elif photo is not None:
+            if photo.filename == '':
+                return error('No file selected', 400)
+
+            if not service.allowed_file(photo.filename):
+                return error('Invalid file type. Allowed: png, jpg, jpeg, webp, gif', 400)
+
+            image = await photo.read()
+
+        elif data is not None:
+            if 'image' not in data:
+                return error('No image data provided', 400)
+
+            try:
+                image = await run_blocking(decode_base64, data['image'])
+            except Exception as e:
+                return error(f'Invalid base64 image data: {str(e)}', 400)
+        else:
+            return error('No image data provided', 400)
+
+        if raw:
+            metrics = service.parse_metrics(request.query_params)
+        else:
+            metrics = service.parse_metrics(data if data is not None else form)
+
+        include_quality = request.query_params.get('include_quality') == 'true'
+        decoded = analyzer.decode(image)
+
+        entry = (await infer(analyzer, [decoded]))[0]
+        if isinstance(entry, Exception):
+            raise entry
+        result = analyzer.analyses_from_raw([entry], metrics)[0]
+        if not result['success']:
+            raise ValueError(result['error'])
+        analysis = result['analysis']
+
+        if include_quality:
+            analysis['pose_quality'] = await run_blocking(analyzer.detect_pose_quality, decoded)
+
+        return TimedJSONResponse({'success': True, 'analysis': analysis})
+
+    except Exception as e:
+        print(f"Error analyzing photo: {str(e)}")
+        print(traceback.format_exc())
+        return error(f'Analysis failed: {str(e)}', 500)
+
+
+async def rescore_photo(request):
+    """Re-score a previously analyzed photo (see src.app.rescore_photo)."""
+    analyzer = await ready_analyzer()
+    if analyzer is None:
+        return error('Model not ready', 503)
+
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return error('Expected a JSON object', 400)
+
+        if not data.get('image_id'):
+            return error('image_id required', 400)
+        if not isinstance(data['image_id'], str):
+            return error('image_id must be a string', 400)
+
+        try:
+            metrics = service.parse_metrics(data, strict=True)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        # No model call, but a cache miss reads the store
+        try:
+            analysis = await run_blocking(functools.partial(analyzer.rescore, data['image_id'], **metrics))
+        except KeyError:
+            return error('Unknown or expired image_id; analyze the photo again', 404)
+
+        return TimedJSONResponse({'success': True, 'analysis': analysis})
+
+    except Exception as e:
+        print(f"Error re-scoring photo: {str(e)}")
+        print(traceback.format_exc())
+        return error(f'Re-scoring failed: {str(e)}', 500)
+
+
+async def compare_photos(request):
+    """Compare two progress photos (see src.app.compare_photos)."""
+    analyzer = await ready_analyzer()
+    if analyzer is None:
+        return error('Model not ready', 503)
+
+    try:
+        raw = raw_content_type(request)
+        form, data = (None, None) if raw else await read_request(request)
+        file1 = upload(form, 'photo1')
+        file2 = upload(form, 'photo2')
+
+        if raw:
+            try:
+                photo1, photo2 = service.split_photo_pair(
+                    await read_body(request),
+                    request.query_params.get('photo1_size')
+                )
+                await run_blocking(service.check_image, photo1)
+                await run_blocking(service.check_image, photo2)
+            except Exception as e:
+                return error(f'Invalid image data: {str(e)}', 400)
+
+        elif file1 is not None and file2 is not None:
+            if not (service.allowed_file(file1.filename) and service.allowed_file(file2.filename)):
+                return error('Invalid file types', 400)
+
+            photo1 = await file1.read()
+            photo2 = await file2.read()
+
+        elif data is not None:
+            if 'photo1' not in data or 'photo2' not in data:
+                return error('Both photo1 and photo2 required', 400)
+
+            try:
+                photo1 = await run_blocking(decode_base64, data['photo1'])
+                photo2 = await run_blocking(decode_base64, data['photo2'])
+            except Exception as e:
+                return error(f'Invalid base64 image data: {str(e)}', 400)
+        else:
+            return error('No photos provided', 400)
+
+        if raw:
+            source = request.query_params
+        else:
+            source = data if data is not None else form
+        shared_metrics = service.parse_metrics(source)
+        before_metrics = service.parse_metrics(source, suffix='1', defaults=shared_metrics)
+        after_metrics = service.parse_metrics(source, suffix='2', defaults=shared_metrics)
+
+        comparison = analyzer.comparison_from_raw(
+            await infer(analyzer, [photo1, photo2]),
+            before_metrics,
+            after_metrics
+        )
+
+        return TimedJSONResponse({'success': True, 'comparison': comparison})
+
+    except Exception as e:
+        print(f"Error comparing photos: {str(e)}")
+        print(traceback.format_exc())
+        return error(f'Comparison failed: {str(e)}', 500)
+
+
+async def batch_analyze(request):
+    """Analyze multiple photos at once (see src.app.batch_analyze)."""
+    analyzer = await ready_analyzer()
+    if analyzer is None:
+        return error('Model not ready', 503)
+
+    try:
+        form, _ = await read_request(request)
+        files = [
+            value for value in (form.getlist('photos[]') if form is not None else [])
+            if isinstance(value, UploadFile)
+        ]
+
+        if not files:
+            return error('No photos provided', 400)
+
+        if len(files) > 10:
+            return error('Maximum 10 photos per batch', 400)
+
+        results = [None] * len(files)
+        images = []
+        image_indices = []
+
+        for idx, file in enumerate(files):
+            if not service.allowed_file(file.filename):
+                results[idx] = {
+                    'index': idx,
+                    'filename': file.filename,
+                    'success': False,
+                    'error': 'Invalid file type'
+                }
+                continue
+
+            images.append(await file.read())
+            image_indices.append(idx)
+
+        analyses = analyzer.analyses_from_raw(await infer(analyzer, images)) if images else []
+        for idx, item in zip(image_indices, analyses):
+            item['index'] = idx
+            item['filename'] = files[idx].filename
+            results[idx] = item
+
+        return TimedJSONResponse({'success': True, 'total': len(files), 'results': results})
+
+    except Exception as e:
+        print(f"Error in batch analysis: {str(e)}")
+        print(traceback.format_exc())
+        return error(f'Batch analysis failed: {str(e)}', 500)
+
+
+async def progress_timeline(request):
+    """Progress timeline over a photo history (see src.app.progress_timeline)."""
+    analyzer = await ready_analyzer()
+    if analyzer is None:
+        return error('Model not ready', 503)
+
+    try:
+        form, data = await read_request(request)
+        files = {}
+        if form is not None:
+            for name, value in form.multi_items():
+                if not isinstance(value, UploadFile):
+                    continue
+                if not service.allowed_file(value.filename):
+                    return error('Invalid file type. Allowed: png, jpg, jpeg, webp, gif', 400)
+                files[name] = await value.read()
+        source = data if isinstance(data, dict) else (form or {})
+
+        try:
+            items, smoothing_days = await run_blocking(service.parse_timeline, source, files)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        photos = [item['image'] for item in items if item.get('image_id') is None]
+        photo_results = await infer(analyzer, photos) if photos else []
+        timeline = await run_blocking(analyzer.timeline_from_raw, items, photo_results, smoothing_days)
+
+        return TimedJSONResponse({'success': True, 'timeline': timeline})
+
+    except Exception as e:
+        print(f"Error building timeline: {str(e)}")
+        print(traceback.format_exc())
+        return error(f'Timeline failed: {str(e)}', 500)
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for a generator that is still reading the request body.
+
+    StreamingResponse watches for client disconnects by calling receive(),
+    which would take body chunks away from the generator. Here the
+    generator reads the body itself and sees a disconnect from it.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def batch_analyze_stream(request):
+    """Analyze a large batch, streaming NDJSON (see src.app.batch_analyze_stream)."""
+    analyzer = await ready_analyzer()
+    if analyzer is None:
+        return error('Model not ready', 503)
+
+    content_type = request.headers.get('content-type', '')
+    boundary = None
+    if content_type.startswith('multipart/form-data'):
+        for param in content_type.split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'boundary':
+                boundary = value.strip('"')
+    if not boundary:
+        return error("Multipart form data with 'photos[]' files required", 400)
+
+    async def generate():
+        batcher = UploadBatcher(
+            boundary,
+            batch_size=service.STREAM_BATCH_SIZE,
+            max_photos=service.STREAM_MAX_PHOTOS,
+            max_file_size=service.app.config['MAX_CONTENT_LENGTH'],
+            allowed=service.allowed_file
+        )
+        body = request.stream()
+
+        try:
+            while not batcher.stopped:
+                chunk = await anext(body, None)
+                items, batches = batcher.feed(chunk if chunk else None)
+
+                for item in items:
+                    yield service.ndjson(item)
+                for batch in batches:
+                    raw = await infer(analyzer, [data for _, _, data in batch])
+                    for item in label_results(batch, analyzer.analyses_from_raw(raw)):
+                        yield service.ndjson(item)
+
+                if chunk is None:
+                    break
+        except Exception as e:
+            print(f"Error in streaming batch analysis: {str(e)}")
+            print(traceback.format_exc())
+            yield service.ndjson({'success': False, 'error': f'Batch analysis failed: {str(e)}'})
+
+    return BodyStreamingResponse(generate(), media_type='application/x-ndjson')
+
+
+class MaxBodySize:
+    """
+    Reject request bodies over the Flask app's MAX_CONTENT_LENGTH with 413.
+
+    Checks Content-Length up front. Streamed (chunked) bodies are counted;
+    once over the limit the app sees a client disconnect and, unless it
+    has already started a (streaming) response, whatever it responds with
+    is replaced by the 413.
+    """
+
+    def __init__(self, app, max_bytes, stream_paths=None):
+        """
+        Args:
+            app: Wrapped ASGI app
+            max_bytes (int): Body limit
+            stream_paths (dict, optional): Higher limits for specific paths
+        """
+        self.app = app
+        self.max_bytes = max_bytes
+        self.stream_paths = stream_paths or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        max_bytes = self.stream_paths.get(scope['path'], self.max_bytes)
+        too_large = error(f'File too large. Maximum size is {max_bytes // (1024 * 1024)}MB', 413)
+        content_length = dict(scope['headers']).get(b'content-length')
+        if content_length is not None:
+            try:
+                length = int(content_length)
+            except ValueError:
+                length = -1
+            if length < 0:
+                return await error('Invalid Content-Length', 400)(scope, receive, send)
+            if length > max_bytes:
+                return await too_large(scope, receive, send)
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {'type': 'http.disconnect'}
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > max_bytes:
+                    exceeded = True
+                    return {'type': 'http.disconnect'}
+            return message
+
+        async def limited_send(message):
+            nonlocal started
+            if exceeded and not started:
+                return
+            started = started or message['type'] == 'http.response.start'
+            await send(message)
+
+        await self.app(scope, limited_receive, limited_send)
+        if exceeded and not started:
+            await too_large(scope, receive, send)
+
+
+class RequestMetrics:
+    """
+    Count requests and record their latency per endpoint.
+
+    Outermost middleware, so 413s from MaxBodySize are counted too. The
+    endpoint label is the route path, or 'unmatched' for unknown paths.
+    """
+
+    def __init__(self, app, paths):
+        """
+        Args:
+            app: Wrapped ASGI app
+            paths (set): Route paths used as endpoint labels
+        """
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        endpoint = scope['path'] if scope['path'] in self.paths else 'unmatched'
+        set_endpoint(endpoint)
+        started = time.perf_counter()
+
+        async def timed_send(message):
+            if message['type'] == 'http.response.start':
+                record_request(endpoint, scope['method'], message['status'], time.perf_counter() - started)
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+async def not_found(request, exc):
+    """Handle 404 errors."""
+    return error('Endpoint not found', 404)
+
+
+routes = [
+    Route('/metrics', metrics_endpoint, methods=['GET']),
+    Route('/health', health_check, methods=['GET']),
+    Route('/ready', readiness_check, methods=['GET']),
+    Route('/api/ml/analyze', analyze_photo, methods=['POST']),
+    Route('/api/ml/rescore', rescore_photo, methods=['POST']),
+    Route('/api/ml/compare', compare_photos, methods=['POST']),
+    Route('/api/ml/batch-analyze', batch_analyze, methods=['POST']),
+    Route('/api/ml/batch-analyze/stream', batch_analyze_stream, methods=['POST']),
+    Route('/api/ml/timeline', progress_timeline, methods=['POST']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(RequestMetrics, paths={route.path for route in routes}),
+        Middleware(
+            MaxBodySize,
+            max_bytes=service.app.config['MAX_CONTENT_LENGTH'],
+            stream_paths={'/api/ml/batch-analyze/stream': service.STREAM_MAX_CONTENT_LENGTH}
+        )
+    ],
+    exception_handlers={404: not_found}
+)
@@ -0,0 +1,223 @@
+"""
+Export TFLite inference engines and report parity against Keras
+
+Builds the analyzer model (optionally with fine-tuned weights), converts
+it to a float16 TFLite flatbuffer and to a post-training int8-quantized
+flatbuffer calibrated on sample photos, then compares every engine's
+body_fat/muscle/posture outputs and latency against the Keras baseline.
+
+Usage:
+    cd ml-service
+    python -m src.exportEngines --output-dir models/engines \\
+        --calibration-dir path/to/sample/photos --model-path models/weights/fitness_model.weights.h5
+
+Writes:
+    <output-dir>/model_fp16.tflite
+    <output-dir>/model_int8.tflite
+    <output-dir>/parity_report.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from src.inferenceEngines import HEAD_NAMES, TFLiteEngine
+from src.photoAnalyzer import ProgressPhotoAnalyzer
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+OUTPUT_NAMES = ('body_fat', 'muscle', 'posture')
+
+
+def load_samples(analyzer, calibration_dir=None, limit=100):
+    """
+    Load preprocessed sample images for calibration and parity checks.
+
+    Falls back to synthetic images when no directory is given, which is
+    enough to exercise the pipeline but gives a poor int8 calibration.
+
+    Args:
+        analyzer (ProgressPhotoAnalyzer): Used for preprocessing
+        calibration_dir (str, optional): Directory of sample photos
+        limit (int): Maximum number of samples
+
+    Returns:
+        np.ndarray: Preprocessed samples (N, 224, 224, 3)
+    """
+    samples = []
+
+    if calibration_dir:
+        for filename in sorted(os.listdir(calibration_dir)):
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            try:
+                samples.append(analyzer.preprocess_image(os.path.join(calibration_dir, filename)))
+            except Exception as e:
+                print(f"Skipping {filename}: {str(e)}")
+            if len(samples) >= limit:
+                break
+
+    if not samples:
+        print("No calibration photos found; using synthetic samples")
+        rng = np.random.default_rng(0)
+        for _ in range(min(limit, 16)):
+            img = rng.integers(0, 255, (224, 224, 3), dtype=np.uint8)
+            samples.append(analyzer.preprocess_image(img))
+
+    return np.concatenate(samples, axis=0)
+
+
+def convert(model, samples=None, quantize_int8=False):
+    """
+    Convert the Keras model to a TFLite flatbuffer.
+
+    The serving signature names each output after its head layer (see
+    inferenceEngines.HEAD_NAMES), so TFLiteEngine maps outputs by name
+    rather than by the converter's positional output_N names.
+
+    Args:
+        model (tf.keras.Model): Analyzer model
+        samples (np.ndarray, optional): Calibration inputs, required for int8
+        quantize_int8 (bool): Post-training int8 quantization instead of float16
+
+    Returns:
+        bytes: TFLite flatbuffer
+
+    Raises:
+        ValueError: If the model's heads are not named HEAD_NAMES
+    """
+    output_names = list(model.output_names)
+    if sorted(output_names) != sorted(HEAD_NAMES):
+        raise ValueError(f"Model heads {output_names} do not match {list(HEAD_NAMES)}")
+
+    named = tf.keras.Model(model.inputs, dict(zip(output_names, model.outputs)))
+
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        named.export(saved_model_dir, verbose=False)
+        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+        if quantize_int8:
+            def representative_dataset():
+                for sample in samples:
+                    yield [sample[np.newaxis].astype(np.float32)]
+
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        else:
+            converter.target_spec.supported_types = [tf.float16]
+
+        return converter.convert()
+
+
+def measure_latency(engine, iterations=50):
+    """
+    Measure batch-of-one latency for an engine.
+
+    Returns:
+        dict: p50_ms and p95_ms
+    """
+    batch = np.zeros((1, 224, 224, 3), dtype=np.float32)
+    engine.warmup()
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        engine.predict(batch)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2)
+    }
+
+
+def parity_report(baseline, engines, samples, iterations=50):
+    """
+    Compare engine outputs and latency against the baseline engine.
+
+    Output differences are reported on the 0-100 score scale.
+
+    Args:
+        baseline: Reference engine (Keras)
+        engines (list): Engines to compare
+        samples (np.ndarray): Preprocessed inputs
+        iterations (int): Latency iterations per engine
+
+    Returns:
+        dict: Per-engine latency and max/mean absolute output differences
+    """
+    reference = [
+        np.concatenate(outputs, axis=1)
+        for outputs in (baseline.predict(sample[np.newaxis]) for sample in samples)
+    ]
+
+    report = {baseline.name: {'latency': measure_latency(baseline, iterations)}}
+
+    for engine in engines:
+        diffs = np.abs(np.concatenate([
+            np.concatenate(engine.predict(sample[np.newaxis]), axis=1) - expected
+            for sample, expected in zip(samples, reference)
+        ], axis=0)) * 100
+
+        report[engine.name] = {
+            'latency': measure_latency(engine, iterations),
+            'max_abs_diff': {
+                name: round(float(diffs[:, i].max()), 3) for i, name in enumerate(OUTPUT_NAMES)
+            },
+            'mean_abs_diff': {
+                name: round(float(diffs[:, i].mean()), 3) for i, name in enumerate(OUTPUT_NAMES)
+            }
+        }
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export TFLite engines and a parity report")
+    parser.add_argument('--output-dir', default='models/engines')
+    parser.add_argument('--model-path', default=os.environ.get('MODEL_PATH'))
+    parser.add_argument('--calibration-dir', default=None)
+    parser.add_argument('--calibration-samples', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    analyzer = ProgressPhotoAnalyzer(model_path=args.model_path)
+    samples = load_samples(analyzer, args.calibration_dir, args.calibration_samples)
+
+    artifacts = {
+        'tflite-fp16': os.path.join(args.output_dir, 'model_fp16.tflite'),
+        'tflite-int8': os.path.join(args.output_dir, 'model_int8.tflite'),
+    }
+
+    for name, path in artifacts.items():
+        print(f"Converting {name}...")
+        flatbuffer = convert(analyzer.model, samples, quantize_int8=(name == 'tflite-int8'))
+        with open(path, 'wb') as f:
+            f.write(flatbuffer)
+        print(f"Wrote {path} ({len(flatbuffer) / 1024 / 1024:.1f} MB)")
+
+    engines = [TFLiteEngine(path, name=name) for name, path in artifacts.items()]
+    report = parity_report(analyzer.engine, engines, samples, args.iterations)
+
+    report_path = os.path.join(args.output_dir, 'parity_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'engine':<14}{'p50 ms':>9}{'p95 ms':>9}  max |diff| body_fat/muscle/posture")
+    for name, entry in report.items():
+        diff = entry.get('max_abs_diff')
+        diff_text = '/'.join(f"{diff[n]:.2f}" for n in OUTPUT_NAMES) if diff else 'baseline'
+        print(f"{name:<14}{entry['latency']['p50_ms']:>9.2f}{entry['latency']['p95_ms']:>9.2f}  {diff_text}")
+    print(f"\nReport written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Export the full analyzer model to one local .keras artifact
+
+The default start-up path builds MobileNetV2 with ImageNet weights, which
+needs network access (or a populated Keras cache) on every new container.
+The exported artifact holds the backbone, the three heads and any
+fine-tuned weights in a single file, so ProgressPhotoAnalyzer can load it
+with MODEL_PATH=<artifact> and no network access.
+
+Usage:
+    cd ml-service
+    python -m src.exportModel --output models/fitness_model.keras \\
+        --model-path models/weights/fitness_model.weights.h5
+
+Run it once at image build time (see Dockerfile), where network access
+is available.
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from src.photoAnalyzer import ProgressPhotoAnalyzer
+
+
+def export_model(output_path, model_path=None):
+    """
+    Build the analyzer model and save it as a single .keras file.
+
+    The saved model is loaded back and checked against the source model
+    on a random input before returning.
+
+    Args:
+        output_path (str): Destination, must end in .keras
+        model_path (str, optional): Fine-tuned weights to bake in
+
+    Returns:
+        float: Largest absolute output difference after reloading
+    """
+    if not output_path.endswith('.keras'):
+        raise ValueError("Output path must end in .keras")
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    analyzer = ProgressPhotoAnalyzer(model_path=model_path)
+    analyzer.model.save(output_path)
+
+    reloaded = ProgressPhotoAnalyzer(model_path=output_path)
+    batch = np.random.default_rng(0).uniform(-1, 1, (2, 224, 224, 3)).astype(np.float32)
+    return max(
+        float(np.max(np.abs(original - loaded)))
+        for original, loaded in zip(analyzer.engine.predict(batch), reloaded.engine.predict(batch))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the analyzer model to a .keras artifact")
+    parser.add_argument('--output', default='models/fitness_model.keras')
+    parser.add_argument('--model-path', default=None, help="Fine-tuned weights to bake in")
+    args = parser.parse_args()
+
+    max_diff = export_model(args.output, args.model_path)
+    size_mb = os.path.getsize(args.output) / 1024 / 1024
+    print(f"Wrote {args.output} ({size_mb:.1f} MB), reload max |diff| {max_diff:.2e}")
+
+
+if __name__ == '__main__':
+    main()
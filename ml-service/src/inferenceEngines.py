@@ -0,0 +1,461 @@
+"""
+Inference engines for the progress photo model
+
+Every engine exposes the same small interface used by ProgressPhotoAnalyzer:
+    - predict(batch) -> (body_fat, muscle, posture) arrays, each (N, 1)
+    - warmup(batch_sizes)
+    - name
+    - model_version: engine name plus a digest of the weights, so stored
+      outputs are never reused across models (see src.analysisStore)
+
+Available engines:
+    - keras: the float32 Keras graph behind a compiled tf.function
+    - tflite-fp16: TFLite conversion with float16 weights
+    - tflite-int8: TFLite conversion with post-training int8 quantization
+    - remote: forwards batches to a shared model server (src.modelServer)
+
+Local engines can be wrapped in a BucketedEngine, which pads every batch
+to one of a few fixed sizes so only those shapes are ever compiled.
+
+TFLite artifacts are produced by `python -m src.exportEngines`.
+
+TensorFlow is imported by the engines that run the model, not by this
+module, so a process using the remote engine never loads it.
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from src.metrics import FORWARD_BUCKET_SECONDS, FORWARD_PADDING_ROWS
+
+
+ENGINE_NAMES = ('keras', 'tflite-fp16', 'tflite-int8', 'remote')
+
+# Head layer names of the model, in the (body_fat, muscle, posture) order
+# engines return; exported TFLite signatures name their outputs after them
+HEAD_NAMES = ('body_fat', 'muscle_score', 'posture_score')
+
+# On CPU a forward pass costs about the same per row at any batch size, so
+# padding rows are pure overhead: buckets are exact up to the largest
+# micro-batch and then spaced so padding stays under a quarter of a batch
+DEFAULT_BUCKETS = (1, 2, 3, 4, 5, 6, 7, 8, 10, 12, 16)
+
+
+def cpu_quota(cgroup_root='/sys/fs/cgroup'):
+    """
+    CPUs available to this container.
+
+    Reads the CFS quota (cgroup v2 cpu.max, or v1 cpu.cfs_quota_us over
+    cpu.cfs_period_us), rounded up to whole CPUs and capped at the CPUs
+    this process may run on. os.cpu_count() alone reports the host's
+    cores, so a runtime sizing its thread pools from it oversubscribes a
+    container limited to a fraction of them.
+
+    Args:
+        cgroup_root (str): cgroup filesystem mount point
+
+    Returns:
+        int: Number of CPUs, at least 1
+    """
+    available = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+    quota = period = None
+    try:
+        with open(os.path.join(cgroup_root, 'cpu.max')) as f:
+            fields = f.read().split()
+        if fields[0] != 'max':
+            quota, period = int(fields[0]), int(fields[1])
+    except (OSError, ValueError, IndexError):
+        try:
+            with open(os.path.join(cgroup_root, 'cpu', 'cpu.cfs_quota_us')) as f:
+                quota = int(f.read())
+            with open(os.path.join(cgroup_root, 'cpu', 'cpu.cfs_period_us')) as f:
+                period = int(f.read())
+        except (OSError, ValueError):
+            quota = period = None
+
+    if quota is None or quota <= 0 or not period:
+        return available
+    return max(1, min(available, -(-quota // period)))
+
+
+def thread_counts(cpus=None):
+    """
+    TensorFlow intra- and inter-op thread counts for this container.
+
+    ML_TF_INTRA_OP_THREADS and ML_TF_INTER_OP_THREADS override the derived
+    values. Intra-op threads (inside one op, e.g. a convolution) get every
+    CPU of the quota; a single MobileNetV2 graph has little independent
+    work to run side by side, so inter-op threads stay at 1, or 2 from
+    four CPUs up.
+
+    Args:
+        cpus (int, optional): CPU quota; cpu_quota() when None
+
+    Returns:
+        tuple: (intra_op_threads, inter_op_threads)
+    """
+    cpus = cpus or cpu_quota()
+    intra = int(os.environ.get('ML_TF_INTRA_OP_THREADS', '0')) or cpus
+    inter = int(os.environ.get('ML_TF_INTER_OP_THREADS', '0')) or (2 if cpus >= 4 else 1)
+    return intra, inter
+
+
+def weights_version(name, chunks):
+    """
+    Model version string for an engine.
+
+    Args:
+        name (str): Engine name; engines differ numerically, so it is part
+            of the version
+        chunks (iterable): Weight arrays or bytes the outputs depend on
+
+    Returns:
+        str: '<name>-<first 16 hex digits of their SHA-256>'
+    """
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(np.ascontiguousarray(chunk).tobytes() if isinstance(chunk, np.ndarray) else chunk)
+    return f"{name}-{digest.hexdigest()[:16]}"
+
+
+def configure_threads(cpus=None):
+    """
+    Size TensorFlow's thread pools from the container's CPU quota.
+
+    Must run before TensorFlow executes its first op; later calls leave
+    the pools unchanged.
+
+    Args:
+        cpus (int, optional): CPU quota; cpu_quota() when None
+
+    Returns:
+        tuple: (intra_op_threads, inter_op_threads) requested
+    """
+    import tensorflow as tf
+
+    intra, inter = thread_counts(cpus)
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(intra)
+        tf.config.threading.set_inter_op_parallelism_threads(inter)
+    except RuntimeError:
+        print("TensorFlow already initialized; keeping its thread pools")
+    return intra, inter
+
+
+class KerasEngine:
+    """
+    Low-overhead forward pass for the Keras model.
+
+    model.predict() builds a data adapter, a callback list and a fresh
+    execution loop on every call, which dominates the cost of a single
+    224x224 image. The engine instead wraps the model in a tf.function
+    traced once for a fixed (None, 224, 224, 3) float32 signature, so every
+    batch size reuses the same compiled graph.
+
+    With jit_compile the graph is compiled by XLA, which fuses ops but
+    compiles separately for every batch size it sees; put the engine
+    behind a BucketedEngine so that happens only for the buckets, at warmup.
+    """
+
+    name = 'keras'
+
+    def __init__(self, model, img_size=(224, 224), jit_compile=False):
+        """
+        Initialize the inference engine.
+
+        Args:
+            model (tf.keras.Model): Model with body fat, muscle and posture outputs
+            img_size (tuple): Model input size (height, width)
+            jit_compile (bool): Compile the forward pass with XLA
+        """
+        import tensorflow as tf
+
+        self.model = model
+        self.img_size = img_size
+        self.jit_compile = jit_compile
+        self._forward = tf.function(
+            lambda batch: self.model(batch, training=False),
+            input_signature=[
+                tf.TensorSpec(shape=(None, img_size[0], img_size[1], 3), dtype=tf.float32)
+            ],
+            jit_compile=jit_compile
+        )
+        self.warmed_up = False
+        self.warmed_batch_sizes = set()
+        self._model_version = None
+
+    @property
+    def model_version(self):
+        """str: Version derived from the model's weights (computed once)."""
+        if self._model_version is None:
+            self._model_version = weights_version(
+                self.name, (weight.numpy() for weight in self.model.weights)
+            )
+        return self._model_version
+
+    def warmup(self, batch_sizes=(1,)):
+        """
+        Trace the compiled function and run one forward pass per batch size.
+
+        Moves graph construction and per-shape kernel selection out of the
+        first real requests.
+
+        Args:
+            batch_sizes (iterable): Batch sizes to run
+        """
+        _warmup(self, batch_sizes)
+
+    def predict(self, batch):
+        """
+        Run the model on a preprocessed batch.
+
+        Args:
+            batch (np.ndarray): Preprocessed images (N, 224, 224, 3)
+
+        Returns:
+            tuple: (body_fat, muscle, posture) numpy arrays, each of shape (N, 1)
+        """
+        outputs = self._forward(np.asarray(batch, dtype=np.float32))
+        return tuple(output.numpy() for output in outputs)
+
+
+class TFLiteEngine:
+    """
+    Forward pass through a converted TFLite flatbuffer.
+
+    Used for the float16 and int8 artifacts. Inputs and outputs stay
+    float32 at the boundary; quantization is internal to the graph. The
+    interpreter is not thread-safe, so calls are serialized with a lock
+    (the micro-batching scheduler already funnels them onto one thread).
+    """
+
+    def __init__(self, model_path, name='tflite', img_size=(224, 224), num_threads=None):
+        """
+        Load a TFLite artifact.
+
+        Args:
+            model_path (str): Path to the .tflite file
+            name (str): Engine name reported in results
+            img_size (tuple): Model input size (height, width)
+            num_threads (int, optional): Interpreter CPU threads
+        """
+        import tensorflow as tf
+
+        self.name = name
+        self.model_path = model_path
+        self.img_size = img_size
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+
+        signature = self.interpreter.get_signature_list()['serving_default']
+        self._input_name = signature['inputs'][0]
+        # Outputs are named after the model heads at export time
+        missing = set(HEAD_NAMES) - set(signature['outputs'])
+        if missing:
+            raise ValueError(
+                f"{model_path} has outputs {sorted(signature['outputs'])}, expected {list(HEAD_NAMES)}; "
+                "re-export it with src.exportEngines"
+            )
+        self._output_names = HEAD_NAMES
+        self._runner = self.interpreter.get_signature_runner('serving_default')
+        self._lock = threading.Lock()
+        self.warmed_up = False
+        self.warmed_batch_sizes = set()
+        self._model_version = None
+
+    @property
+    def model_version(self):
+        """str: Version derived from the artifact's bytes (computed once)."""
+        if self._model_version is None:
+            with open(self.model_path, 'rb') as f:
+                self._model_version = weights_version(self.name, iter(lambda: f.read(1024 * 1024), b''))
+        return self._model_version
+
+    def warmup(self, batch_sizes=(1,)):
+        """
+        Allocate tensors and run one forward pass per batch size.
+
+        Args:
+            batch_sizes (iterable): Batch sizes to run
+        """
+        _warmup(self, batch_sizes)
+
+    def predict(self, batch):
+        """
+        Run the model on a preprocessed batch.
+
+        Args:
+            batch (np.ndarray): Preprocessed images (N, 224, 224, 3)
+
+        Returns:
+            tuple: (body_fat, muscle, posture) numpy arrays, each of shape (N, 1)
+        """
+        with self._lock:
+            outputs = self._runner(**{self._input_name: np.asarray(batch, dtype=np.float32)})
+        return tuple(np.array(outputs[name]) for name in self._output_names)
+
+
+class BucketedEngine:
+    """
+    Runs a wrapped engine on a fixed set of batch sizes only.
+
+    Each batch is zero-padded up to the smallest bucket that holds it and
+    the padding rows are sliced off the outputs; batches larger than the
+    biggest bucket run in chunks of that size. Every shape the wrapped
+    engine sees is therefore one of the buckets, and warmup() runs all of
+    them, so graph tracing, XLA compilation and per-shape kernel selection
+    happen at start-up and never while serving a request. Rows are
+    independent in inference mode, so padding leaves the real rows'
+    outputs unchanged.
+    """
+
+    def __init__(self, engine, buckets=DEFAULT_BUCKETS):
+        """
+        Wrap an engine.
+
+        Args:
+            engine: KerasEngine or TFLiteEngine
+            buckets (iterable): Allowed batch sizes
+        """
+        buckets = tuple(sorted(set(buckets)))
+        if not buckets or buckets[0] < 1:
+            raise ValueError("Buckets must be positive batch sizes")
+
+        self.engine = engine
+        self.buckets = buckets
+        self.name = engine.name
+        self.img_size = engine.img_size
+        self.warmed_up = False
+        self.warmed_batch_sizes = set()
+
+    @property
+    def model_version(self):
+        """str: The wrapped engine's version; padding leaves outputs unchanged."""
+        return self.engine.model_version
+
+    def bucket_for(self, batch_size):
+        """
+        Bucket a batch of this size is padded to.
+
+        Args:
+            batch_size (int): Number of images (at most the largest bucket)
+
+        Returns:
+            int: Smallest bucket holding batch_size images
+        """
+        for bucket in self.buckets:
+            if bucket >= batch_size:
+                return bucket
+        raise ValueError(f"Batch of {batch_size} exceeds the largest bucket ({self.buckets[-1]})")
+
+    def warmup(self, batch_sizes=(1,)):
+        """
+        Compile and run every bucket once.
+
+        Args:
+            batch_sizes (iterable): Batch sizes the caller expects; all of
+                them map onto the buckets, which are always warmed in full
+        """
+        self.engine.warmup(self.buckets)
+        self.warmed_batch_sizes.update(self.buckets)
+        self.warmed_batch_sizes.update(batch_sizes)
+        self.warmed_up = True
+
+    def predict(self, batch):
+        """
+        Run the model on a preprocessed batch, padded to its bucket.
+
+        Args:
+            batch (np.ndarray): Preprocessed images (N, 224, 224, 3)
+
+        Returns:
+            tuple: (body_fat, muscle, posture) numpy arrays, each of shape (N, 1)
+        """
+        largest = self.buckets[-1]
+        if len(batch) <= largest:
+            return self._predict_bucket(batch)
+
+        chunks = [self._predict_bucket(batch[start:start + largest])
+                  for start in range(0, len(batch), largest)]
+        return tuple(np.concatenate(outputs, axis=0) for outputs in zip(*chunks))
+
+    def _predict_bucket(self, batch):
+        """Pad one chunk to its bucket, run it and drop the padding rows."""
+        rows = len(batch)
+        bucket = self.bucket_for(rows)
+        if bucket > rows:
+            padded = np.zeros((bucket,) + batch.shape[1:], dtype=np.float32)
+            padded[:rows] = batch
+            FORWARD_PADDING_ROWS.inc(str(bucket), amount=bucket - rows)
+        else:
+            padded = batch
+
+        started = time.perf_counter()
+        outputs = self.engine.predict(padded)
+        FORWARD_BUCKET_SECONDS.observe(time.perf_counter() - started, str(bucket))
+        return tuple(output[:rows] for output in outputs)
+
+
+def _warmup(engine, batch_sizes):
+    """Run one zero batch per not-yet-warmed batch size."""
+    for batch_size in batch_sizes:
+        if batch_size in engine.warmed_batch_sizes:
+            continue
+        engine.predict(np.zeros(
+            (batch_size, engine.img_size[0], engine.img_size[1], 3),
+            dtype=np.float32
+        ))
+        engine.warmed_batch_sizes.add(batch_size)
+    engine.warmed_up = True
+
+
+def create_engine(name, model=None, artifact_path=None, img_size=(224, 224), num_threads=None,
+                  buckets=None, jit_compile=False):
+    """
+    Create an inference engine by name.
+
+    Args:
+        name (str): One of ENGINE_NAMES
+        model (tf.keras.Model, optional): Required for the 'keras' engine
+        artifact_path (str, optional): .tflite file, required for TFLite
+            engines; the model server's socket for the remote engine
+        img_size (tuple): Model input size (height, width)
+        num_threads (int, optional): Interpreter CPU threads for TFLite engines;
+            derived from the CPU quota when None
+        buckets (iterable, optional): Pad batches to these sizes (see
+            BucketedEngine); ignored by the remote engine, whose server
+            does its own bucketing
+        jit_compile (bool): Compile the keras engine with XLA
+
+    Returns:
+        KerasEngine, TFLiteEngine, BucketedEngine or RemoteEngine
+    """
+    if name == 'keras':
+        if model is None:
+            raise ValueError("The keras engine needs a model")
+        engine = KerasEngine(model, img_size, jit_compile=jit_compile)
+        return BucketedEngine(engine, buckets) if buckets else engine
+
+    if name in ('tflite-fp16', 'tflite-int8'):
+        if not artifact_path:
+            raise ValueError(f"The {name} engine needs an artifact path (see src.exportEngines)")
+        engine = TFLiteEngine(
+            artifact_path,
+            name=name,
+            img_size=img_size,
+            num_threads=num_threads or thread_counts()[0]
+        )
+        return BucketedEngine(engine, buckets) if buckets else engine
+
+    if name == 'remote':
+        from src.modelServer import RemoteEngine
+
+        if not artifact_path:
+            raise ValueError("The remote engine needs the model server's socket path")
+        return RemoteEngine(artifact_path, img_size=img_size)
+
+    raise ValueError(f"Unknown engine '{name}'. Available: {', '.join(ENGINE_NAMES)}")
@@ -0,0 +1,638 @@
+"""
+Request and pipeline metrics in the Prometheus text format
+
+Counters and histograms live in process memory and are rendered on
+demand by the /metrics endpoint of both front-ends. Recording a value
+takes one lock and one bisect, roughly a microsecond, so the
+instrumentation stays on in production; set ML_METRICS_ENABLED=false
+to turn stage timing off entirely.
+
+Stages of a request are timed with:
+    with metrics.timed('decode'):
+        ...
+
+Each front-end records the endpoint serving the current request with
+set_endpoint(). Per-endpoint counters recorded deeper in the analyzer,
+such as cache lookups, read it back from a context variable.
+
+Under gunicorn, each worker and the model server record into their own
+memory. With ML_METRICS_DIR set (gunicorn.conf.py sets it), every process
+also writes its values to a file in that directory about once a second,
+and render() adds up the files of all processes, so a scrape of any
+worker covers the whole container. Counters and histograms of exited
+processes are folded into one aggregate file and their files deleted, so
+counters never go backwards when a worker is replaced and the directory
+does not grow with every restart.
+"""
+
+import atexit
+import bisect
+import contextvars
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+
+ENABLED = os.environ.get('ML_METRICS_ENABLED', 'true').lower() == 'true'
+
+# Shared between the processes of a container; unset for one process
+MULTIPROCESS_DIR = os.environ.get('ML_METRICS_DIR') or None
+FLUSH_SECONDS = float(os.environ.get('ML_METRICS_FLUSH_SECONDS', '1'))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers sub-millisecond stages up to slow uploads
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+# Images per forward pass or per analyzer call
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+_endpoint = contextvars.ContextVar('ml_endpoint', default='none')
+
+
+def _escape(value):
+    """Escape a label value for the text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    """Render a sample value; integers without a trailing .0."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class _Metric:
+    """Base class: a named metric family with fixed label names."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Initialize the metric.
+
+        Args:
+            name (str): Metric name, e.g. 'ml_requests_total'
+            documentation (str): HELP text
+            labelnames (tuple): Label names; values are passed positionally
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _labels(self, label_values, extra=()):
+        """Format the {name="value",...} part of a sample."""
+        pairs = list(zip(self.labelnames, label_values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def clear(self):
+        """Drop all recorded values."""
+        with self._lock:
+            self._values.clear()
+
+    def dump(self):
+        """
+        Copy the recorded values.
+
+        Returns:
+            dict: Label values tuple -> value, safe to serialize or merge
+        """
+        with self._lock:
+            return {label_values: self._copy(value) for label_values, value in self._values.items()}
+
+    def _copy(self, value):
+        return value
+
+    def merge(self, value, other):
+        """Combine the values two processes recorded for one label set."""
+        return value + other
+
+    def render(self, values=None):
+        """
+        Render the metric family.
+
+        Args:
+            values (dict, optional): Label values tuple -> value to render
+                instead of this process's own, e.g. from merge_processes()
+
+        Returns:
+            list: Lines of the text exposition format
+        """
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}'
+        ]
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.extend(self._samples(label_values, value))
+        return lines
+
+    def _samples(self, label_values, value):
+        return [f'{self.name}{self._labels(label_values)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set."""
+
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        """Add amount to the counter for these label values."""
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        """Current count for these label values."""
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+
+class Gauge(_Metric):
+    """
+    Value that can go up and down, per label set.
+
+    Across processes, only live processes count, and their values are
+    combined with max() or min() (see mode).
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), mode='max'):
+        """
+        Initialize the gauge.
+
+        Args:
+            name (str): Metric name, e.g. 'ml_model_ready'
+            documentation (str): HELP text
+            labelnames (tuple): Label names; values are passed positionally
+            mode (str): 'max' or 'min', how values of several processes
+                are combined
+        """
+        super().__init__(name, documentation, labelnames)
+        if mode not in ('max', 'min'):
+            raise ValueError(f"Unknown gauge mode: {mode}")
+        self.mode = mode
+
+    def merge(self, value, other):
+        return max(value, other) if self.mode == 'max' else min(value, other)
+
+    def set(self, value, *label_values):
+        """Set the gauge for these label values."""
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values over fixed buckets.
+
+    Per label set, keeps one count per bucket plus the sum; buckets are
+    made cumulative only when rendered.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Initialize the histogram.
+
+        Args:
+            name (str): Metric name, e.g. 'ml_stage_duration_seconds'
+            documentation (str): HELP text
+            labelnames (tuple): Label names; values are passed positionally
+            buckets (tuple): Increasing upper bounds; +Inf is implied
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        """Record one observation for these label values."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def snapshot(self, *label_values):
+        """
+        Count and sum for these label values.
+
+        Returns:
+            tuple: (count, sum)
+        """
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                return 0, 0.0
+            return sum(state[0]), state[1]
+
+    def _copy(self, state):
+        return [list(state[0]), state[1]]
+
+    def merge(self, state, other):
+        return [[a + b for a, b in zip(state[0], other[0])], state[1] + other[1]]
+
+    def _samples(self, label_values, state):
+        counts, total = state
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else _format_value(float(bound))
+            lines.append(f'{self.name}_bucket{self._labels(label_values, [("le", le)])} {cumulative}')
+        labels = self._labels(label_values)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+REQUESTS = Counter('ml_requests_total', 'HTTP requests served.', ('endpoint', 'method'))
+ERRORS = Counter('ml_request_errors_total', 'HTTP responses with a 4xx or 5xx status.', ('endpoint', 'status'))
+REQUEST_SECONDS = Histogram(
+    'ml_request_duration_seconds',
+    'Time from request start to response headers.',
+    ('endpoint',)
+)
+STAGE_SECONDS = Histogram(
+    'ml_stage_duration_seconds',
+    'Time spent in each stage of request processing.',
+    ('stage',)
+)
+ANALYSIS_BATCH_SIZE = Histogram(
+    'ml_analysis_batch_size',
+    'Images per analyzer call.',
+    ('endpoint',),
+    buckets=BATCH_BUCKETS
+)
+FORWARD_BATCH_SIZE = Histogram(
+    'ml_forward_batch_size',
+    'Images per model forward pass, after micro-batching.',
+    buckets=BATCH_BUCKETS
+)
+FORWARD_BUCKET_SECONDS = Histogram(
+    'ml_forward_bucket_duration_seconds',
+    'Forward pass time per padded batch-size bucket.',
+    ('bucket',)
+)
+FORWARD_PADDING_ROWS = Counter(
+    'ml_forward_padding_rows_total',
+    'Zero rows added to reach a batch-size bucket.',
+    ('bucket',)
+)
+CACHE_LOOKUPS = Counter('ml_cache_lookups_total', 'Result cache lookups.', ('endpoint', 'result'))
+STARTUP_SECONDS = Gauge('ml_startup_seconds', 'Time spent in each start-up phase.', ('phase',))
+# Ready only once every worker is
+MODEL_READY = Gauge('ml_model_ready', 'Whether the model has finished warming up.', mode='min')
+
+REGISTRY = (
+    REQUESTS, ERRORS, REQUEST_SECONDS, STAGE_SECONDS, ANALYSIS_BATCH_SIZE,
+    FORWARD_BATCH_SIZE, FORWARD_BUCKET_SECONDS, FORWARD_PADDING_ROWS,
+    CACHE_LOOKUPS, STARTUP_SECONDS, MODEL_READY
+)
+
+
+class _StageTimer:
+    """Context manager that records its duration under one stage."""
+
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, self.stage)
+        return False
+
+
+class _NullTimer:
+    """Stand-in for _StageTimer when metrics are disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(stage):
+    """
+    Time a block as one stage of request processing.
+
+    Args:
+        stage (str): Stage label, e.g. 'decode' or 'forward'
+
+    Returns:
+        Context manager recording into ml_stage_duration_seconds
+    """
+    return _StageTimer(stage) if ENABLED else _NULL_TIMER
+
+
+def set_endpoint(endpoint):
+    """Label metrics recorded in this context with the serving endpoint."""
+    _endpoint.set(endpoint)
+
+
+def current_endpoint():
+    """The endpoint serving the current request ('none' outside a request)."""
+    return _endpoint.get()
+
+
+def record_request(endpoint, method, status, seconds):
+    """
+    Record one served request.
+
+    Args:
+        endpoint (str): Route path, or 'unmatched'
+        method (str): HTTP method
+        status (int): Response status code
+        seconds (float): Time to response headers
+    """
+    REQUESTS.inc(endpoint, method)
+    REQUEST_SECONDS.observe(seconds, endpoint)
+    if status >= 400:
+        ERRORS.inc(endpoint, str(status))
+
+
+def record_startup(timings, ready):
+    """
+    Publish start-up phase timings and readiness.
+
+    Args:
+        timings (dict): Phase name ('build_ms', ...) -> milliseconds
+        ready (bool): Whether the model is ready
+    """
+    for phase, ms in timings.items():
+        STARTUP_SECONDS.set(ms / 1000.0, phase[:-3] if phase.endswith('_ms') else phase)
+    MODEL_READY.set(1 if ready else 0)
+
+
+def _alive(pid):
+    """Whether a process with this pid exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _SnapshotWriter:
+    """Writes this process's values to its file in MULTIPROCESS_DIR."""
+
+    def __init__(self, directory):
+        # The start time keeps a reused pid from overwriting an exited process's file
+        self.path = os.path.join(directory, f'metrics-{os.getpid()}-{time.time_ns()}.json')
+        self._last = None
+        self._lock = threading.Lock()
+
+    def write(self):
+        """Replace the file with the current values, if any changed."""
+        dumps = {metric.name: metric.dump() for metric in REGISTRY}
+        if not any(dumps.values()):
+            return
+        text = json.dumps({
+            'pid': os.getpid(),
+            'metrics': {
+                name: [[list(label_values), value] for label_values, value in values.items()]
+                for name, values in dumps.items()
+            }
+        })
+        with self._lock:
+            if text == self._last:
+                return
+            # Readers see the old or the new file, never a partial one
+            temporary = self.path + '.tmp'
+            with open(temporary, 'w') as f:
+                f.write(text)
+            os.replace(temporary, self.path)
+            self._last = text
+
+    def run(self):
+        """Write every FLUSH_SECONDS (daemon thread target)."""
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Warning: could not write metrics to {self.path}: {e}")
+
+
+_writer = None
+
+
+def enable_multiprocess(directory):
+    """
+    Share this process's values with the other processes using directory.
+
+    Called at import when ML_METRICS_DIR is set.
+
+    Args:
+        directory (str): Directory shared by the processes of a container
+    """
+    global _writer
+    os.makedirs(directory, exist_ok=True)
+    _writer = _SnapshotWriter(directory)
+    threading.Thread(target=_writer.run, name='metrics-writer', daemon=True).start()
+
+
+def _after_fork():
+    """Give a forked child its own (empty) values and file."""
+    for metric in REGISTRY:
+        metric._lock = threading.Lock()
+        metric._values.clear()
+    if _writer is not None:
+        enable_multiprocess(os.path.dirname(_writer.path))
+
+
+# Counters and histograms of exited processes, and the file guarding it
+AGGREGATE_FILE = 'aggregate.json'
+LOCK_FILE = 'aggregate.lock'
+
+
+def _merge_samples(values, metric, samples):
+    """Merge serialized [label values, value] samples into values."""
+    for label_values, value in samples:
+        label_values = tuple(label_values)
+        if label_values in values:
+            value = metric.merge(values[label_values], value)
+        values[label_values] = value
+
+
+def _fold_exited(directory, by_name, own):
+    """
+    Fold the files of exited processes into the aggregate file.
+
+    Gauges of exited processes are dropped. The aggregate records which
+    files it has absorbed until they are deleted, so a fold interrupted
+    before the deletes never counts a file twice. Callers hold LOCK_FILE.
+
+    Args:
+        directory (str): Directory passed to enable_multiprocess()
+        by_name (dict): Metric name -> metric
+        own (str): This process's file, never folded
+
+    Returns:
+        dict: Metric name -> {label values tuple: value} of exited processes
+    """
+    path = os.path.join(directory, AGGREGATE_FILE)
+    try:
+        with open(path) as f:
+            aggregate = json.load(f)
+    except FileNotFoundError:
+        aggregate = {'folded': [], 'metrics': {}}
+    except (OSError, ValueError) as e:
+        print(f"Warning: discarding unreadable metrics aggregate {path}: {e}")
+        aggregate = {'folded': [], 'metrics': {}}
+
+    totals = {}
+    for name, samples in aggregate['metrics'].items():
+        if name in by_name:
+            _merge_samples(totals.setdefault(name, {}), by_name[name], samples)
+
+    # Names of deleted files need not be remembered any longer
+    folded = {name for name in aggregate['folded'] if os.path.exists(os.path.join(directory, name))}
+    changed = len(folded) != len(aggregate['folded'])
+    exited = [os.path.join(directory, name) for name in folded]
+
+    for file in glob.glob(os.path.join(directory, 'metrics-*.json')):
+        name = os.path.basename(file)
+        if file == own or name in folded:
+            continue
+        try:
+            with open(file) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if _alive(snapshot['pid']):
+            continue
+        for metric_name, samples in snapshot['metrics'].items():
+            metric = by_name.get(metric_name)
+            if metric is not None and metric.kind != 'gauge':
+                _merge_samples(totals.setdefault(metric_name, {}), metric, samples)
+        folded.add(name)
+        exited.append(file)
+        changed = True
+
+    if changed:
+        text = json.dumps({
+            'folded': sorted(folded),
+            'metrics': {
+                name: [[list(label_values), value] for label_values, value in values.items()]
+                for name, values in totals.items()
+            }
+        })
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as f:
+            f.write(text)
+        os.replace(temporary, path)
+
+    for file in exited:
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+    return totals
+
+
+def merge_processes(directory):
+    """
+    Combine this process's values with those other processes wrote.
+
+    Counters and histograms are summed over all processes, including
+    exited ones (whose files are first folded into AGGREGATE_FILE);
+    gauges only over live processes. Processes merging at the same time
+    take turns on LOCK_FILE.
+
+    Args:
+        directory (str): Directory passed to enable_multiprocess()
+
+    Returns:
+        dict: Metric name -> {label values tuple: value}
+    """
+    merged = {metric.name: metric.dump() for metric in REGISTRY}
+    by_name = {metric.name: metric for metric in REGISTRY}
+    own = _writer.path if _writer is not None else None
+
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        for name, values in _fold_exited(directory, by_name, own).items():
+            for label_values, value in values.items():
+                if label_values in merged[name]:
+                    value = by_name[name].merge(merged[name][label_values], value)
+                merged[name][label_values] = value
+
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _alive(snapshot['pid'])
+            for name, samples in snapshot['metrics'].items():
+                metric = by_name.get(name)
+                if metric is None or (metric.kind == 'gauge' and not alive):
+                    continue
+                _merge_samples(merged[name], metric, samples)
+    return merged
+
+
+def render():
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    With ML_METRICS_DIR set, values are those of all processes sharing it.
+
+    Returns:
+        str: Exposition text ending in a newline
+    """
+    merged = merge_processes(os.path.dirname(_writer.path)) if _writer is not None else {}
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(merged.get(metric.name)))
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Clear all recorded values (for tests)."""
+    for metric in REGISTRY:
+        metric.clear()
+
+
+def _write_at_exit():
+    """Write the last values of an exiting process."""
+    if _writer is not None:
+        try:
+            _writer.write()
+        except OSError:
+            pass
+
+
+if MULTIPROCESS_DIR:
+    enable_multiprocess(MULTIPROCESS_DIR)
+atexit.register(_write_at_exit)
+os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,189 @@
+"""
+Dynamic micro-batching for model inference
+
+Request threads submit preprocessed tensors to a shared scheduler. A single
+worker thread collects them until either the batch is full or the oldest
+request has waited long enough, runs one forward pass for the whole group
+and resolves each caller's future with its own slice of the outputs.
+"""
+
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class MicroBatchScheduler:
+    """
+    Groups concurrent inference requests into shared forward passes.
+
+    Under bursty load many small requests become one larger batch, which
+    costs close to a single forward pass. Latency stays bounded because no
+    request waits in the queue longer than max_wait_ms before its batch runs.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=5.0, max_queue=0):
+        """
+        Initialize and start the scheduler.
+
+        Args:
+            predict_fn (callable): Takes an (N, 224, 224, 3) batch and returns
+                a tuple of output arrays, each with N rows
+            max_batch_size (int): Maximum number of images per forward pass
+            max_wait_ms (float): Maximum time the first request of a batch
+                waits for others to join
+            max_queue (int): Maximum requests waiting to be collected;
+                submit() blocks while the queue is full. 0 means unbounded.
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_queue < 0:
+            raise ValueError("max_queue must not be negative")
+
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = None
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(
+            target=self._run,
+            name='micro-batch-scheduler',
+            daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, batch):
+        """
+        Queue a preprocessed batch for inference.
+
+        Blocks while the queue is full (see max_queue).
+
+        Args:
+            batch (np.ndarray): Preprocessed images (N, 224, 224, 3)
+
+        Returns:
+            concurrent.futures.Future: Resolves to (outputs, queue_wait_ms),
+                where outputs is a tuple of arrays holding this request's N rows
+        """
+        if self._stopped.is_set():
+            raise RuntimeError("Scheduler has been stopped")
+
+        future = Future()
+        self._queue.put((batch, future, time.perf_counter()))
+        return future
+
+    def predict(self, batch, timeout=None):
+        """
+        Submit a batch and block until its outputs are ready.
+
+        Args:
+            batch (np.ndarray): Preprocessed images (N, 224, 224, 3)
+            timeout (float, optional): Seconds to wait for the result
+
+        Returns:
+            tuple: (outputs, queue_wait_ms)
+        """
+        return self.submit(batch).result(timeout=timeout)
+
+    def stop(self):
+        """Stop the worker thread once queued requests have been served."""
+        self._stopped.set()
+        self._queue.put(None)
+        self._worker.join()
+
+    def _next_request(self, timeout=None):
+        """Take the carried-over request, or the next one from the queue."""
+        if self._pending is not None:
+            request, self._pending = self._pending, None
+            return request
+        if timeout is None:
+            return self._queue.get()
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        """
+        Collect the next group of requests to run together.
+
+        Returns:
+            list: (batch, future, enqueued_at) tuples, or None when stopping
+        """
+        first = self._next_request()
+        if first is None:
+            return None
+
+        requests = [first]
+        size = len(first[0])
+        deadline = first[2] + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._next_request(timeout=remaining)
+            except queue.Empty:
+                break
+
+            if request is None:
+                # Stop signal: serve what we have, then exit on the next pass
+                self._queue.put(None)
+                break
+
+            if size + len(request[0]) > self.max_batch_size:
+                # Doesn't fit; it opens the next batch instead
+                self._pending = request
+                break
+
+            requests.append(request)
+            size += len(request[0])
+
+        return requests
+
+    def _run(self):
+        """Worker loop: collect, run one forward pass, resolve futures."""
+        while True:
+            requests = self._collect()
+            if requests is None:
+                return
+
+            started = time.perf_counter()
+            futures = [future for _, future, _ in requests]
+
+            try:
+                batch = np.concatenate([batch for batch, _, _ in requests], axis=0)
+                outputs = self.predict_fn(batch)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_batch, future, enqueued_at in requests:
+                rows = slice(offset, offset + len(request_batch))
+                offset += len(request_batch)
+                queue_wait_ms = (started - enqueued_at) * 1000
+                future.set_result((tuple(output[rows] for output in outputs), queue_wait_ms))
+
+
+def warmup_batch_sizes(max_batch_size):
+    """
+    Batch sizes to warm up: single photos, comparisons, and powers of two
+    up to the largest batch the service forms.
+
+    Args:
+        max_batch_size (int): Largest micro-batch or batch-analyze size
+
+    Returns:
+        tuple: Sorted batch sizes
+    """
+    sizes = {1, 2}
+    size = 4
+    while size <= max_batch_size:
+        sizes.add(size)
+        size *= 2
+    sizes.add(max_batch_size)
+    return tuple(sorted(sizes))
@@ -0,0 +1,424 @@
+"""
+Shared model server for all HTTP workers of a container
+
+Under gunicorn every worker process used to build its own model, so each
+one carried a full TensorFlow runtime (about 500MB before the first
+weight) and its own CPU-sized thread pools. With the model server, one
+process owns the model and the HTTP workers stay light: they decode,
+preprocess, cache and score as before, and send only the finished
+(N, 224, 224, 3) float32 batches over a Unix socket. The server's
+micro-batching scheduler merges batches from all workers into shared
+forward passes.
+
+Wire format, one request per round trip on a persistent connection:
+    request:  uint32 rows, then rows * 224 * 224 * 3 float32 values
+    response: uint8 status, uint32 length, then length bytes: on status 0
+              the (body_fat, muscle, posture) outputs as (3, rows)
+              float32 values; otherwise a UTF-8 error message
+A request of 0 rows asks for the server's model version, returned as
+UTF-8 with status 0; workers key their stored outputs by it.
+
+Usage (gunicorn.conf.py starts it automatically with ML_MODEL_SERVER=true):
+    cd ml-service
+    python -m src.modelServer --socket /tmp/ml-model.sock
+    ML_ENGINE=remote ML_ENGINE_PATH=/tmp/ml-model.sock gunicorn src.app:app
+
+The server builds its engine from MODEL_PATH, ML_ENGINE and ML_ENGINE_PATH
+like get_analyzer(), after sizing TensorFlow's thread pools from the
+container's CPU quota.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from src.microBatcher import MicroBatchScheduler, warmup_batch_sizes
+
+DEFAULT_SOCKET = '/tmp/ml-model.sock'
+
+REQUEST_HEADER = struct.Struct('!I')
+RESPONSE_HEADER = struct.Struct('!BI')
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# Largest batch one request may carry (about 600MB of float32 input)
+MAX_ROWS = 1024
+
+
+def _recv_exact(sock, buffer):
+    """Fill a writable buffer from a socket, or raise ConnectionError on EOF."""
+    view = memoryview(buffer).cast('B')
+    while view:
+        received = sock.recv_into(view)
+        if not received:
+            raise ConnectionError("Connection closed by peer")
+        view = view[received:]
+
+
+class ModelServer:
+    """
+    Serves forward passes to local clients over a Unix socket.
+
+    Each connection gets a thread that reads batches and submits them to
+    one MicroBatchScheduler, so concurrent requests from every worker
+    share forward passes.
+    """
+
+    def __init__(self, predict_fn, socket_path=DEFAULT_SOCKET, img_size=(224, 224),
+                 max_batch_size=8, max_wait_ms=5.0, model_version=''):
+        """
+        Initialize the server (call start() or serve_forever() to listen).
+
+        Args:
+            predict_fn (callable): Takes an (N, 224, 224, 3) batch and returns
+                (body_fat, muscle, posture) arrays with N rows each
+            socket_path (str): Unix socket to listen on
+            img_size (tuple): Model input size (height, width)
+            max_batch_size (int): Maximum number of images per forward pass
+            max_wait_ms (float): Maximum time a request waits for others to join
+            model_version (str): Version of the served model, reported to clients
+        """
+        self.socket_path = socket_path
+        self.img_size = img_size
+        self.model_version = model_version
+        self.scheduler = MicroBatchScheduler(
+            predict_fn,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms
+        )
+        self._listener = None
+        self._acceptor = None
+        self._stopped = threading.Event()
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Bind the socket and accept connections in a background thread.
+
+        Returns:
+            ModelServer: self
+        """
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self._listener.listen(64)
+        # Wake up regularly so stop() is noticed
+        self._listener.settimeout(0.5)
+
+        self._acceptor = threading.Thread(target=self._accept_loop, name='model-server', daemon=True)
+        self._acceptor.start()
+        return self
+
+    def serve_forever(self):
+        """Start (if needed) and block until stop() is called."""
+        if self._acceptor is None:
+            self.start()
+        self._acceptor.join()
+
+    def stop(self):
+        """
+        Stop accepting connections, close open ones, drain the scheduler and
+        remove the socket. Clients reconnect to the next server on the path.
+        """
+        self._stopped.set()
+        if self._acceptor is not None:
+            self._acceptor.join()
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.scheduler.stop()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def _accept_loop(self):
+        """Accept connections until stopped."""
+        with self._listener:
+            while not self._stopped.is_set():
+                try:
+                    conn, _ = self._listener.accept()
+                except socket.timeout:
+                    continue
+                conn.settimeout(None)
+                with self._lock:
+                    self._connections.add(conn)
+                threading.Thread(target=self._serve, args=(conn,), name='model-conn', daemon=True).start()
+
+    def _serve(self, conn):
+        """Answer requests on one connection until the client disconnects."""
+        try:
+            self._answer(conn)
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+            conn.close()
+
+    def _answer(self, conn):
+        """Request loop of _serve(); returns when the connection ends."""
+        height, width = self.img_size
+        header = bytearray(REQUEST_HEADER.size)
+
+        while True:
+            try:
+                _recv_exact(conn, header)
+            except OSError:
+                return
+            rows, = REQUEST_HEADER.unpack(header)
+            if rows == 0:
+                try:
+                    self._send(conn, STATUS_OK, self.model_version.encode())
+                except OSError:
+                    return
+                continue
+            if rows > MAX_ROWS:
+                self._send(conn, STATUS_ERROR, f"Batch of {rows} rows not accepted".encode())
+                return
+
+            batch = np.empty((rows, height, width, 3), dtype=np.float32)
+            try:
+                _recv_exact(conn, batch)
+            except OSError:
+                return
+
+            try:
+                outputs, _ = self.scheduler.predict(batch)
+                payload = np.stack([
+                    np.asarray(output, dtype=np.float32).reshape(rows) for output in outputs
+                ]).tobytes()
+                status = STATUS_OK
+            except Exception as e:
+                payload = str(e).encode()
+                status = STATUS_ERROR
+
+            try:
+                self._send(conn, status, payload)
+            except OSError:
+                return
+
+    @staticmethod
+    def _send(conn, status, payload):
+        conn.sendall(RESPONSE_HEADER.pack(status, len(payload)) + payload)
+
+
+class RemoteEngine:
+    """
+    Inference engine that forwards batches to a ModelServer.
+
+    Implements the engine interface of src.inferenceEngines, so the
+    analyzer (caching, micro-batching, scoring) works unchanged. Each
+    thread keeps one persistent connection; a request that finds its
+    connection broken, e.g. after a server restart, is retried once on a
+    new one (forward passes have no side effects). The restarted server
+    may serve other weights, so its model version is asked for again.
+    """
+
+    name = 'remote'
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, img_size=(224, 224), timeout=120.0,
+                 startup_timeout=None):
+        """
+        Initialize the client; nothing connects until the first call.
+
+        Args:
+            socket_path (str): The model server's Unix socket
+            img_size (tuple): Model input size (height, width)
+            timeout (float): Seconds to wait for one forward pass
+            startup_timeout (float, optional): Seconds warmup() waits for the
+                server to come up; ML_MODEL_SERVER_TIMEOUT (default 300) when None
+        """
+        self.socket_path = socket_path
+        self.img_size = img_size
+        self.timeout = timeout
+        if startup_timeout is None:
+            startup_timeout = float(os.environ.get('ML_MODEL_SERVER_TIMEOUT', '300'))
+        self.startup_timeout = startup_timeout
+        self._local = threading.local()
+        self.warmed_up = False
+        self.warmed_batch_sizes = set()
+        self._model_version = None
+
+    @property
+    def model_version(self):
+        """str: The served model's version, asked of the server once per connection loss."""
+        if self._model_version is None:
+            status, payload = self._request(REQUEST_HEADER.pack(0))
+            if status != STATUS_OK:
+                raise RuntimeError(f"Model server error: {payload.decode(errors='replace')}")
+            self._model_version = payload.decode()
+        return self._model_version
+
+    def ping(self, timeout=2.0):
+        """
+        Check that the server is up and answering.
+
+        Uses a new short-lived connection, so a thread's persistent one is
+        left alone and a hung server costs at most timeout seconds. The
+        answer refreshes model_version, so a server restarted with other
+        weights is noticed even while every request hits the cache.
+
+        Args:
+            timeout (float): Seconds to wait for the answer
+
+        Returns:
+            bool: Whether the server answered a version query
+        """
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+                conn.settimeout(timeout)
+                conn.connect(self.socket_path)
+                conn.sendall(REQUEST_HEADER.pack(0))
+                header = bytearray(RESPONSE_HEADER.size)
+                _recv_exact(conn, header)
+                status, length = RESPONSE_HEADER.unpack(header)
+                payload = bytearray(length)
+                _recv_exact(conn, payload)
+        except OSError:
+            return False
+        if status != STATUS_OK:
+            return False
+        self._model_version = payload.decode()
+        return True
+
+    def warmup(self, batch_sizes=(1,)):
+        """
+        Wait for the server to accept connections and run one round trip.
+
+        The server warms up its own engine before it starts listening, so
+        one single-image request is enough to check the whole path.
+
+        Args:
+            batch_sizes (iterable): Batch sizes to mark as warm
+        """
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            try:
+                self._connection()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Model server at {self.socket_path} did not come up")
+                time.sleep(0.2)
+
+        self.predict(np.zeros((1, self.img_size[0], self.img_size[1], 3), dtype=np.float32))
+        self.warmed_batch_sizes.update(batch_sizes)
+        self.warmed_up = True
+
+    def predict(self, batch):
+        """
+        Run the model on a preprocessed batch in the server process.
+
+        Args:
+            batch (np.ndarray): Preprocessed images (N, 224, 224, 3)
+
+        Returns:
+            tuple: (body_fat, muscle, posture) numpy arrays, each of shape (N, 1)
+        """
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        rows = len(batch)
+
+        status, payload = self._request(REQUEST_HEADER.pack(rows), memoryview(batch).cast('B'))
+        if status != STATUS_OK:
+            raise RuntimeError(f"Model server error: {payload.decode(errors='replace')}")
+
+        outputs = np.frombuffer(payload, dtype=np.float32).reshape(3, rows, 1)
+        return outputs[0], outputs[1], outputs[2]
+
+    def _request(self, *parts):
+        """Round trip, retried once on a new connection if this one broke."""
+        for attempt in range(2):
+            try:
+                return self._round_trip(parts)
+            except OSError:
+                self._close()
+                # A restarted server may serve other weights
+                self._model_version = None
+                if attempt:
+                    raise
+
+    def _round_trip(self, parts):
+        """Send one request and read the response on this thread's connection."""
+        conn = self._connection()
+        for part in parts:
+            conn.sendall(part)
+
+        header = bytearray(RESPONSE_HEADER.size)
+        _recv_exact(conn, header)
+        status, length = RESPONSE_HEADER.unpack(header)
+        payload = bytearray(length)
+        _recv_exact(conn, payload)
+        return status, payload
+
+    def _connection(self):
+        """The calling thread's connection, opened on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(self.timeout)
+            try:
+                conn.connect(self.socket_path)
+            except OSError:
+                conn.close()
+                raise
+            self._local.conn = conn
+        return conn
+
+    def _close(self):
+        """Drop the calling thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve forward passes to local HTTP workers")
+    parser.add_argument('--socket', default=os.environ.get('ML_MODEL_SOCKET', DEFAULT_SOCKET),
+                        help="Unix socket to listen on")
+    parser.add_argument('--max-batch-size', type=int,
+                        default=int(os.environ.get('ML_MAX_BATCH_SIZE', '8')))
+    parser.add_argument('--max-wait-ms', type=float,
+                        default=float(os.environ.get('ML_MAX_BATCH_WAIT_MS', '5')))
+    args = parser.parse_args()
+
+    if os.environ.get('ML_ENGINE') == 'remote':
+        parser.error("The model server needs a local engine (ML_ENGINE=keras or tflite-*)")
+
+    from src.photoAnalyzer import get_analyzer
+
+    analyzer = get_analyzer()
+    # Batch-analyze sends up to 10 photos in one request
+    analyzer.warmup(warmup_batch_sizes(max(args.max_batch_size, 10)))
+
+    server = ModelServer(
+        analyzer.engine.predict,
+        socket_path=args.socket,
+        img_size=analyzer.img_size,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        model_version=analyzer.model_version
+    )
+    signal.signal(signal.SIGTERM, lambda *_: server._stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: server._stopped.set())
+
+    server.start()
+    print(f"Model server ({analyzer.engine.name}) listening on {args.socket}; "
+          f"startup (ms): {dict((phase, round(value, 1)) for phase, value in analyzer.startup_timings.items())}")
+    server.serve_forever()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
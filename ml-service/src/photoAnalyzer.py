@@ -9,17 +9,247 @@ Features:
 - Muscle definition scoring
 - Posture analysis
 - Progress comparison between photos
+- Progress timelines over a user's photo history
+
+TensorFlow is imported only where a model is built or loaded, so HTTP
+workers using the remote engine (see src.modelServer) never load it.
 """
 
-import tensorflow as tf
-from tensorflow.keras.applications import MobileNetV2
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
-from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout
 import numpy as np
 from PIL import Image
 import cv2
+import io
+import math
 import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from src.metrics import (
+    ANALYSIS_BATCH_SIZE, CACHE_LOOKUPS, FORWARD_BATCH_SIZE, STAGE_SECONDS, current_endpoint, timed
+)
+from src.analysisStore import AnalysisStore
+from src.inferenceEngines import DEFAULT_BUCKETS, configure_threads, create_engine
+from src.microBatcher import MicroBatchScheduler
+from src.preprocessPool import PreprocessPool
+from src.progressTimeline import DEFAULT_SMOOTHING_DAYS, build_timeline, progress_delta
+from src.resultCache import AnalysisCache, content_key
+
+
+def _elapsed_ms(started):
+    """Milliseconds since a time.perf_counter() stamp, rounded."""
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def is_model_artifact(model_path):
+    """
+    Check whether a model path is a full-model .keras artifact.
+    
+    Args:
+        model_path (str, optional): MODEL_PATH value
+        
+    Returns:
+        bool: True for an existing .keras file, False for weights files
+    """
+    return bool(model_path) and model_path.endswith('.keras') and os.path.exists(model_path)
+
+
+def build_heads(features):
+    """
+    Add the trainable layers on top of pooled backbone features.
+    
+    Shared by the full model and the head-only training model of
+    src.trainHeads, so weights move between them by layer name.
+    
+    Args:
+        features: Keras tensor of pooled MobileNetV2 features (N, 1280)
+        
+    Returns:
+        list: (body_fat, muscle_score, posture_score) output tensors
+    """
+    from tensorflow.keras.layers import Dense, Dropout
+    
+    x = Dense(256, activation='relu', name='fc1')(features)
+    x = Dropout(0.3)(x)
+    x = Dense(128, activation='relu', name='fc2')(x)
+    x = Dropout(0.2)(x)
+    
+    # Multiple output heads for different metrics
+    body_fat_output = Dense(1, activation='sigmoid', name='body_fat')(x)
+    muscle_output = Dense(1, activation='sigmoid', name='muscle_score')(x)
+    posture_output = Dense(1, activation='sigmoid', name='posture_score')(x)
+    
+    return [body_fat_output, muscle_output, posture_output]
+
+
+def to_model_input(img, img_size=(224, 224)):
+    """
+    Resize an RGB PIL Image and apply MobileNetV2 preprocessing.
+    
+    Args:
+        img (PIL.Image.Image): RGB image
+        img_size (tuple): Model input size (width, height)
+        
+    Returns:
+        np.ndarray: Preprocessed image ready for model input (1, 224, 224, 3)
+    """
+    # Resize to model input size
+    with timed('resize'):
+        img = img.resize(img_size, Image.BICUBIC)
+        
+        # Convert to numpy array
+        img_array = np.array(img)
+    
+    # Add batch dimension
+    img_array = np.expand_dims(img_array, axis=0)
+    
+    # Apply MobileNetV2 preprocessing: scale to [-1, 1] in float32, the
+    # same in-place arithmetic as keras' preprocess_input
+    with timed('preprocess_input'):
+        img_array = img_array.astype(np.float32)
+        img_array /= 127.5
+        img_array -= 1.0
+        return img_array
+
+
+def normalize_metrics(metrics):
+    """
+    Check body metrics with the rules of app.parse_metrics(strict=True).
+    
+    Args:
+        metrics (dict, optional): 'weight', 'height', 'age', 'gender'
+        
+    Returns:
+        dict: The metrics with weight and height as floats and age as an
+            int; absent or empty values are None
+        
+    Raises:
+        ValueError: For a non-numeric or non-positive weight, height or
+            age, or a gender other than 'male' or 'female'
+    """
+    metrics = metrics or {}
+    normalized = {}
+    
+    for name, cast in (('weight', float), ('height', float), ('age', int)):
+        value = metrics.get(name)
+        if value is None or value == '':
+            normalized[name] = None
+            continue
+        try:
+            if isinstance(value, bool):
+                raise TypeError(name)
+            parsed = cast(value)
+        except (ValueError, TypeError):
+            raise ValueError(f"{name} must be a number")
+        if not (math.isfinite(parsed) and parsed > 0):
+            raise ValueError(f"{name} must be a positive number")
+        normalized[name] = parsed
+    
+    gender = metrics.get('gender')
+    if gender and (not isinstance(gender, str) or gender.lower() not in ('male', 'female')):
+        raise ValueError("gender must be 'male' or 'female'")
+    normalized['gender'] = gender.lower() if gender else None
+    
+    return normalized
+
+
+class DecodedImage:
+    """
+    One uploaded photo, decoded at most once per request and purpose.
+    
+    Holds the encoded bytes and lazily derives everything the analyzer
+    needs: the RGB image and model input tensor, decoded close to the model
+    input size, and the grayscale plane used for pose quality, decoded at
+    the quality resolution. When the model decode already has full
+    resolution (small or non-JPEG images), pose quality reuses it. Nothing
+    is decoded until a stage asks for it, so a cache hit on the content key
+    never decodes.
+    """
+    
+    def __init__(self, data, draft_size=None, quality_draft_size=None):
+        """
+        Wrap encoded image bytes.
+        
+        Args:
+            data (bytes): Encoded image file
+            draft_size (tuple, optional): Smallest acceptable decoded
+                (width, height) for the model; JPEGs are decoded in draft
+                mode down to it. None decodes at full resolution.
+            quality_draft_size (tuple, optional): The same for pose quality
+        """
+        self.data = data
+        self.draft_size = draft_size
+        self.quality_draft_size = quality_draft_size
+        self._key = None
+        self._image = None
+        self._full_resolution = False
+        self._quality_image = None
+        self._rgb = None
+        self._gray = None
+        self._model_inputs = {}
+    
+    @property
+    def key(self):
+        """str: Content key of the encoded bytes (see resultCache.content_key)."""
+        if self._key is None:
+            self._key = content_key(self.data)
+        return self._key
+    
+    def _decode(self, draft_size):
+        """Decode the bytes to RGB; returns (image, decoded at full resolution)."""
+        with timed('decode'):
+            img = Image.open(io.BytesIO(self.data))
+            full_size = img.size
+            if draft_size is not None:
+                img.draft('RGB', draft_size)
+            img = img.convert('RGB')
+        return img, img.size == full_size
+    
+    @property
+    def image(self):
+        """PIL.Image.Image: The decoded RGB image the model input is built from."""
+        if self._image is None:
+            self._image, self._full_resolution = self._decode(self.draft_size)
+        return self._image
+    
+    @property
+    def quality_image(self):
+        """PIL.Image.Image: The decoded RGB image pose quality is computed from."""
+        if self._quality_image is None:
+            if self.quality_draft_size == self.draft_size or (
+                    self._image is not None and self._full_resolution):
+                # A larger draft of a fully decoded image decodes the same pixels
+                self._quality_image = self.image
+            else:
+                self._quality_image, _ = self._decode(self.quality_draft_size)
+        return self._quality_image
+    
+    @property
+    def rgb(self):
+        """np.ndarray: (H, W, 3) uint8 RGB pixel buffer of the model image."""
+        if self._rgb is None:
+            self._rgb = np.asarray(self.image)
+        return self._rgb
+    
+    @property
+    def gray(self):
+        """np.ndarray: (H, W) uint8 grayscale plane of the quality image."""
+        if self._gray is None:
+            self._gray = cv2.cvtColor(np.asarray(self.quality_image), cv2.COLOR_RGB2GRAY)
+        return self._gray
+    
+    def model_input(self, img_size=(224, 224)):
+        """
+        Preprocessed model input for this image.
+        
+        Args:
+            img_size (tuple): Model input size (width, height)
+            
+        Returns:
+            np.ndarray: (1, 224, 224, 3) float32 tensor
+        """
+        if img_size not in self._model_inputs:
+            self._model_inputs[img_size] = to_model_input(self.image, img_size)
+        return self._model_inputs[img_size]
 
 
 class ProgressPhotoAnalyzer:
@@ -30,21 +260,500 @@ class ProgressPhotoAnalyzer:
     extracting features relevant to body composition analysis.
     """
     
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, fast_decode=True, quality_max_side=None,
+                 engine='keras', engine_path=None, batch_buckets=None, jit_compile=False,
+                 model_version=None):
         """
         Initialize the photo analyzer.
         
         Args:
-            model_path (str, optional): Path to pre-trained weights.
+            model_path (str, optional): Path to pre-trained weights, or to a
+                full-model .keras artifact from src.exportModel, which loads
+                without fetching ImageNet weights.
+            fast_decode (bool): Decode encoded JPEGs at reduced size using
+                DCT scaling (see _load_image)
+            quality_max_side (int, optional): Longest side pose quality is
+                computed at (see detect_pose_quality). None uses full resolution.
+            engine (str): Inference engine: 'keras', 'tflite-fp16', 'tflite-int8'
+                or 'remote'
+            engine_path (str, optional): .tflite artifact for the TFLite engines,
+                or the model server's socket for the remote engine
+            batch_buckets (iterable, optional): Fixed batch sizes forward passes
+                are padded to (see inferenceEngines.BucketedEngine). None runs
+                every batch at its own size.
+            jit_compile (bool): Compile the keras engine's forward pass with XLA
+            model_version (str, optional): Version stored outputs are keyed by;
+                derived from the engine's weights when None
         """
         self.img_size = (224, 224)
-        self.model = self._build_model()
+        self._pinned_version = model_version
+        self._model_version = model_version
+        self.fast_decode = fast_decode
+        self.quality_max_side = quality_max_side
+        self.model = None
+        
+        # Start-up cost per phase, in milliseconds
+        self.startup_timings = {'build_ms': 0.0, 'weight_load_ms': 0.0, 'warmup_ms': 0.0}
+        started = time.perf_counter()
         
-        if model_path and os.path.exists(model_path):
-            self.model.load_weights(model_path)
-            print(f"Loaded model weights from {model_path}")
+        if engine == 'keras' and is_model_artifact(model_path):
+            from tensorflow.keras.models import load_model
+            
+            # Architecture and weights come from one local file
+            self.model = load_model(model_path, compile=False)
+            self.startup_timings['weight_load_ms'] = _elapsed_ms(started)
+            print(f"Loaded model from {model_path}")
+        elif engine == 'keras':
+            self.model = self._build_model()
+            self.startup_timings['build_ms'] = _elapsed_ms(started)
+            
+            started = time.perf_counter()
+            if model_path and os.path.exists(model_path):
+                self.model.load_weights(model_path)
+                print(f"Loaded model weights from {model_path}")
+            else:
+                print("Using base MobileNetV2 features (no fine-tuned weights)")
+            self.startup_timings['weight_load_ms'] = _elapsed_ms(started)
         else:
-            print("Using base MobileNetV2 features (no fine-tuned weights)")
+            # Weights are baked into the exported artifact, or held by the model server
+            print(f"Using {engine} engine from {engine_path}")
+        
+        # Forward pass shared by single, comparison and batch analysis
+        started = time.perf_counter()
+        self.engine = create_engine(
+            engine,
+            model=self.model,
+            artifact_path=engine_path,
+            img_size=self.img_size,
+            buckets=batch_buckets,
+            jit_compile=jit_compile
+        )
+        self.startup_timings['build_ms'] += _elapsed_ms(started)
+        self.warmup()
+        
+        # Optional micro-batching scheduler (see enable_micro_batching)
+        self.scheduler = None
+        
+        # Completes submit_raw() requests off the scheduler's thread
+        self._completer = None
+        
+        # Optional process pool for decoding and preprocessing (see enable_preprocess_pool)
+        self.preprocess_pool = None
+        
+        # Optional raw-output cache (see enable_cache)
+        self.cache = None
+        
+        # Optional persistent raw-output store (see enable_store)
+        self.store = None
+    
+    @property
+    def model_version(self):
+        """str: Version of the model behind the engine (see inferenceEngines.weights_version)."""
+        return self.sync_model_version()
+    
+    def sync_model_version(self):
+        """
+        Follow a change of the engine's model version.
+        
+        A model server restarted with other weights reports a new version.
+        The store is then read and written under it and the cache, which
+        holds the previous model's outputs, is cleared. A version given to
+        the constructor is kept as is.
+        
+        Returns:
+            str: The current model version
+        """
+        if self._pinned_version is not None:
+            return self._pinned_version
+        version = self.engine.model_version
+        if version != self._model_version:
+            previous, self._model_version = self._model_version, version
+            if previous is not None:
+                print(f"Model version changed from {previous} to {version}")
+                if self.store is not None:
+                    self.store.model_version = version
+                if self.cache is not None:
+                    self.cache.clear()
+        return version
+    
+    def warmup(self, batch_sizes=(1,)):
+        """
+        Run warm-up forward passes so no request pays first-call costs.
+        
+        Args:
+            batch_sizes (iterable): Batch sizes to warm up
+            
+        Returns:
+            float: Time spent in this call, in milliseconds
+        """
+        started = time.perf_counter()
+        self.engine.warmup(batch_sizes)
+        elapsed = _elapsed_ms(started)
+        self.startup_timings['warmup_ms'] += elapsed
+        return elapsed
+    
+    def enable_cache(self, max_entries=4096, ttl_seconds=3600):
+        """
+        Cache raw model outputs by image content hash.
+        
+        Repeated photos then skip decoding, preprocessing and inference.
+        Body metrics are applied after the cache, so they never affect hits.
+        
+        Args:
+            max_entries (int): Maximum number of cached images
+            ttl_seconds (float): Entry lifetime, or None for no expiry
+            
+        Returns:
+            AnalysisCache: The active cache
+        """
+        self.cache = AnalysisCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        return self.cache
+    
+    def enable_store(self, path, max_entries=None, preload=True):
+        """
+        Persist raw model outputs and pose quality by image content hash.
+        
+        Checked after the in-memory cache, so photos analyzed before a
+        restart, or longer ago than the cache TTL, still skip inference.
+        Outputs are keyed by model_version as well, so those of another
+        model are never served. Enable the cache first to preload it.
+        
+        Args:
+            path (str): SQLite database file
+            max_entries (int, optional): Entries kept per table (least
+                recently used are evicted); None for no bound
+            preload (bool): Fill the in-memory cache with the most recently
+                used stored outputs
+            
+        Returns:
+            AnalysisStore: The active store
+        """
+        self.store = AnalysisStore(path, model_version=self.model_version, max_entries=max_entries)
+        
+        if preload and self.cache is not None:
+            started = time.perf_counter()
+            entries = self.store.recent(self.cache.max_entries)
+            # Oldest first, so the most recently used end up most recent in the LRU
+            for key, outputs in reversed(entries):
+                self.cache.put(key, outputs)
+            print(f"Preloaded {len(entries)} stored analyses in {_elapsed_ms(started)} ms")
+        
+        return self.store
+    
+    def enable_micro_batching(self, max_batch_size=8, max_wait_ms=5.0, max_queue=0):
+        """
+        Route all forward passes through a shared micro-batching scheduler.
+        
+        Concurrent callers (e.g. gunicorn threads) then share forward passes
+        instead of each running their own.
+        
+        Args:
+            max_batch_size (int): Maximum number of images per forward pass
+            max_wait_ms (float): Maximum time a request waits for others to join
+            max_queue (int): Maximum requests waiting for the model; submitting
+                beyond it blocks. 0 means unbounded.
+            
+        Returns:
+            MicroBatchScheduler: The active scheduler
+        """
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        self.scheduler = MicroBatchScheduler(
+            self._forward,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            max_queue=max_queue
+        )
+        if self._completer is None:
+            self._completer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='analysis-writer')
+        return self.scheduler
+    
+    def enable_preprocess_pool(self, workers=2, queue_size=16):
+        """
+        Decode and preprocess uploads in worker processes.
+        
+        Encoded images (bytes, or DecodedImages not yet decoded) are turned
+        into model inputs by the pool, off the GIL of the serving process,
+        while the scheduler runs forward passes on earlier batches. Paths,
+        PIL Images and arrays are still prepared in the calling thread.
+        
+        Args:
+            workers (int): Number of worker processes
+            queue_size (int): Images that may be in preparation or awaiting
+                inference at once (see src.preprocessPool)
+            
+        Returns:
+            PreprocessPool: The active pool
+        """
+        if self.preprocess_pool is not None:
+            self.preprocess_pool.close()
+        self.preprocess_pool = PreprocessPool(
+            workers=workers,
+            queue_size=queue_size,
+            img_size=self.img_size
+        )
+        return self.preprocess_pool
+    
+    def _run_model(self, batch):
+        """
+        Run the model on a preprocessed batch.
+        
+        Args:
+            batch (np.ndarray): Preprocessed images (N, 224, 224, 3)
+            
+        Returns:
+            tuple: ((body_fat, muscle, posture), queue_wait_ms), where
+                queue_wait_ms is None unless micro-batching is enabled
+        """
+        if self.scheduler is not None:
+            return self.scheduler.predict(batch)
+        return self._forward(batch), None
+    
+    def _forward(self, batch):
+        """
+        One timed forward pass of the inference engine.
+        
+        Args:
+            batch (np.ndarray): Preprocessed images (N, 224, 224, 3)
+            
+        Returns:
+            tuple: (body_fat, muscle, posture) output arrays
+        """
+        with timed('forward'):
+            outputs = self.engine.predict(batch)
+        FORWARD_BATCH_SIZE.observe(len(batch))
+        # Outputs are cached and stored under the version that produced them
+        self.sync_model_version()
+        return outputs
+    
+    def decode(self, data):
+        """
+        Wrap an upload in a DecodedImage shared by all stages of a request.
+        
+        The model input is always built from a decode close to the model
+        input size, so raw outputs (and their cache entries) do not depend
+        on whether pose quality is requested. Pose quality decodes at
+        quality_max_side (or native resolution when unset), only if asked.
+        
+        Args:
+            data (bytes): Encoded image file
+                
+        Returns:
+            DecodedImage: Lazily decoded image
+        """
+        if not self.fast_decode:
+            return DecodedImage(data)
+        quality_draft_size = (self.quality_max_side, self.quality_max_side) if self.quality_max_side else None
+        return DecodedImage(data, draft_size=self.img_size, quality_draft_size=quality_draft_size)
+    
+    def _pool_job(self, image_input):
+        """
+        Preprocess-pool job for an image, if the pool can prepare it.
+        
+        Returns:
+            tuple: (encoded bytes, draft_size), or None for inputs prepared
+                in-process (non-encoded inputs, or images already decoded)
+        """
+        if isinstance(image_input, DecodedImage):
+            if image_input._image is not None or self.img_size in image_input._model_inputs:
+                return None
+            return image_input.data, image_input.draft_size
+        if isinstance(image_input, (bytes, bytearray)):
+            return bytes(image_input), self.img_size if self.fast_decode else None
+        return None
+    
+    def _image_key(self, image_input):
+        """Content key for an image input (reused from a DecodedImage)."""
+        if isinstance(image_input, DecodedImage):
+            return image_input.key
+        return content_key(image_input)
+    
+    def _lookup(self, key):
+        """
+        Raw outputs for a content key from the cache, then the store.
+        
+        Store hits are copied into the cache.
+        
+        Returns:
+            tuple: (raw outputs or None, 'hit', 'store_hit' or 'miss')
+        """
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached, 'hit'
+        
+        if self.store is not None:
+            stored = self.store.get(key)
+            if stored is not None:
+                if self.cache is not None:
+                    self.cache.put(key, stored)
+                return stored, 'store_hit'
+        
+        return None, 'miss'
+    
+    def raw_for_image_id(self, image_id):
+        """
+        _infer_raw() entry for a previously analyzed image.
+        
+        Args:
+            image_id (str): image_id returned by an earlier analysis
+            
+        Returns:
+            tuple or KeyError: ((body_fat, muscle, posture), None, image_id), or
+                a KeyError if the image is not (or no longer) cached or stored
+        """
+        raw, _ = self._lookup(image_id)
+        if raw is None:
+            return KeyError(image_id)
+        return raw, None, image_id
+    
+    def _infer_raw(self, image_inputs):
+        """
+        Produce raw head outputs for each image with one forward pass.
+        
+        Cached images are answered from the cache without being decoded; the
+        rest are preprocessed one by one and run as a single batch.
+        
+        Args:
+            image_inputs (list): Images (DecodedImage, bytes, path, PIL Image, or numpy array)
+            
+        Returns:
+            list: Per input, either ((body_fat, muscle, posture), queue_wait_ms, image_id)
+                or the exception raised while loading that image. image_id is
+                the content key, or None when the cache is disabled
+        """
+        pending = self._prepare_raw(image_inputs)
+        batch = pending[2]
+        
+        if batch:
+            # One forward pass for the whole batch
+            outputs, queue_wait_ms = self._run_model(np.concatenate(batch, axis=0))
+            return self._complete_raw(pending, outputs, queue_wait_ms)
+        
+        return pending[0]
+    
+    def submit_raw(self, image_inputs):
+        """
+        Non-blocking variant of _infer_raw() for async servers.
+        
+        Cache lookups and preprocessing run in the calling thread; the
+        forward pass is queued on the micro-batching scheduler, so no
+        thread waits on the model. Cache and store writes, and resolving
+        the returned future, happen on a separate writer thread, keeping
+        the scheduler's thread free for forward passes. Without a scheduler
+        the forward pass runs inline and the future is already done.
+        
+        Args:
+            image_inputs (list): Images (DecodedImage, bytes, path, PIL Image, or numpy array)
+            
+        Returns:
+            concurrent.futures.Future: Resolves to the _infer_raw() result list
+        """
+        result = Future()
+        
+        if self.scheduler is None:
+            try:
+                result.set_result(self._infer_raw(image_inputs))
+            except Exception as e:
+                result.set_exception(e)
+            return result
+        
+        pending = self._prepare_raw(image_inputs)
+        batch = pending[2]
+        if not batch:
+            result.set_result(pending[0])
+            return result
+        
+        def complete(forward):
+            try:
+                outputs, queue_wait_ms = forward.result()
+                result.set_result(self._complete_raw(pending, outputs, queue_wait_ms))
+            except Exception as e:
+                result.set_exception(e)
+        
+        # Done callbacks run on the scheduler's thread; only hand over from there
+        self.scheduler.submit(np.concatenate(batch, axis=0)).add_done_callback(
+            lambda forward: self._completer.submit(complete, forward)
+        )
+        return result
+    
+    def _prepare_raw(self, image_inputs):
+        """
+        Answer cached images and preprocess the rest (first half of _infer_raw).
+        
+        Returns:
+            tuple: (results, keys, batch, batch_indices)
+        """
+        results = [None] * len(image_inputs)
+        keys = [None] * len(image_inputs)
+        batch = []
+        batch_indices = []
+        endpoint = current_endpoint()
+        ANALYSIS_BATCH_SIZE.observe(len(image_inputs), endpoint)
+        
+        tensors = {}
+        pooled = []
+        
+        # Preprocess each image independently so one bad file can't sink the batch
+        for idx, image_input in enumerate(image_inputs):
+            try:
+                if self.cache is not None or self.store is not None:
+                    keys[idx] = self._image_key(image_input)
+                    cached, lookup = self._lookup(keys[idx])
+                    CACHE_LOOKUPS.inc(endpoint, lookup)
+                    if cached is not None:
+                        results[idx] = (cached, None, keys[idx])
+                        continue
+                
+                job = self._pool_job(image_input) if self.preprocess_pool is not None else None
+                if job is not None:
+                    pooled.append((idx, job))
+                else:
+                    tensors[idx] = self.preprocess_image(image_input)
+            except Exception as e:
+                results[idx] = e
+        
+        # Encoded images are prepared in parallel by the worker processes
+        if pooled:
+            prepared = self.preprocess_pool.preprocess_many([job for _, job in pooled])
+            for (idx, _), tensor in zip(pooled, prepared):
+                if isinstance(tensor, Exception):
+                    results[idx] = tensor
+                    continue
+                if isinstance(image_inputs[idx], DecodedImage):
+                    image_inputs[idx]._model_inputs[self.img_size] = tensor
+                tensors[idx] = tensor
+        
+        for idx in sorted(tensors):
+            batch.append(tensors[idx])
+            batch_indices.append(idx)
+        
+        return results, keys, batch, batch_indices
+    
+    def _complete_raw(self, pending, outputs, queue_wait_ms):
+        """
+        Fan forward-pass outputs back out (second half of _infer_raw).
+        
+        Returns:
+            list: The _infer_raw() result list
+        """
+        results, keys, _, batch_indices = pending
+        body_fat_raw, muscle_raw, posture_raw = outputs
+        if queue_wait_ms is not None:
+            STAGE_SECONDS.observe(queue_wait_ms / 1000.0, 'queue_wait')
+        
+        # Fan the outputs back out to their original positions
+        for row, idx in enumerate(batch_indices):
+            raw = (body_fat_raw[row][0], muscle_raw[row][0], posture_raw[row][0])
+            if self.cache is not None:
+                self.cache.put(keys[idx], raw)
+            results[idx] = (raw, queue_wait_ms, keys[idx])
+        
+        if self.store is not None:
+            with timed('store_write'):
+                self.store.put_many([(keys[idx], results[idx][0]) for idx in batch_indices])
+        
+        return results
     
     def _build_model(self):
         """
@@ -58,6 +767,10 @@ class ProgressPhotoAnalyzer:
         Returns:
             tf.keras.Model: Compiled model ready for inference
         """
+        from tensorflow.keras.applications import MobileNetV2
+        from tensorflow.keras.layers import GlobalAveragePooling2D
+        from tensorflow.keras.models import Model
+        
         # Load pre-trained MobileNetV2 (ImageNet weights)
         base_model = MobileNetV2(
             input_shape=(224, 224, 3),
@@ -71,20 +784,11 @@ class ProgressPhotoAnalyzer:
         # Build custom head for body composition analysis
         x = base_model.output
         x = GlobalAveragePooling2D()(x)
-        x = Dense(256, activation='relu', name='fc1')(x)
-        x = Dropout(0.3)(x)
-        x = Dense(128, activation='relu', name='fc2')(x)
-        x = Dropout(0.2)(x)
-        
-        # Multiple output heads for different metrics
-        body_fat_output = Dense(1, activation='sigmoid', name='body_fat')(x)
-        muscle_output = Dense(1, activation='sigmoid', name='muscle_score')(x)
-        posture_output = Dense(1, activation='sigmoid', name='posture_score')(x)
         
         # Create model
         model = Model(
             inputs=base_model.input,
-            outputs=[body_fat_output, muscle_output, posture_output]
+            outputs=build_heads(x)
         )
         
         return model
@@ -94,41 +798,68 @@ class ProgressPhotoAnalyzer:
         Preprocess image for model inference.
         
         Args:
-            image_input: Can be file path (str), PIL Image, or numpy array
+            image_input: Can be DecodedImage, encoded image bytes, file path (str),
+                PIL Image, or numpy array
             
         Returns:
             np.ndarray: Preprocessed image ready for model input (1, 224, 224, 3)
         """
-        # Load image based on input type
-        if isinstance(image_input, str):
-            img = Image.open(image_input).convert('RGB')
-        elif isinstance(image_input, Image.Image):
-            img = image_input.convert('RGB')
-        elif isinstance(image_input, np.ndarray):
-            img = Image.fromarray(image_input).convert('RGB')
-        else:
-            raise ValueError("Invalid image input type")
+        # Shared per-request decode: derive (and keep) the tensor from it
+        if isinstance(image_input, DecodedImage):
+            return image_input.model_input(self.img_size)
         
-        # Resize to model input size
-        img = img.resize(self.img_size)
+        # Load image based on input type, decoding JPEGs close to 224px
+        img = self._load_image(
+            image_input,
+            draft_size=self.img_size if self.fast_decode else None
+        )
         
-        # Convert to numpy array
-        img_array = np.array(img)
+        return to_model_input(img, self.img_size)
+    
+    def _load_image(self, image_input, draft_size=None):
+        """
+        Load an image input as an RGB PIL Image.
         
-        # Add batch dimension
-        img_array = np.expand_dims(img_array, axis=0)
+        With draft_size set, encoded JPEGs (bytes or file paths) are decoded
+        in draft mode: libjpeg scales by 1/2, 1/4 or 1/8 inside the DCT, so a
+        12MP photo never materializes at full resolution. The result is still
+        at least draft_size in both dimensions. Caller-owned PIL Images are
+        never put in draft mode.
         
-        # Apply MobileNetV2 preprocessing
-        img_array = preprocess_input(img_array)
+        Args:
+            image_input: DecodedImage, encoded image bytes, file path (str),
+                PIL Image, or numpy array
+            draft_size (tuple, optional): Smallest acceptable (width, height)
+            
+        Returns:
+            PIL.Image.Image: RGB image
+        """
+        if isinstance(image_input, DecodedImage):
+            return image_input.image
+        elif isinstance(image_input, (bytes, bytearray)):
+            img = Image.open(io.BytesIO(image_input))
+        elif isinstance(image_input, str):
+            img = Image.open(image_input)
+        elif isinstance(image_input, Image.Image):
+            return image_input.convert('RGB')
+        elif isinstance(image_input, np.ndarray):
+            return Image.fromarray(image_input).convert('RGB')
+        else:
+            raise ValueError("Invalid image input type")
         
-        return img_array
+        with timed('decode'):
+            if draft_size is not None:
+                img.draft('RGB', draft_size)
+            
+            return img.convert('RGB')
     
     def analyze_photo(self, image_input, weight=None, height=None, age=None, gender='male'):
         """
         Perform comprehensive analysis on a progress photo.
         
         Args:
-            image_input: Image to analyze (path, PIL Image, or numpy array)
+            image_input: Image to analyze (DecodedImage, encoded bytes, path, PIL Image,
+                or numpy array)
             weight: Weight in kg (optional)
             height: Height in cm (optional)
             age: Age in years (optional, default 25)
@@ -142,19 +873,265 @@ class ProgressPhotoAnalyzer:
                 - overall_score: Combined fitness score (0-100)
                 - confidence: Model confidence (0-1)
                 - bmi: Calculated BMI (if weight/height provided)
+                - image_id: Content key for rescore() (if caching is enabled)
+                - queue_wait_ms: Time spent waiting for a shared forward
+                  pass (if micro-batching is enabled)
+        """
+        # Raw head outputs (from the cache or a forward pass)
+        entry = self._infer_raw([image_input])[0]
+        if isinstance(entry, Exception):
+            raise entry
+        
+        return self._analysis_from_entry(entry, {
+            'weight': weight,
+            'height': height,
+            'age': age,
+            'gender': gender
+        })
+    
+    def analyze_visual(self, image_input):
+        """
+        Visual stage: run (or look up) the model for one image.
+        
+        The raw head outputs are cached under the image's content key so the
+        scoring stage can be re-run later without the pixels.
+        
+        Args:
+            image_input: Image to analyze (DecodedImage, encoded bytes, path, PIL Image,
+                or numpy array)
+            
+        Returns:
+            dict: Raw visual outputs:
+                - image_id: Content key of the image (None if caching is disabled)
+                - body_fat: Body fat head output (0-1)
+                - muscle: Muscle head output (0-1)
+                - posture: Posture head output (0-1)
+        """
+        entry = self._infer_raw([image_input])[0]
+        if isinstance(entry, Exception):
+            raise entry
+        (body_fat_raw, muscle_raw, posture_raw), _, image_id = entry
+        
+        return {
+            'image_id': image_id,
+            'body_fat': body_fat_raw,
+            'muscle': muscle_raw,
+            'posture': posture_raw
+        }
+    
+    def score_visual(self, visual, weight=None, height=None, age=None, gender='male'):
+        """
+        Scoring stage: apply body metrics to stored visual outputs.
+        
+        Pure arithmetic; never touches the model.
+        
+        Args:
+            visual (dict): Output of analyze_visual()
+            weight: Weight in kg (optional)
+            height: Height in cm (optional)
+            age: Age in years (optional, default 25)
+            gender: 'male' or 'female' (default 'male')
+            
+        Returns:
+            dict: Analysis results (see analyze_photo)
+        """
+        with timed('scoring'):
+            result = self._build_analysis(
+                visual['body_fat'],
+                visual['muscle'],
+                visual['posture'],
+                weight=weight,
+                height=height,
+                age=age,
+                gender=gender
+            )
+        
+        if visual.get('image_id') is not None:
+            result['image_id'] = visual['image_id']
+        
+        return result
+    
+    def rescore(self, image_id, weight=None, height=None, age=None, gender='male'):
+        """
+        Re-score a previously analyzed image with new body metrics.
+        
+        Args:
+            image_id (str): image_id returned by an earlier analysis
+            weight: Weight in kg (optional)
+            height: Height in cm (optional)
+            age: Age in years (optional, default 25)
+            gender: 'male' or 'female' (default 'male')
+            
+        Returns:
+            dict: Analysis results (see analyze_photo)
+            
+        Raises:
+            KeyError: If the image is not (or no longer) cached or stored
         """
-        # Preprocess image
-        processed_img = self.preprocess_image(image_input)
+        entry = self.raw_for_image_id(image_id)
+        if isinstance(entry, Exception):
+            raise entry
         
-        # Run inference for visual analysis
-        body_fat_raw, muscle_raw, posture_raw = self.model.predict(
-            processed_img, 
-            verbose=0
+        body_fat_raw, muscle_raw, posture_raw = entry[0]
+        return self.score_visual(
+            {
+                'image_id': image_id,
+                'body_fat': body_fat_raw,
+                'muscle': muscle_raw,
+                'posture': posture_raw
+            },
+            weight=weight,
+            height=height,
+            age=age,
+            gender=gender
         )
+    
+    def analyze_photos(self, image_inputs, metrics=None):
+        """
+        Analyze several progress photos with a single forward pass.
+        
+        Every image is preprocessed on its own, the valid ones are stacked
+        into one (N, 224, 224, 3) batch and the model runs once. A photo that
+        fails to load or preprocess only fails its own entry.
+        
+        Args:
+            image_inputs (list): Images to analyze (DecodedImages, bytes, paths, PIL Images,
+                or numpy arrays)
+            metrics (dict or list, optional): Body metrics ('weight', 'height',
+                'age', 'gender') applied to every photo, or a list with one
+                dict (or None) per photo
+                
+        Returns:
+            list: One entry per input, in input order:
+                - {'index': int, 'success': True, 'analysis': dict}
+                - {'index': int, 'success': False, 'error': str}
+        """
+        return self.analyses_from_raw(self._infer_raw(list(image_inputs)), metrics)
+    
+    def analyses_from_raw(self, raw_results, metrics=None):
+        """
+        Score _infer_raw() / submit_raw() results (see analyze_photos).
+        
+        Args:
+            raw_results (list): Raw entries or exceptions, one per photo
+            metrics (dict or list, optional): Body metrics for every photo,
+                or a list with one dict (or None) per photo
+                
+        Returns:
+            list: One analyze_photos() entry per photo
+        """
+        if metrics is None or isinstance(metrics, dict):
+            metrics = [metrics] * len(raw_results)
+        elif len(metrics) != len(raw_results):
+            raise ValueError("metrics must have one entry per image")
+        
+        # Malformed metrics fail only their own photo
+        errors = {idx: entry for idx, entry in enumerate(raw_results) if isinstance(entry, Exception)}
+        normalized = {}
+        for idx in range(len(raw_results)):
+            if idx in errors:
+                continue
+            try:
+                normalized[idx] = normalize_metrics(metrics[idx])
+            except (TypeError, ValueError) as e:
+                errors[idx] = e
+        
+        # Score every other photo in one vectorized pass
+        analyses = dict(zip(normalized, self._analyses_from_entries(
+            [raw_results[idx] for idx in normalized],
+            list(normalized.values())
+        )))
+        
+        results = []
+        
+        for idx in range(len(raw_results)):
+            if idx in errors:
+                results.append({'index': idx, 'success': False, 'error': str(errors[idx])})
+            else:
+                results.append({'index': idx, 'success': True, 'analysis': analyses[idx]})
+        
+        return results
+    
+    def _analysis_from_entry(self, entry, metrics=None):
+        """
+        Score one _infer_raw() entry with optional body metrics.
+        
+        Args:
+            entry (tuple): ((body_fat, muscle, posture), queue_wait_ms, image_id)
+            metrics (dict, optional): 'weight', 'height', 'age', 'gender'
+            
+        Returns:
+            dict: Analysis results (see analyze_photo)
+        """
+        (body_fat_raw, muscle_raw, posture_raw), queue_wait_ms, image_id = entry
+        metrics = metrics or {}
+        
+        with timed('scoring'):
+            analysis = self._build_analysis(
+                body_fat_raw,
+                muscle_raw,
+                posture_raw,
+                weight=metrics.get('weight'),
+                height=metrics.get('height'),
+                age=metrics.get('age'),
+                gender=metrics.get('gender') or 'male'
+            )
+        
+        if image_id is not None:
+            analysis['image_id'] = image_id
+        if queue_wait_ms is not None:
+            analysis['queue_wait_ms'] = round(queue_wait_ms, 2)
+        
+        return analysis
+    
+    def _analyses_from_entries(self, entries, metrics):
+        """
+        Score several _infer_raw() entries at once.
+        
+        Vectorized _analysis_from_entry(): same results, one NumPy pass.
         
+        Args:
+            entries (list): ((body_fat, muscle, posture), queue_wait_ms, image_id)
+                tuples
+            metrics (list): Body metrics dict (or None) per entry
+            
+        Returns:
+            list: Analysis results (see analyze_photo), one per entry
+        """
+        with timed('scoring'):
+            analyses = self._build_analyses(
+                [entry[0] for entry in entries],
+                [entry_metrics or {} for entry_metrics in metrics]
+            )
+        
+        for analysis, (_, queue_wait_ms, image_id) in zip(analyses, entries):
+            if image_id is not None:
+                analysis['image_id'] = image_id
+            if queue_wait_ms is not None:
+                analysis['queue_wait_ms'] = round(queue_wait_ms, 2)
+        
+        return analyses
+    
+    def _build_analysis(self, body_fat_raw, muscle_raw, posture_raw,
+                        weight=None, height=None, age=None, gender='male'):
+        """
+        Turn raw model outputs for one image into an analysis result.
+        
+        Args:
+            body_fat_raw (float): Body fat head output (0-1)
+            muscle_raw (float): Muscle head output (0-1)
+            posture_raw (float): Posture head output (0-1)
+            weight: Weight in kg (optional)
+            height: Height in cm (optional)
+            age: Age in years (optional, default 25)
+            gender: 'male' or 'female' (default 'male')
+            
+        Returns:
+            dict: Analysis results (see analyze_photo)
+        """
         # Convert raw outputs to scores (0-100 scale)
-        muscle_score = float(muscle_raw[0][0] * 100)
-        posture_score = float(posture_raw[0][0] * 100)
+        muscle_score = float(muscle_raw) * 100
+        posture_score = float(posture_raw) * 100
         
         # Calculate body fat estimate
         if weight and height:
@@ -164,7 +1141,7 @@ class ProgressPhotoAnalyzer:
             )
         else:
             # Fallback to visual-only (less accurate)
-            body_fat_estimate = float(body_fat_raw[0][0] * 100)
+            body_fat_estimate = float(body_fat_raw) * 100
             bmi = None
         
         # Calculate overall progress score
@@ -177,9 +1154,9 @@ class ProgressPhotoAnalyzer:
         
         # Calculate confidence based on variance in predictions
         confidence = self._calculate_confidence(
-            body_fat_raw[0][0], 
-            muscle_raw[0][0], 
-            posture_raw[0][0]
+            body_fat_raw, 
+            muscle_raw, 
+            posture_raw
         )
         
         result = {
@@ -197,45 +1174,175 @@ class ProgressPhotoAnalyzer:
         
         return result
     
-    def compare_photos(self, photo1_input, photo2_input):
+    def _build_analyses(self, raw_outputs, metrics):
+        """
+        Vectorized _build_analysis() for a batch of images.
+        
+        Args:
+            raw_outputs (list): (body_fat, muscle, posture) head outputs per image
+            metrics (list): Body metrics dict ('weight', 'height', 'age',
+                'gender') per image
+                
+        Returns:
+            list: Analysis results (see analyze_photo), one per image
+        """
+        outputs = np.asarray(raw_outputs, dtype=np.float64).reshape(-1, 3)
+        
+        # Convert raw outputs to scores (0-100 scale)
+        scores = outputs * 100
+        muscle_score = scores[:, 1]
+        posture_score = scores[:, 2]
+        
+        # Hybrid body fat for rows with weight and height, visual-only otherwise
+        hybrid = np.array([bool(m.get('weight') and m.get('height')) for m in metrics], dtype=bool)
+        body_fat_estimate = scores[:, 0].copy()
+        bmi = np.zeros(len(outputs))
+        if hybrid.any():
+            hybrid_metrics = [m for m, is_hybrid in zip(metrics, hybrid) if is_hybrid]
+            body_fat_estimate[hybrid], bmi[hybrid] = self._calculate_hybrid_body_fat_batch(
+                np.array([m['weight'] for m in hybrid_metrics], dtype=np.float64),
+                np.array([m['height'] for m in hybrid_metrics], dtype=np.float64),
+                np.array([m.get('age') or 25 for m in hybrid_metrics], dtype=np.float64),
+                np.array([(m.get('gender') or 'male').lower() == 'male' for m in hybrid_metrics]),
+                muscle_score[hybrid]
+            )
+        
+        overall_score = (
+            muscle_score * 0.4 + 
+            posture_score * 0.3 + 
+            (100 - body_fat_estimate) * 0.3
+        )
+        # Confidence is a NumPy value in the scalar version too, so NumPy
+        # rounding matches; the other scores are Python floats there and
+        # keep Python's round(), which differs in rare halfway cases
+        confidence = np.round(self._calculate_confidence_batch(outputs), 3).tolist()
+        
+        results = []
+        for is_hybrid, body_fat, muscle, posture, overall, row_confidence, row_bmi in zip(
+            hybrid.tolist(), body_fat_estimate.tolist(), muscle_score.tolist(),
+            posture_score.tolist(), overall_score.tolist(), confidence, bmi.tolist()
+        ):
+            result = {
+                'body_fat_estimate': round(body_fat, 2),
+                'muscle_score': round(muscle, 2),
+                'posture_score': round(posture, 2),
+                'overall_score': round(overall, 2),
+                'confidence': row_confidence,
+                'analysis_version': '2.0',
+                'model_type': 'Hybrid BMI + Visual AI' if is_hybrid else 'MobileNetV2-Visual'
+            }
+            if is_hybrid and row_bmi:
+                result['bmi'] = round(row_bmi, 2)
+            results.append(result)
+        
+        return results
+    
+    def compare_photos(self, photo1_input, photo2_input, before_metrics=None, after_metrics=None):
         """
         Compare two progress photos to show improvement.
         
+        Both photos are preprocessed and run through the model as a single
+        batch of two.
+        
         Args:
             photo1_input: First photo (earlier date)
             photo2_input: Second photo (later date)
+            before_metrics (dict, optional): Body metrics ('weight', 'height',
+                'age', 'gender') at the time of the first photo
+            after_metrics (dict, optional): Body metrics at the time of the
+                second photo
+            
+        Returns:
+            dict: Comparison results with delta metrics
+        """
+        # One forward pass for both photos
+        return self.comparison_from_raw(
+            self._infer_raw([photo1_input, photo2_input]),
+            before_metrics,
+            after_metrics
+        )
+    
+    def comparison_from_raw(self, raw_results, before_metrics=None, after_metrics=None):
+        """
+        Build a compare_photos() result from two raw entries.
+        
+        Args:
+            raw_results (list): _infer_raw() / submit_raw() results for
+                the first and second photo
+            before_metrics (dict, optional): Body metrics for the first photo
+            after_metrics (dict, optional): Body metrics for the second photo
             
         Returns:
             dict: Comparison results with delta metrics
         """
-        # Analyze both photos
-        analysis1 = self.analyze_photo(photo1_input)
-        analysis2 = self.analyze_photo(photo2_input)
+        entries = raw_results
+        for entry in entries:
+            if isinstance(entry, Exception):
+                raise entry
+        
+        analysis1, analysis2 = self._analyses_from_entries(entries[:2], [before_metrics, after_metrics])
         
         # Calculate deltas
         return {
             'before': analysis1,
             'after': analysis2,
-            'improvements': {
-                'body_fat_change': round(
-                    analysis1['body_fat_estimate'] - analysis2['body_fat_estimate'], 
-                    2
-                ),
-                'muscle_gain': round(
-                    analysis2['muscle_score'] - analysis1['muscle_score'], 
-                    2
-                ),
-                'posture_improvement': round(
-                    analysis2['posture_score'] - analysis1['posture_score'], 
-                    2
-                ),
-                'overall_progress': round(
-                    analysis2['overall_score'] - analysis1['overall_score'], 
-                    2
-                )
-            }
+            'improvements': progress_delta(analysis1, analysis2)
         }
     
+    def analyze_timeline(self, items, smoothing_days=DEFAULT_SMOOTHING_DAYS):
+        """
+        Build a progress timeline over a user's photo history.
+        
+        Photos given by image_id are looked up in the cache and store;
+        uploaded photos not seen before run through the model together in
+        one forward pass. Adding one new photo to a long history therefore
+        costs a single inference.
+        
+        Args:
+            items (list): One dict per photo with:
+                - 'date': datetime.date or datetime.datetime
+                - 'image': Image input, or 'image_id' from an earlier analysis
+                - 'metrics' (optional): Body metrics at the time of the photo
+            smoothing_days (float): Half-life of the trend smoothing, in days
+            
+        Returns:
+            dict: Timeline (see progressTimeline.build_timeline)
+        """
+        photos = [item['image'] for item in items if item.get('image_id') is None]
+        return self.timeline_from_raw(items, self._infer_raw(photos) if photos else [], smoothing_days)
+    
+    def timeline_from_raw(self, items, photo_results, smoothing_days=DEFAULT_SMOOTHING_DAYS):
+        """
+        Build a timeline from the raw results of its uploaded photos.
+        
+        Args:
+            items (list): analyze_timeline() items
+            photo_results (list): _infer_raw() / submit_raw() results for the
+                items with an 'image', in order
+            smoothing_days (float): Half-life of the trend smoothing, in days
+            
+        Returns:
+            dict: Timeline (see progressTimeline.build_timeline)
+        """
+        photo_results = iter(photo_results)
+        raw_results = []
+        for item in items:
+            if item.get('image_id') is None:
+                raw_results.append(next(photo_results))
+                continue
+            
+            entry = self.raw_for_image_id(item['image_id'])
+            if isinstance(entry, KeyError):
+                message = f"Unknown or expired image_id: {item['image_id']}"
+                if self.store is None:
+                    # Without a shared store, ids of other workers are never found
+                    message += " (no persistent store; only this process's cache was searched)"
+                entry = LookupError(message)
+            raw_results.append(entry)
+        
+        results = self.analyses_from_raw(raw_results, [item.get('metrics') for item in items])
+        return build_timeline([item['date'] for item in items], results, smoothing_days)
+    
     def _calculate_confidence(self, body_fat, muscle, posture):
         """
         Calculate model confidence based on output variance.
@@ -251,7 +1358,7 @@ class ProgressPhotoAnalyzer:
             float: Confidence score (0-1)
         """
         # Calculate variance
-        predictions = [body_fat, muscle, posture]
+        predictions = [float(body_fat), float(muscle), float(posture)]
         variance = np.var(predictions)
         
         # Convert variance to confidence (inverse relationship)
@@ -260,6 +1367,21 @@ class ProgressPhotoAnalyzer:
         
         return max(0.5, confidence)  # Minimum 50% confidence
     
+    def _calculate_confidence_batch(self, outputs):
+        """
+        Vectorized _calculate_confidence() over rows of head outputs.
+        
+        Args:
+            outputs (np.ndarray): (N, 3) body fat, muscle and posture outputs
+            
+        Returns:
+            np.ndarray: Confidence per row (0.5-1)
+        """
+        variance = np.var(outputs, axis=1)
+        confidence = 1.0 - np.minimum(variance * 4, 0.5)
+        
+        return np.maximum(0.5, confidence)
+    
     def _calculate_hybrid_body_fat(self, weight_kg, height_cm, age, gender, muscle_score):
         """
         Calculate body fat percentage using hybrid approach:
@@ -315,7 +1437,38 @@ class ProgressPhotoAnalyzer:
         
         return final_body_fat, bmi
     
-    def detect_pose_quality(self, image_input):
+    def _calculate_hybrid_body_fat_batch(self, weight_kg, height_cm, age, is_male, muscle_score):
+        """
+        Vectorized _calculate_hybrid_body_fat() over arrays of body metrics.
+        
+        Args:
+            weight_kg (np.ndarray): Weights in kilograms
+            height_cm (np.ndarray): Heights in centimeters
+            age (np.ndarray): Ages in years
+            is_male (np.ndarray): Boolean gender flags
+            muscle_score (np.ndarray): Visual muscle definition scores (0-100)
+            
+        Returns:
+            tuple: (body_fat_percentage array, bmi array)
+        """
+        height_m = height_cm / 100.0
+        bmi = weight_kg / np.square(height_m)
+        
+        base_body_fat = (1.20 * bmi) + (0.23 * age) - (10.8 * is_male.astype(np.float64)) - 5.4
+        base_body_fat = np.clip(base_body_fat, 3, 50)
+        
+        # Same three muscle-score ranges as the scalar version
+        visual_adjustment = np.select(
+            [muscle_score >= 70, muscle_score <= 40],
+            [-((muscle_score - 70) / 30.0) * 8.0, ((40 - muscle_score) / 40.0) * 6.0],
+            default=((55 - muscle_score) / 15.0) * 2.0
+        )
+        
+        adjusted_body_fat = base_body_fat + (visual_adjustment * 0.3)
+        
+        return np.clip(adjusted_body_fat, 3, 45), bmi
+    
+    def detect_pose_quality(self, image_input, max_side=None):
         """
         Analyze photo pose quality using edge detection.
         
@@ -324,32 +1477,56 @@ class ProgressPhotoAnalyzer:
         - Good lighting
         - Proper framing
         
+        When max_side (or quality_max_side) is set, the grayscale plane is
+        downsampled with area interpolation so its longest side is at most
+        max_side before edge detection. Equivalence tolerance against the
+        full-resolution scores, for max_side >= 1024:
+        - brightness: 0.1 points
+        - contrast: 0.5 points
+        - edge_clarity: 2.0 points (Canny edge density is scale-dependent)
+        - quality_score: 1.0 point
+        max_side=None reproduces the full-resolution scores exactly.
+        
         Args:
-            image_input: Image to analyze
+            image_input: Image to analyze (DecodedImage, encoded bytes, path,
+                PIL Image, or BGR numpy array)
+            max_side (int, optional): Analysis resolution for this call;
+                defaults to quality_max_side
             
         Returns:
             dict: Pose quality metrics
         """
-        # Load and convert image
-        if isinstance(image_input, str):
-            img = cv2.imread(image_input)
-        elif isinstance(image_input, Image.Image):
-            img = cv2.cvtColor(np.array(image_input), cv2.COLOR_RGB2BGR)
-        else:
-            img = image_input
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        max_side = max_side or self.quality_max_side
         
-        # Edge detection
-        edges = cv2.Canny(gray, 50, 150)
-        edge_density = np.sum(edges > 0) / edges.size
+        # Stored metrics skip the decode and edge detection entirely
+        key = None
+        if self.store is not None and isinstance(image_input, (DecodedImage, bytes, bytearray, str)):
+            key = self._image_key(image_input)
+            # A JPEG decoded in draft mode has fewer pixels to detect edges in
+            draft_size = self._quality_draft_size(image_input, max_side)
+            decode = 'full' if draft_size is None else 'draft-{}x{}'.format(*draft_size)
+            stored = self.store.get_quality(key, max_side, decode)
+            if stored is not None:
+                return stored
         
-        # Brightness analysis
-        brightness = np.mean(gray) / 255.0
-        
-        # Contrast analysis
-        contrast = np.std(gray) / 128.0
+        quality = self._pose_quality(image_input, max_side)
+        if key is not None:
+            self.store.put_quality(key, quality, max_side, decode)
+        return quality
+    
+    def _pose_quality(self, image_input, max_side):
+        """Compute detect_pose_quality() metrics."""
+        with timed('pose_quality'):
+            gray = self._quality_plane(image_input, max_side)
+            
+            # Edge detection; count edge pixels without a boolean temp array
+            edges = cv2.Canny(gray, 50, 150)
+            edge_density = cv2.countNonZero(edges) / edges.size
+            
+            # Brightness and contrast in one fused pass over the plane
+            mean, std = cv2.meanStdDev(gray)
+        brightness = float(mean[0][0]) / 255.0
+        contrast = float(std[0][0]) / 128.0
         
         # Calculate quality score
         edge_clarity_score = edge_density * 100
@@ -365,6 +1542,85 @@ class ProgressPhotoAnalyzer:
                 2
             )
         }
+    
+    def detect_pose_quality_batch(self, image_inputs, max_side=None):
+        """
+        Analyze pose quality for many photos.
+        
+        Args:
+            image_inputs (list): Images to analyze (see detect_pose_quality)
+            max_side (int, optional): Analysis resolution; defaults to quality_max_side
+            
+        Returns:
+            list: One entry per input, in input order:
+                - {'index': int, 'success': True, 'quality': dict}
+                - {'index': int, 'success': False, 'error': str}
+        """
+        results = []
+        
+        for idx, image_input in enumerate(image_inputs):
+            try:
+                quality = self.detect_pose_quality(image_input, max_side=max_side)
+                results.append({'index': idx, 'success': True, 'quality': quality})
+            except Exception as e:
+                results.append({'index': idx, 'success': False, 'error': str(e)})
+        
+        return results
+    
+    def _quality_draft_size(self, image_input, max_side):
+        """
+        JPEG draft size _quality_plane() decodes image_input at.
+        
+        Returns:
+            tuple: Smallest acceptable (width, height), or None for a full decode
+        """
+        if isinstance(image_input, DecodedImage):
+            return image_input.quality_draft_size
+        if isinstance(image_input, (bytes, bytearray)) and max_side and self.fast_decode:
+            return (max_side, max_side)
+        return None
+    
+    def _quality_plane(self, image_input, max_side=None):
+        """
+        Load the grayscale plane for pose quality, bounded to max_side.
+        
+        Args:
+            image_input: Image to analyze (see detect_pose_quality)
+            max_side (int, optional): Longest allowed side in pixels
+            
+        Returns:
+            np.ndarray: (H, W) uint8 grayscale image
+        """
+        if isinstance(image_input, DecodedImage):
+            # Reuses the request's single decode; RGB -> gray directly
+            gray = image_input.gray
+        else:
+            if isinstance(image_input, (bytes, bytearray)):
+                image_input = self._load_image(
+                    image_input,
+                    draft_size=self._quality_draft_size(image_input, max_side)
+                )
+            
+            if isinstance(image_input, str):
+                img = cv2.imread(image_input)
+                if img is None:
+                    raise FileNotFoundError(f"Could not read image: {image_input}")
+                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            elif isinstance(image_input, Image.Image):
+                gray = cv2.cvtColor(np.asarray(image_input.convert('RGB')), cv2.COLOR_RGB2GRAY)
+            else:
+                gray = cv2.cvtColor(image_input, cv2.COLOR_BGR2GRAY)
+        
+        height, width = gray.shape[:2]
+        if max_side and max(height, width) > max_side:
+            scale = max_side / max(height, width)
+            gray = cv2.resize(
+                gray,
+                (max(1, round(width * scale)), max(1, round(height * scale))),
+                interpolation=cv2.INTER_AREA
+            )
+        
+        return gray
 
 
 # Singleton instance for reuse
@@ -374,10 +1630,28 @@ def get_analyzer():
     """
     Get or create singleton analyzer instance.
     
+    Configured from MODEL_PATH, ML_ENGINE, ML_ENGINE_PATH, ML_BATCH_BUCKETS
+    (comma-separated, empty to disable), ML_XLA and ML_MODEL_VERSION.
+    Local engines size TensorFlow's thread pools from the container's CPU
+    quota first.
+    
     Returns:
         ProgressPhotoAnalyzer: Shared analyzer instance
     """
     global _analyzer_instance
     if _analyzer_instance is None:
-        _analyzer_instance = ProgressPhotoAnalyzer()
+        engine = os.environ.get('ML_ENGINE', 'keras')
+        if engine != 'remote':
+            configure_threads()
+        _analyzer_instance = ProgressPhotoAnalyzer(
+            model_path=os.environ.get('MODEL_PATH'),
+            engine=engine,
+            engine_path=os.environ.get('ML_ENGINE_PATH'),
+            batch_buckets=tuple(
+                int(size) for size in os.environ.get('ML_BATCH_BUCKETS', ','.join(map(str, DEFAULT_BUCKETS))).split(',')
+                if size.strip()
+            ),
+            jit_compile=os.environ.get('ML_XLA', 'false').lower() == 'true',
+            model_version=os.environ.get('ML_MODEL_VERSION') or None
+        )
     return _analyzer_instance
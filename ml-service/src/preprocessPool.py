@@ -0,0 +1,229 @@
+"""
+Process pool for CPU-bound image preparation
+
+Decoding, resizing and scaling an upload holds the GIL for most of its
+run, so request threads preparing photos side by side take turns on one
+core while the model waits. The pool moves that work into worker
+processes: each one decodes an encoded image and writes the finished
+(1, 224, 224, 3) float32 model input straight into a slot of a shared
+memory block, so tensors never pass through pickling on their way back.
+
+The number of slots bounds the queue between the stages. A request takes
+a free slot before submitting an image and hands it back once the tensor
+is copied into its batch, so at most `queue_size` images are being
+prepared or waiting to be collected, and a burst of uploads blocks at the
+front of the pipeline instead of piling up decoded tensors in memory.
+
+Workers import only numpy and Pillow (never TensorFlow) and are started
+with the 'spawn' method, which is safe from a process that already runs
+TensorFlow threads.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+import collections
+import io
+import queue
+import time
+import weakref
+
+import numpy as np
+from PIL import Image
+
+from src.metrics import ENABLED as METRICS_ENABLED, STAGE_SECONDS, timed
+
+# The worker's view of the parent's shared memory block
+_shm = None
+
+
+def _attach(name):
+    """Worker initializer: map the parent's shared memory block."""
+    global _shm
+    _shm = shared_memory.SharedMemory(name=name)
+
+
+def _ping():
+    """No-op task used to start all workers up front."""
+    return True
+
+
+def _preprocess_into(slot, data, draft_size, img_size):
+    """
+    Decode an image and write its model input into a shared memory slot.
+
+    Runs in a worker process. The arithmetic matches to_model_input() in
+    src.photoAnalyzer (bicubic resize, then MobileNetV2's float32 scaling
+    to [-1, 1]), so tensors are identical to in-process preprocessing.
+
+    Args:
+        slot (int): Slot index in the shared memory block
+        data (bytes): Encoded image file
+        draft_size (tuple, optional): Smallest acceptable decoded (width, height)
+        img_size (tuple): Model input size (width, height)
+
+    Returns:
+        dict: Seconds spent per stage ('decode', 'resize', 'preprocess_input')
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    img = Image.open(io.BytesIO(data))
+    if draft_size is not None:
+        img.draft('RGB', draft_size)
+    img = img.convert('RGB')
+    timings['decode'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    pixels = np.array(img.resize(img_size, Image.BICUBIC))
+    timings['resize'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    shape = (1, img_size[1], img_size[0], 3)
+    out = np.ndarray(shape, dtype=np.float32, buffer=_shm.buf, offset=slot * _slot_bytes(img_size))
+    out[0] = pixels
+    out /= 127.5
+    out -= 1.0
+    timings['preprocess_input'] = time.perf_counter() - started
+
+    return timings
+
+
+def _slot_bytes(img_size):
+    """Bytes of one (1, height, width, 3) float32 model input."""
+    return img_size[0] * img_size[1] * 3 * np.dtype(np.float32).itemsize
+
+
+def _release(executor, shm):
+    """Stop the workers and free the shared memory block."""
+    executor.shutdown(wait=True, cancel_futures=True)
+    shm.close()
+    shm.unlink()
+
+
+class PreprocessPool:
+    """
+    Worker processes turning encoded images into model input tensors.
+
+    Thread-safe: any number of request threads may call preprocess_many()
+    at once; they share the workers and the bounded set of slots.
+    """
+
+    def __init__(self, workers=2, queue_size=16, img_size=(224, 224)):
+        """
+        Start the workers and allocate the shared slots.
+
+        Args:
+            workers (int): Number of worker processes
+            queue_size (int): Number of shared memory slots, i.e. images
+                that may be in preparation or awaiting collection at once
+            img_size (tuple): Model input size (width, height)
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+
+        self.workers = workers
+        self.queue_size = queue_size
+        self.img_size = img_size
+        self._shape = (1, img_size[1], img_size[0], 3)
+        self._slot_bytes = _slot_bytes(img_size)
+
+        self._shm = shared_memory.SharedMemory(create=True, size=queue_size * self._slot_bytes)
+        self._free = queue.Queue()
+        for slot in range(queue_size):
+            self._free.put(slot)
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context('spawn'),
+            initializer=_attach,
+            initargs=(self._shm.name,)
+        )
+        self._finalizer = weakref.finalize(self, _release, self._executor, self._shm)
+
+        # Spawn every worker now rather than on the first request
+        for future in [self._executor.submit(_ping) for _ in range(workers)]:
+            future.result()
+
+    def preprocess_many(self, jobs):
+        """
+        Prepare model inputs for several encoded images.
+
+        Images are submitted as slots become free. While none is, the
+        caller collects its own finished images to free theirs, so a
+        request larger than the pool cannot deadlock against itself.
+
+        Args:
+            jobs (list): (data, draft_size) per image, where data is the
+                encoded image file and draft_size the smallest acceptable
+                decoded (width, height), or None for full resolution
+
+        Returns:
+            list: Per job, a (1, 224, 224, 3) float32 array (a private
+                copy, not a view of shared memory) or the exception raised
+                while preparing that image
+        """
+        results = [None] * len(jobs)
+        in_flight = collections.deque()
+
+        for idx, (data, draft_size) in enumerate(jobs):
+            slot = self._take_slot(in_flight, results)
+            try:
+                future = self._executor.submit(_preprocess_into, slot, data, draft_size, self.img_size)
+            except Exception:
+                self._free.put(slot)
+                while in_flight:
+                    self._collect(in_flight.popleft(), results)
+                raise
+            in_flight.append((idx, slot, future))
+
+        while in_flight:
+            self._collect(in_flight.popleft(), results)
+
+        return results
+
+    def _take_slot(self, in_flight, results):
+        """A free slot, collecting the caller's own finished images while waiting."""
+        while True:
+            try:
+                return self._free.get_nowait()
+            except queue.Empty:
+                pass
+            if not in_flight:
+                with timed('preprocess_slot_wait'):
+                    return self._free.get()
+            self._collect(in_flight.popleft(), results)
+
+    def _collect(self, entry, results):
+        """Copy one finished image out of its slot and free the slot."""
+        idx, slot, future = entry
+        try:
+            timings = future.result()
+            view = np.ndarray(self._shape, dtype=np.float32, buffer=self._shm.buf,
+                              offset=slot * self._slot_bytes)
+            results[idx] = view.copy()
+            if METRICS_ENABLED:
+                for stage, seconds in timings.items():
+                    STAGE_SECONDS.observe(seconds, stage)
+        except Exception as e:
+            results[idx] = e
+        finally:
+            self._free.put(slot)
+
+    def stats(self):
+        """
+        Report pool sizes and current occupancy.
+
+        Returns:
+            dict: workers, queue_size and slots_in_use
+        """
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'slots_in_use': self.queue_size - self._free.qsize()
+        }
+
+    def close(self):
+        """Stop the workers and free the shared memory block."""
+        self._finalizer()
@@ -0,0 +1,146 @@
+"""
+Progress timeline over a user's dated photo analyses
+
+Turns per-photo analyses into what the progress page shows: the photos in
+date order, the change between consecutive photos and smoothed trends for
+each score. Pure arithmetic on analysis dicts; the analyzer supplies them,
+mostly from its cache and persistent store, so a timeline only costs a
+forward pass for photos it has never seen.
+"""
+
+import datetime
+
+import numpy as np
+
+TREND_SCORES = ('body_fat_estimate', 'muscle_score', 'posture_score', 'overall_score')
+DEFAULT_SMOOTHING_DAYS = 14.0
+
+
+def progress_delta(before, after):
+    """
+    Improvements between two analyses, as reported by compare_photos.
+
+    Args:
+        before (dict): Analysis of the earlier photo
+        after (dict): Analysis of the later photo
+
+    Returns:
+        dict: body_fat_change, muscle_gain, posture_improvement and
+            overall_progress (positive is better)
+    """
+    return {
+        'body_fat_change': round(before['body_fat_estimate'] - after['body_fat_estimate'], 2),
+        'muscle_gain': round(after['muscle_score'] - before['muscle_score'], 2),
+        'posture_improvement': round(after['posture_score'] - before['posture_score'], 2),
+        'overall_progress': round(after['overall_score'] - before['overall_score'], 2)
+    }
+
+
+def day_number(value):
+    """
+    Position of a date or datetime on a continuous day axis.
+
+    Args:
+        value (datetime.date or datetime.datetime): Photo date
+
+    Returns:
+        float: Days since 0001-01-01, with the time of day as a fraction
+    """
+    days = float(value.toordinal())
+    if isinstance(value, datetime.datetime):
+        days += (value.hour * 3600 + value.minute * 60 + value.second) / 86400.0
+    return days
+
+
+def smooth(days, values, half_life_days):
+    """
+    Exponentially weighted average of each point and those before it.
+
+    Weights decay with the time between photos rather than their count, so
+    irregular gaps are handled and photos taken on the same day count
+    equally.
+
+    Args:
+        days (np.ndarray): Day numbers, ascending (N,)
+        values (np.ndarray): Scores, one column per series (N, K)
+        half_life_days (float): Age at which a photo's weight halves
+
+    Returns:
+        np.ndarray: Smoothed scores (N, K)
+    """
+    age = days[:, None] - days[None, :]
+    weights = np.where(age >= 0, 0.5 ** (np.maximum(age, 0) / half_life_days), 0.0)
+    return weights @ values / weights.sum(axis=1, keepdims=True)
+
+
+def build_timeline(dates, results, smoothing_days=DEFAULT_SMOOTHING_DAYS):
+    """
+    Assemble a progress timeline.
+
+    Args:
+        dates (list): datetime.date or datetime.datetime per photo
+        results (list): analyze_photos() entry per photo, in the same order
+            ({'success': True, 'analysis': ...} or {'success': False, 'error': ...})
+        smoothing_days (float): Half-life of the trend smoothing, in days
+
+    Returns:
+        dict: Timeline with:
+            - photos: Entries in date order, each with its input 'index'
+              and 'date' plus 'analysis' or 'error'
+            - deltas: progress_delta() between consecutive analyzed photos,
+              with their indices and the days between them
+            - trends: Per score, the smoothed series (one value per analyzed
+              photo) and the least-squares change per week (None with
+              fewer than two distinct dates)
+            - smoothing_days: The half-life used
+    """
+    if smoothing_days <= 0:
+        raise ValueError("smoothing_days must be positive")
+
+    order = sorted(range(len(dates)), key=lambda idx: day_number(dates[idx]))
+
+    photos = []
+    analyzed = []
+    for idx in order:
+        entry = {'index': idx, 'date': dates[idx].isoformat(), 'success': results[idx]['success']}
+        if results[idx]['success']:
+            entry['analysis'] = results[idx]['analysis']
+            analyzed.append(idx)
+        else:
+            entry['error'] = results[idx]['error']
+        photos.append(entry)
+
+    deltas = []
+    for before, after in zip(analyzed, analyzed[1:]):
+        deltas.append(dict(
+            from_index=before,
+            to_index=after,
+            days=round(day_number(dates[after]) - day_number(dates[before]), 2),
+            **progress_delta(results[before]['analysis'], results[after]['analysis'])
+        ))
+
+    trends = {}
+    if analyzed:
+        days = np.array([day_number(dates[idx]) for idx in analyzed])
+        values = np.array([
+            [results[idx]['analysis'][score] for score in TREND_SCORES]
+            for idx in analyzed
+        ], dtype=np.float64)
+        smoothed = smooth(days, values, smoothing_days)
+
+        slopes = None
+        if np.ptp(days) > 0:
+            slopes = np.polyfit(days - days[0], values, 1)[0] * 7
+
+        for column, score in enumerate(TREND_SCORES):
+            trends[score] = {
+                'smoothed': [round(value, 2) for value in smoothed[:, column].tolist()],
+                'change_per_week': round(float(slopes[column]), 3) if slopes is not None else None
+            }
+
+    return {
+        'photos': photos,
+        'deltas': deltas,
+        'trends': trends,
+        'smoothing_days': smoothing_days
+    }
@@ -0,0 +1,158 @@
+"""
+Content-addressed cache for raw model outputs
+
+Entries are keyed by a SHA-256 hash of the image content and hold the raw
+(body_fat, muscle, posture) head outputs, so a repeated photo skips decode,
+preprocessing and inference entirely. Scoring with body metrics is cheap
+and always runs on top of the cached outputs.
+"""
+
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def content_key(image_input):
+    """
+    Compute the cache key for an image input.
+
+    Encoded bytes and file paths are hashed as-is, so a hit never needs to
+    decode the image. PIL Images and arrays are hashed by their pixels.
+
+    Args:
+        image_input: Encoded image bytes, file path (str), PIL Image, or numpy array
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+
+    if isinstance(image_input, (bytes, bytearray, memoryview)):
+        digest.update(image_input)
+    elif isinstance(image_input, str):
+        with open(image_input, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    elif isinstance(image_input, Image.Image):
+        digest.update(f"{image_input.mode}:{image_input.size}".encode())
+        digest.update(image_input.tobytes())
+    elif isinstance(image_input, np.ndarray):
+        digest.update(f"{image_input.dtype}:{image_input.shape}".encode())
+        digest.update(np.ascontiguousarray(image_input).tobytes())
+    else:
+        raise ValueError("Invalid image input type")
+
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """
+    Thread-safe LRU cache with per-entry TTL.
+
+    Memory stays bounded by max_entries; each entry is three floats plus
+    its key. Expired entries are dropped lazily when looked up, and LRU
+    eviction reclaims the rest.
+    """
+
+    def __init__(self, max_entries=4096, ttl_seconds=3600, clock=time.monotonic):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int): Maximum number of cached images
+            ttl_seconds (float): Entry lifetime, or None for no expiry
+            clock (callable): Monotonic time source (injectable for tests)
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Look up the raw outputs for an image.
+
+        Args:
+            key (str): Content key from content_key()
+
+        Returns:
+            tuple: (body_fat, muscle, posture) raw outputs, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and self._expired(entry):
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, outputs):
+        """
+        Store the raw outputs for an image.
+
+        Args:
+            key (str): Content key from content_key()
+            outputs (tuple): (body_fat, muscle, posture) raw outputs
+        """
+        with self._lock:
+            self._entries[key] = (tuple(outputs), self._clock())
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all entries and reset counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """
+        Report cache counters.
+
+        Returns:
+            dict: hits, misses, evictions, hit_rate, size, max_entries, ttl_seconds
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _expired(self, entry):
+        """Check whether an entry has outlived the TTL."""
+        return self.ttl_seconds is not None and self._clock() - entry[1] > self.ttl_seconds
@@ -0,0 +1,435 @@
+"""
+Fine-tune the analyzer heads on labeled photos
+
+The MobileNetV2 backbone is frozen, so only fc1, fc2 and the three
+output heads ever change during training. This pipeline runs the
+backbone once per photo and caches the pooled 1280-d features in a
+memory-mapped array on disk. It then trains a head-only model on those
+features, which takes seconds per hundred epochs instead of a full
+forward pass per photo per epoch. The trained layers are copied back
+into the full model and exported as weights that
+ProgressPhotoAnalyzer(model_path=...) loads.
+
+Labels are a CSV file with a header row:
+    path,body_fat,muscle_score,posture_score
+    front_01.jpg,18.5,62,80
+
+Paths are relative to the CSV file. Values use the API's 0-100 scales
+(body fat percentage, muscle and posture scores).
+
+Usage:
+    cd ml-service
+    python -m src.trainHeads --labels data/labels.csv --cache-dir models/features \\
+        --output models/weights/fitness_model.weights.h5
+
+Feature cache (<cache-dir>):
+    features.npy   float32 (N, 1280) memory-mapped features, one row per label row
+    labels.npy     float32 (N, 3) targets on the 0-1 scale of the sigmoid heads
+    manifest.json  photo paths, sizes and mtimes, backbone fingerprint and progress
+
+Extraction resumes where it stopped, and is skipped entirely when the
+photos and the backbone weights are unchanged.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from src.photoAnalyzer import ProgressPhotoAnalyzer, build_heads
+
+LABEL_COLUMNS = ('body_fat', 'muscle_score', 'posture_score')
+HEAD_LAYERS = ('fc1', 'fc2') + LABEL_COLUMNS
+FEATURE_DIM = 1280
+
+
+def read_labels(labels_path):
+    """
+    Read a labels CSV.
+
+    Args:
+        labels_path (str): CSV with path and LABEL_COLUMNS columns
+
+    Returns:
+        tuple: (absolute photo paths, (N, 3) float32 targets on the 0-1 scale)
+
+    Raises:
+        ValueError: On missing columns, unparseable values or values outside 0-100
+    """
+    base_dir = os.path.dirname(os.path.abspath(labels_path))
+    paths = []
+    targets = []
+
+    with open(labels_path, newline='') as f:
+        reader = csv.DictReader(f)
+        missing = {'path', *LABEL_COLUMNS} - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"Labels file is missing columns: {', '.join(sorted(missing))}")
+
+        for line, row in enumerate(reader, start=2):
+            try:
+                values = [float(row[column]) for column in LABEL_COLUMNS]
+            except (TypeError, ValueError):
+                raise ValueError(f"Line {line}: label values must be numbers")
+            if not all(0 <= value <= 100 for value in values):
+                raise ValueError(f"Line {line}: label values must be between 0 and 100")
+
+            paths.append(os.path.join(base_dir, row['path']))
+            targets.append([value / 100 for value in values])
+
+    if not paths:
+        raise ValueError("Labels file has no rows")
+
+    return paths, np.asarray(targets, dtype=np.float32)
+
+
+def feature_extractor(model):
+    """
+    Cut the analyzer model at the pooled backbone features.
+
+    Args:
+        model (tf.keras.Model): Full analyzer model
+
+    Returns:
+        tf.keras.Model: Model mapping (N, 224, 224, 3) inputs to (N, 1280) features
+    """
+    from tensorflow.keras.models import Model
+
+    return Model(inputs=model.inputs, outputs=model.get_layer('fc1').input)
+
+
+def backbone_fingerprint(extractor):
+    """
+    Hash the backbone weights, so a cache is never reused across backbones.
+
+    Args:
+        extractor (tf.keras.Model): Model from feature_extractor()
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    digest = hashlib.sha256()
+    for weight in extractor.weights:
+        digest.update(np.ascontiguousarray(weight.numpy()).tobytes())
+    return digest.hexdigest()
+
+
+def _photo_stats(paths):
+    """(size, mtime_ns) per photo, or None for photos that cannot be read."""
+    stats = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stats.append([stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            stats.append(None)
+    return stats
+
+
+def extract_features(analyzer, paths, targets, cache_dir, batch_size=32):
+    """
+    Run the backbone over every photo and cache the features on disk.
+
+    Photos are preprocessed exactly as at inference time. Progress is
+    written to the manifest after each batch, so an interrupted run
+    continues where it stopped. Photos that fail to load keep a zero row
+    and are listed under 'failed' in the manifest.
+
+    Args:
+        analyzer (ProgressPhotoAnalyzer): Analyzer with a Keras model
+        paths (list): Photo paths
+        targets (np.ndarray): (N, 3) targets, stored next to the features
+        cache_dir (str): Directory for the feature cache
+        batch_size (int): Photos per forward pass
+
+    Returns:
+        dict: Manifest, including 'extracted' (rows computed in this call)
+    """
+    if analyzer.model is None:
+        raise ValueError("Feature extraction needs the keras engine")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    features_path = os.path.join(cache_dir, 'features.npy')
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+
+    extractor = feature_extractor(analyzer.model)
+    manifest = {
+        'backbone': backbone_fingerprint(extractor),
+        'paths': list(paths),
+        'stats': _photo_stats(paths),
+        'rows_done': 0,
+        'failed': []
+    }
+
+    # Resume only when the same photos go through the same backbone
+    previous = None
+    if os.path.exists(manifest_path) and os.path.exists(features_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+    if previous is not None and all(previous.get(key) == manifest[key] for key in ('backbone', 'paths', 'stats')):
+        manifest = previous
+        features = np.load(features_path, mmap_mode='r+')
+    else:
+        features = np.lib.format.open_memmap(
+            features_path, mode='w+', dtype=np.float32, shape=(len(paths), FEATURE_DIM)
+        )
+
+    np.save(os.path.join(cache_dir, 'labels.npy'), np.asarray(targets, dtype=np.float32))
+
+    start = manifest['rows_done']
+    for offset in range(start, len(paths), batch_size):
+        rows = []
+        batch = []
+        for row in range(offset, min(offset + batch_size, len(paths))):
+            try:
+                batch.append(analyzer.preprocess_image(paths[row]))
+                rows.append(row)
+            except Exception as e:
+                print(f"Skipping {paths[row]}: {str(e)}")
+                features[row] = 0
+                manifest['failed'].append(row)
+
+        if batch:
+            features[rows] = np.asarray(extractor.predict_on_batch(np.concatenate(batch, axis=0)))
+        features.flush()
+
+        manifest['rows_done'] = min(offset + batch_size, len(paths))
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+
+    del features
+    return dict(manifest, extracted=len(paths) - start)
+
+
+def load_features(cache_dir):
+    """
+    Open a feature cache written by extract_features().
+
+    Args:
+        cache_dir (str): Feature cache directory
+
+    Returns:
+        tuple: (read-only (N, 1280) memmap, (N, 3) targets, indices of usable rows)
+    """
+    with open(os.path.join(cache_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    features = np.load(os.path.join(cache_dir, 'features.npy'), mmap_mode='r')
+    targets = np.load(os.path.join(cache_dir, 'labels.npy'))
+    if manifest['rows_done'] < len(features):
+        raise ValueError("Feature cache is incomplete; run extraction again")
+
+    usable = np.setdiff1d(np.arange(len(features)), manifest['failed'])
+    return features, targets, usable
+
+
+def build_head_model():
+    """
+    Build the trainable part of the analyzer on pooled-feature inputs.
+
+    Returns:
+        tf.keras.Model: Model mapping (N, 1280) features to the three heads
+    """
+    from tensorflow.keras.layers import Input
+    from tensorflow.keras.models import Model
+
+    features = Input(shape=(FEATURE_DIM,), name='pooled_features')
+    return Model(inputs=features, outputs=build_heads(features))
+
+
+def copy_head_weights(source, target):
+    """Copy fc1, fc2 and the output heads between models by layer name."""
+    for name in HEAD_LAYERS:
+        target.get_layer(name).set_weights(source.get_layer(name).get_weights())
+
+
+def _predict_rows(predict, features, rows, batch_size=256):
+    """Run predict over the given rows in sorted chunks; returns (sorted rows, (N, 3) outputs)."""
+    rows = np.sort(rows)
+    predictions = [
+        np.asarray(predict(features[rows[offset:offset + batch_size]]))
+        for offset in range(0, len(rows), batch_size)
+    ]
+    return rows, np.concatenate(predictions)
+
+
+def head_errors(head_model, features, targets, rows):
+    """
+    Mean absolute error per head on the API's 0-100 scale.
+
+    Args:
+        head_model (tf.keras.Model): Model from build_head_model()
+        features (np.ndarray): (N, 1280) features
+        targets (np.ndarray): (N, 3) targets on the 0-1 scale
+        rows (np.ndarray): Rows to evaluate
+
+    Returns:
+        dict: MAE per label column
+    """
+    def predict(batch):
+        return np.concatenate([np.asarray(output) for output in head_model(batch, training=False)], axis=1)
+
+    rows, predictions = _predict_rows(predict, features, rows)
+    errors = np.abs(predictions - targets[rows]) * 100
+    return {column: round(float(errors[:, i].mean()), 2) for i, column in enumerate(LABEL_COLUMNS)}
+
+
+def train_heads(features, targets, rows=None, initial_model=None, epochs=200, batch_size=64,
+                learning_rate=1e-3, val_fraction=0.2, patience=20, seed=0):
+    """
+    Train the head layers on cached features.
+
+    Batches are read straight from the (memory-mapped) feature array and
+    fed to one compiled training step, so an epoch over a few thousand
+    photos takes a fraction of a second. With a validation split, the weights with
+    the lowest validation loss are kept and training stops after
+    `patience` epochs without improvement.
+
+    Args:
+        features (np.ndarray): (N, 1280) features, e.g. from load_features()
+        targets (np.ndarray): (N, 3) targets on the 0-1 scale
+        rows (np.ndarray, optional): Usable rows (all when None)
+        initial_model (tf.keras.Model, optional): Model to start from, e.g. the
+            analyzer model with earlier fine-tuned weights
+        epochs (int): Maximum number of passes over the training rows
+        batch_size (int): Rows per gradient step
+        learning_rate (float): Adam learning rate
+        val_fraction (float): Share of rows held out for validation
+        patience (int): Epochs without validation improvement before stopping
+        seed (int): Seed for the split and the shuffling
+
+    Returns:
+        tuple: (trained head model, report dict)
+    """
+    import tensorflow as tf
+
+    rows = np.arange(len(features)) if rows is None else np.asarray(rows)
+    rng = np.random.default_rng(seed)
+    rows = rng.permutation(rows)
+    val_count = int(len(rows) * val_fraction) if len(rows) >= 5 else 0
+    val_rows, train_rows = rows[:val_count], rows[val_count:]
+    if not len(train_rows):
+        raise ValueError("No usable training rows")
+
+    tf.keras.utils.set_random_seed(seed)
+    model = build_head_model()
+    if initial_model is not None:
+        copy_head_weights(initial_model, model)
+    optimizer = tf.keras.optimizers.Adam(learning_rate)
+
+    # Mean squared error over all three heads
+    @tf.function(reduce_retracing=True)
+    def train_step(batch, batch_targets):
+        with tf.GradientTape() as tape:
+            outputs = tf.concat(model(batch, training=True), axis=1)
+            loss = tf.reduce_mean(tf.square(outputs - batch_targets))
+        gradients = tape.gradient(loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+
+    @tf.function(reduce_retracing=True)
+    def predict(batch):
+        return tf.concat(model(batch, training=False), axis=1)
+
+    started = time.perf_counter()
+    best_loss = None
+    best_weights = None
+    best_epoch = 0
+    history = []
+
+    for epoch in range(1, epochs + 1):
+        order = rng.permutation(train_rows)
+        for offset in range(0, len(order), batch_size):
+            # Sorted indices keep memmap reads sequential within a batch
+            chunk = np.sort(order[offset:offset + batch_size])
+            train_step(features[chunk], targets[chunk])
+
+        monitored, predictions = _predict_rows(predict, features, val_rows if len(val_rows) else train_rows)
+        loss = float(np.mean((predictions - targets[monitored]) ** 2))
+        history.append(loss)
+        if best_loss is None or loss < best_loss:
+            best_loss, best_weights, best_epoch = loss, model.get_weights(), epoch
+        elif len(val_rows) and epoch - best_epoch >= patience:
+            break
+
+    model.set_weights(best_weights)
+    report = {
+        'train_rows': int(len(train_rows)),
+        'val_rows': int(len(val_rows)),
+        'epochs': len(history),
+        'best_epoch': best_epoch,
+        'train_seconds': round(time.perf_counter() - started, 2),
+        'train_mae': head_errors(model, features, targets, train_rows),
+        'val_mae': head_errors(model, features, targets, val_rows) if len(val_rows) else None
+    }
+    return model, report
+
+
+def export_weights(analyzer, head_model, output_path):
+    """
+    Copy trained heads into the analyzer model and save them.
+
+    Args:
+        analyzer (ProgressPhotoAnalyzer): Analyzer whose model receives the heads
+        head_model (tf.keras.Model): Model from train_heads()
+        output_path (str): A .weights.h5 file for MODEL_PATH, or a .keras
+            full-model artifact (see src.exportModel)
+    """
+    if not output_path.endswith(('.weights.h5', '.keras')):
+        raise ValueError("Output path must end in .weights.h5 or .keras")
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    copy_head_weights(head_model, analyzer.model)
+    if output_path.endswith('.keras'):
+        analyzer.model.save(output_path)
+    else:
+        analyzer.model.save_weights(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune the analyzer heads on labeled photos")
+    parser.add_argument('--labels', required=True, help="CSV of path,body_fat,muscle_score,posture_score")
+    parser.add_argument('--cache-dir', default='models/features')
+    parser.add_argument('--output', default='models/weights/fitness_model.weights.h5')
+    parser.add_argument('--model-path', default=None, help="Weights to start from")
+    parser.add_argument('--epochs', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--val-fraction', type=float, default=0.2)
+    parser.add_argument('--patience', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    analyzer = ProgressPhotoAnalyzer(model_path=args.model_path)
+    paths, targets = read_labels(args.labels)
+
+    started = time.perf_counter()
+    manifest = extract_features(analyzer, paths, targets, args.cache_dir)
+    print(f"Features: {manifest['extracted']} of {len(paths)} photos extracted "
+          f"in {time.perf_counter() - started:.1f}s, {len(manifest['failed'])} failed")
+
+    features, targets, usable = load_features(args.cache_dir)
+    head_model, report = train_heads(
+        features, targets, usable,
+        initial_model=analyzer.model if args.model_path else None,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        learning_rate=args.learning_rate,
+        val_fraction=args.val_fraction,
+        patience=args.patience,
+        seed=args.seed
+    )
+    print(f"Training: {json.dumps(report)}")
+
+    export_weights(analyzer, head_model, args.output)
+    print(f"Wrote {args.output}; load it with MODEL_PATH={args.output}")
+
+
+if __name__ == '__main__':
+    main()
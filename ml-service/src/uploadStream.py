@@ -0,0 +1,274 @@
+"""
+Incremental multipart/form-data parsing for streamed batch uploads
+
+request.files (and Starlette's request.form()) read the whole body before
+a handler sees the first file. MultipartUploads is fed the body chunk by
+chunk, as it arrives from the socket, and hands back each file part as
+soon as it is complete, so a long upload can be analyzed while it is still
+being received and only the current part is held in memory.
+
+UploadBatcher groups the completed files into analysis batches for the
+streaming batch endpoint of both front-ends:
+    batcher = UploadBatcher(boundary, batch_size=8)
+    for chunk in body_chunks + [None]:  # None marks the end of the body
+        items, batches = batcher.feed(chunk)
+        # emit items (errors), analyze each batch and emit its results
+"""
+
+from werkzeug.http import parse_options_header
+
+# Largest header block accepted for one part
+MAX_HEADER_SIZE = 16 * 1024
+
+
+class MultipartUploads:
+    """
+    Push parser that yields complete file parts of one form field.
+
+    Scans for the CRLF--boundary delimiter itself, keeping back only the
+    few trailing bytes that could be the start of a delimiter, so results
+    do not depend on how the body is split into chunks. Parts of other
+    fields are skipped. A file larger than max_file_size is not buffered
+    beyond the limit and is reported with an error instead.
+    """
+
+    def __init__(self, boundary, field_name='photos[]', max_file_size=10 * 1024 * 1024):
+        """
+        Initialize the parser.
+
+        Args:
+            boundary (str or bytes): Multipart boundary from the Content-Type header
+            field_name (str): Form field holding the files
+            max_file_size (int): Largest accepted file, in bytes
+        """
+        if isinstance(boundary, str):
+            boundary = boundary.encode('latin-1')
+
+        self.field_name = field_name
+        self.max_file_size = max_file_size
+        self.finished = False
+        self._delimiter = b'\r\n--' + boundary
+        # A body may open with the boundary without a leading line break
+        self._buffer = bytearray(b'\r\n')
+        self._state = 'delimiter'
+        self._filename = None
+        self._collecting = False
+        self._parts = []
+        self._size = 0
+
+    def feed(self, data):
+        """
+        Parse the next chunk of the request body.
+
+        Args:
+            data (bytes or None): Body chunk, or None once the body has ended
+
+        Returns:
+            list: (filename, file bytes, error) for every file part completed
+                by this chunk; file bytes is None when error is set
+
+        Raises:
+            ValueError: If the body is malformed or ends mid-part
+        """
+        ended = data is None
+        if not ended and not self.finished:
+            self._buffer += data
+
+        completed = []
+        buffer = self._buffer
+        delimiter = self._delimiter
+
+        while not self.finished:
+            if self._state == 'delimiter':
+                # Preamble, or the delimiter that closes the previous part
+                index = buffer.find(delimiter)
+                if index == -1:
+                    del buffer[:max(0, len(buffer) - len(delimiter) + 1)]
+                    break
+                after = index + len(delimiter)
+                if buffer[after:after + 2] == b'--':
+                    self.finished = True
+                    buffer.clear()
+                    break
+                line_end = buffer.find(b'\r\n', after)
+                if line_end == -1:
+                    break
+                del buffer[:line_end + 2]
+                self._state = 'headers'
+
+            elif self._state == 'headers':
+                if buffer.startswith(b'\r\n'):
+                    header_end = 0
+                else:
+                    header_end = buffer.find(b'\r\n\r\n')
+                    if header_end == -1:
+                        if len(buffer) > MAX_HEADER_SIZE:
+                            raise ValueError("Multipart part headers too large")
+                        break
+                    header_end += 2
+                self._start_part(bytes(buffer[:header_end]))
+                # Keep the blank line's CRLF: it may double as the start of
+                # the delimiter when the part is empty
+                del buffer[:header_end]
+                self._state = 'body_start'
+
+            elif self._state == 'body_start':
+                if len(buffer) < len(delimiter) and not ended:
+                    break
+                if buffer.startswith(delimiter):
+                    self._finish_part(completed)
+                    self._state = 'delimiter'
+                    continue
+                del buffer[:2]
+                self._state = 'body'
+
+            elif self._state == 'body':
+                index = buffer.find(delimiter)
+                if index == -1:
+                    # Everything but a possible partial delimiter is content
+                    safe = len(buffer) - len(delimiter) + 1
+                    if safe > 0:
+                        self._take(buffer[:safe])
+                        del buffer[:safe]
+                    break
+                self._take(buffer[:index])
+                del buffer[:index]
+                self._finish_part(completed)
+                self._state = 'delimiter'
+
+        if ended and not self.finished:
+            raise ValueError("Multipart body ended before the closing boundary")
+
+        return completed
+
+    def _start_part(self, header_block):
+        """Read the Content-Disposition of a new part."""
+        name = filename = None
+        for line in header_block.decode('utf-8', 'replace').split('\r\n'):
+            key, _, value = line.partition(':')
+            if key.strip().lower() == 'content-disposition':
+                _, options = parse_options_header(value.strip())
+                name = options.get('name')
+                filename = options.get('filename')
+
+        self._collecting = filename is not None and name == self.field_name
+        self._filename = filename
+        self._parts = []
+        self._size = 0
+
+    def _take(self, data):
+        """Buffer content of the current part, up to max_file_size."""
+        if not self._collecting or not data:
+            return
+        self._size += len(data)
+        # Stop buffering an oversize file but keep parsing past it
+        if self._size <= self.max_file_size:
+            self._parts.append(bytes(data))
+        else:
+            self._parts = []
+
+    def _finish_part(self, completed):
+        """Append the part that just ended to completed, unless it is skipped."""
+        if not self._collecting:
+            return
+        self._collecting = False
+        if self._size > self.max_file_size:
+            completed.append((self._filename, None, 'File too large'))
+        else:
+            completed.append((self._filename, b''.join(self._parts), None))
+        self._parts = []
+
+
+class UploadBatcher:
+    """
+    Group streamed uploads into batches of at most batch_size photos.
+
+    Memory stays bounded by one batch of files plus the part being
+    received, however many photos the request holds.
+    """
+
+    def __init__(self, boundary, batch_size=8, max_photos=1000,
+                 max_file_size=10 * 1024 * 1024, allowed=None, field_name='photos[]'):
+        """
+        Initialize the batcher.
+
+        Args:
+            boundary (str or bytes): Multipart boundary
+            batch_size (int): Photos per analysis batch
+            max_photos (int): Photos accepted per request
+            max_file_size (int): Largest accepted file, in bytes
+            allowed (callable, optional): filename -> bool extension check
+            field_name (str): Form field holding the files
+        """
+        self.batch_size = batch_size
+        self.max_photos = max_photos
+        self.allowed = allowed
+        self.count = 0
+        self.stopped = False
+        self._uploads = MultipartUploads(boundary, field_name, max_file_size)
+        self._pending = []
+
+    def feed(self, data):
+        """
+        Parse the next body chunk.
+
+        Args:
+            data (bytes or None): Body chunk, or None once the body has ended
+
+        Returns:
+            tuple: (items, batches). items are result dicts that are ready
+                without inference (rejected files); batches are lists of
+                (index, filename, file bytes) to analyze, in order
+        """
+        items = []
+        batches = []
+
+        if self.stopped:
+            return items, batches
+
+        for filename, file_data, error in self._uploads.feed(data):
+            index = self.count
+            self.count += 1
+
+            if self.count > self.max_photos:
+                items.append({
+                    'success': False,
+                    'error': f'Maximum {self.max_photos} photos per request'
+                })
+                self.stopped = True
+                break
+
+            if error is None and self.allowed is not None and not self.allowed(filename):
+                error = 'Invalid file type'
+
+            if error is not None:
+                items.append({'index': index, 'filename': filename, 'success': False, 'error': error})
+                continue
+
+            self._pending.append((index, filename, file_data))
+            if len(self._pending) >= self.batch_size:
+                batches.append(self._pending)
+                self._pending = []
+
+        if (data is None or self.stopped) and self._pending:
+            batches.append(self._pending)
+            self._pending = []
+
+        return items, batches
+
+
+def label_results(batch, results):
+    """
+    Attach index and filename to analyze_photos() results of one batch.
+
+    Args:
+        batch (list): (index, filename, file bytes) entries
+        results (list): analyze_photos() / analyses_from_raw() results
+
+    Returns:
+        list: Result dicts in the batch-analyze item shape
+    """
+    for (index, filename, _), item in zip(batch, results):
+        item['index'] = index
+        item['filename'] = filename
+    return results
@@ -0,0 +1,255 @@
+"""
+Unit tests for the persistent analysis store
+"""
+
+import pytest
+import numpy as np
+import sqlite3
+import subprocess
+import threading
+import sys
+import os
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.analysisStore import AnalysisStore
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    """Path of a fresh SQLite store"""
+    return str(tmp_path / "analyses.db")
+
+
+class TestAnalysisStore:
+    """Test suite for AnalysisStore"""
+
+    def test_put_and_get(self, store_path):
+        """Test stored outputs come back unchanged as float32"""
+        store = AnalysisStore(store_path)
+        outputs = (np.float32(0.1234567), np.float32(0.7654321), np.float32(0.5))
+        store.put('abc', outputs)
+
+        stored = store.get('abc')
+        assert stored == outputs
+        assert all(isinstance(value, np.float32) for value in stored)
+        assert store.get('missing') is None
+        assert len(store) == 1
+
+    def test_survives_reopen(self, store_path):
+        """Test entries persist across store instances, as across restarts"""
+        AnalysisStore(store_path).put_many([('a', (0.1, 0.2, 0.3)), ('b', (0.4, 0.5, 0.6))])
+
+        reopened = AnalysisStore(store_path)
+        assert len(reopened) == 2
+        assert reopened.get('b') == tuple(np.float32(v) for v in (0.4, 0.5, 0.6))
+        assert reopened.stats() == {
+            'path': store_path,
+            'size': 2,
+            'quality_size': 0,
+            'max_entries': None,
+            'model_version': ''
+        }
+
+    def test_put_replaces(self, store_path):
+        """Test storing a key again overwrites its outputs"""
+        store = AnalysisStore(store_path)
+        store.put('a', (0.1, 0.2, 0.3))
+        store.put('a', (0.9, 0.8, 0.7))
+
+        assert len(store) == 1
+        assert store.get('a')[0] == np.float32(0.9)
+
+    def test_put_keeps_created_and_newer_last_used(self, store_path):
+        """Test rewriting a key keeps created_at and a later last_used_at"""
+        store = AnalysisStore(store_path)
+        store.put('a', (0.1, 0.2, 0.3))
+        store.put_quality('a', {'quality_score': 1.0}, max_side=1024)
+        conn = sqlite3.connect(store_path)
+        try:
+            for table in ('raw_outputs', 'pose_quality'):
+                with conn:
+                    conn.execute(f'UPDATE {table} SET created_at = 1.0, last_used_at = 1e12')
+
+            store.put('a', (0.9, 0.8, 0.7))
+            store.put_quality('a', {'quality_score': 2.0}, max_side=1024)
+
+            for table in ('raw_outputs', 'pose_quality'):
+                assert conn.execute(f'SELECT created_at, last_used_at FROM {table}').fetchall() == [(1.0, 1e12)]
+        finally:
+            conn.close()
+        assert store.get('a')[0] == np.float32(0.9)
+        assert store.get_quality('a', max_side=1024) == {'quality_score': 2.0}
+
+    def test_concurrent_threads(self, store_path):
+        """Test writers on several threads, each with its own connection"""
+        store = AnalysisStore(store_path)
+
+        def write(thread):
+            store.put_many([(f'{thread}-{i}', (0.1, 0.2, 0.3)) for i in range(20)])
+
+        threads = [threading.Thread(target=write, args=(t,)) for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(store) == 80
+
+    def test_in_memory(self):
+        """Test an in-memory store is shared across threads"""
+        store = AnalysisStore(':memory:')
+        thread = threading.Thread(target=store.put, args=('a', (0.1, 0.2, 0.3)))
+        thread.start()
+        thread.join()
+
+        assert store.get('a') is not None
+
+    def test_keyed_by_model_version(self, store_path):
+        """Test outputs of one model version are never served to another"""
+        AnalysisStore(store_path, model_version='keras-a').put('img', (0.1, 0.2, 0.3))
+        other = AnalysisStore(store_path, model_version='keras-b')
+
+        assert other.get('img') is None
+        other.put('img', (0.7, 0.8, 0.9))
+        assert AnalysisStore(store_path, model_version='keras-a').get('img')[0] == np.float32(0.1)
+        assert other.get('img')[0] == np.float32(0.7)
+        assert len(other) == 2
+
+    def test_evicts_least_recently_used(self, store_path):
+        """Test the store stays within max_entries, keeping entries that were read"""
+        store = AnalysisStore(store_path, max_entries=3, touch_interval=0)
+        for key in 'abc':
+            store.put(key, (0.1, 0.2, 0.3))
+        store.get('a')
+        store.put('d', (0.1, 0.2, 0.3))
+
+        assert len(store) == 3
+        assert store.get('b') is None
+        assert all(store.get(key) is not None for key in 'acd')
+
+    def test_reads_do_not_write(self, store_path):
+        """Test lookups succeed while another connection holds the write lock"""
+        store = AnalysisStore(store_path, timeout=0.5, touch_interval=0)
+        store.put('a', (0.1, 0.2, 0.3))
+        store.put_quality('a', {'quality_score': 1.0})
+
+        writer = sqlite3.connect(store_path)
+        writer.execute('BEGIN IMMEDIATE')
+        try:
+            assert store.get('a') is not None
+            assert store.get_quality('a') is not None
+        finally:
+            writer.rollback()
+            writer.close()
+
+    def test_touches_deferred_and_batched(self, store_path):
+        """Test lookups refresh last_used_at later, and only once per interval"""
+        def last_used(key):
+            conn = sqlite3.connect(store_path)
+            try:
+                return conn.execute(
+                    'SELECT last_used_at FROM raw_outputs WHERE image_id = ?', (key,)
+                ).fetchone()[0]
+            finally:
+                conn.close()
+
+        store = AnalysisStore(store_path, touch_interval=0)
+        store.put_many([('a', (0.1, 0.2, 0.3)), ('b', (0.1, 0.2, 0.3))])
+        written = last_used('a')
+
+        store.get('a')
+        assert last_used('a') == written
+        store.put('c', (0.1, 0.2, 0.3))
+        assert last_used('a') > written
+
+        # Within the interval a lookup queues nothing
+        patient = AnalysisStore(store_path)
+        patient.get('b')
+        patient.flush()
+        assert last_used('b') == written
+
+    def test_eviction_checked_every_few_writes(self, store_path):
+        """Test the table is counted once per 5% of max_entries rows written"""
+        store = AnalysisStore(store_path, max_entries=40)
+        for i in range(41):
+            store.put(f'k{i}', (0.1, 0.2, 0.3))
+        assert len(store) == 41
+
+        store.put('k41', (0.1, 0.2, 0.3))
+        assert len(store) == 40
+        assert store.get('k0') is None
+
+    def test_pose_quality(self, store_path):
+        """Test pose-quality metrics round-trip per analysis resolution"""
+        store = AnalysisStore(store_path, model_version='keras-a')
+        metrics = {'edge_clarity': 4.5, 'brightness': 50.2, 'contrast': 20.0, 'quality_score': 23.9}
+        store.put_quality('img', metrics, max_side=1024)
+
+        assert store.get_quality('img', max_side=1024) == metrics
+        assert store.get_quality('img') is None
+        # Metrics of a draft-mode decode are kept apart
+        assert store.get_quality('img', max_side=1024, decode='draft-224x224') is None
+        store.put_quality('img', dict(metrics, edge_clarity=2.0), max_side=1024, decode='draft-224x224')
+        assert store.get_quality('img', max_side=1024) == metrics
+        # Pose quality does not depend on the model
+        assert AnalysisStore(store_path, model_version='keras-b').get_quality('img', 1024) == metrics
+        assert store.stats()['quality_size'] == 2
+
+    def test_recent(self, store_path):
+        """Test recent() lists this version's entries, most recently used first"""
+        store = AnalysisStore(store_path, model_version='keras-a', touch_interval=0)
+        store.put_many([('a', (0.1, 0.1, 0.1)), ('b', (0.2, 0.2, 0.2))])
+        store.put('c', (0.3, 0.3, 0.3))
+        store.get('a')
+        store.flush()
+        AnalysisStore(store_path, model_version='keras-b').put('x', (0.5, 0.5, 0.5))
+
+        recent = store.recent(2)
+        assert [key for key, _ in recent] == ['a', 'c']
+        assert recent[0][1] == tuple(np.float32(v) for v in (0.1, 0.1, 0.1))
+
+    def test_wal_mode(self, store_path):
+        """Test file stores run in WAL mode"""
+        AnalysisStore(store_path)
+        conn = sqlite3.connect(store_path)
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        conn.close()
+
+    def test_replaces_old_schema(self, store_path):
+        """Test a file from the single-key schema is recreated"""
+        conn = sqlite3.connect(store_path)
+        conn.execute(
+            'CREATE TABLE raw_outputs (image_id TEXT PRIMARY KEY, body_fat REAL NOT NULL, '
+            'muscle REAL NOT NULL, posture REAL NOT NULL, created_at REAL NOT NULL)'
+        )
+        conn.execute("INSERT INTO raw_outputs VALUES ('a', 0.1, 0.2, 0.3, 0)")
+        conn.commit()
+        conn.close()
+
+        store = AnalysisStore(store_path)
+        assert len(store) == 0
+        store.put('a', (0.1, 0.2, 0.3))
+        assert store.get('a') is not None
+
+    def test_concurrent_processes(self, store_path):
+        """Test several worker processes write to one file without losing entries"""
+        code = (
+            "import sys\n"
+            "from src.analysisStore import AnalysisStore\n"
+            "store = AnalysisStore(sys.argv[1], model_version='v', max_entries=1000)\n"
+            "for i in range(40):\n"
+            "    store.put(f'{sys.argv[2]}-{i}', (0.1, 0.2, 0.3))\n"
+            "    store.get(f'{sys.argv[2]}-{i // 2}')\n"
+        )
+        processes = [
+            subprocess.Popen(
+                [sys.executable, '-c', code, store_path, str(worker)],
+                cwd=os.path.join(os.path.dirname(__file__), '..')
+            )
+            for worker in range(4)
+        ]
+
+        assert [process.wait(timeout=60) for process in processes] == [0, 0, 0, 0]
+        assert len(AnalysisStore(store_path, model_version='v')) == 160
@@ -9,11 +9,13 @@ import sys
 import os
 from PIL import Image
 import io
+import base64
+import json
 
 # Add parent directory to path to import src modules
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from src.app import app
+from src.app import app, warmup_batch_sizes, _ready, _start_model
 
 
 @pytest.fixture
@@ -49,6 +51,48 @@ class TestAPIEndpoints:
         assert 'model_loaded' in data
         assert 'version' in data
     
+    def test_ready_after_warmup(self, client):
+        """Test readiness turns green once warm-up finished, with phase timings"""
+        assert _ready.wait(120)
+        response = client.get('/ready')
+        
+        assert response.status_code == 200
+        data = response.get_json()
+        
+        assert data['ready'] is True
+        assert set(data['startup_ms']) == {'import_ms', 'build_ms', 'weight_load_ms', 'warmup_ms'}
+        assert data['startup_ms']['warmup_ms'] > 0
+    
+    def test_not_ready_without_model_server(self, client, mocker):
+        """Test readiness fails while the shared model server does not answer"""
+        assert _ready.wait(120)
+        analyzer = mocker.patch('src.app.analyzer')
+        analyzer.engine.ping.return_value = False
+        analyzer.engine.socket_path = '/tmp/ml-model.sock'
+        
+        response = client.get('/ready')
+        
+        assert response.status_code == 503
+        assert response.get_json()['ready'] is False
+        assert 'Model server' in response.get_json()['error']
+    
+    def test_startup_retried_until_ready(self, mocker):
+        """Test a failed start-up is retried in the background with backoff"""
+        attempts = mocker.patch('src.app._try_start_model', side_effect=[False, False, False, True])
+        sleep = mocker.patch('src.app.time.sleep')
+        mocker.patch('src.app.STARTUP_RETRY_SECONDS', 20.0)
+        
+        _start_model()
+        
+        assert attempts.call_count == 4
+        assert [call.args[0] for call in sleep.call_args_list] == [20.0, 40.0, 60.0]
+    
+    def test_warmup_batch_sizes(self):
+        """Test warm-up covers singles, pairs, powers of two and the max"""
+        assert warmup_batch_sizes(8) == (1, 2, 4, 8)
+        assert warmup_batch_sizes(10) == (1, 2, 4, 8, 10)
+        assert warmup_batch_sizes(1) == (1, 2)
+    
     def test_analyze_photo_success(self, client, sample_image_file):
         """Test successful photo analysis"""
         response = client.post(
@@ -89,6 +133,49 @@ class TestAPIEndpoints:
         assert 'brightness' in quality
         assert 'contrast' in quality
     
+    def test_analyze_photo_base64(self, client, sample_image_file):
+        """Test photo analysis with base64 JSON payload"""
+        payload = base64.b64encode(sample_image_file.getvalue()).decode()
+        
+        response = client.post(
+            '/api/ml/analyze',
+            json={'image': payload, 'weight': 75, 'height': 175, 'age': 30}
+        )
+        
+        assert response.status_code == 200
+        analysis = response.get_json()['analysis']
+        assert 'bmi' in analysis
+    
+    def test_analyze_photo_invalid_base64_image(self, client):
+        """Test base64 payload that is not an image"""
+        payload = base64.b64encode(b"not an image").decode()
+        
+        response = client.post('/api/ml/analyze', json={'image': payload})
+        
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
+    
+    def test_analyze_photo_raw_body(self, client, sample_image_file):
+        """Test raw image body with metrics in the query string"""
+        response = client.post(
+            '/api/ml/analyze?weight=75&height=175&age=30&include_quality=true',
+            data=sample_image_file.getvalue(),
+            content_type='application/octet-stream'
+        )
+        
+        assert response.status_code == 200
+        analysis = response.get_json()['analysis']
+        assert analysis['bmi'] == pytest.approx(24.49, abs=0.01)
+        assert 'pose_quality' in analysis
+    
+    def test_analyze_photo_raw_body_invalid(self, client):
+        """Test raw body that is empty or not an image"""
+        for body in (b"", b"not an image"):
+            response = client.post('/api/ml/analyze', data=body, content_type='image/jpeg')
+            
+            assert response.status_code == 400
+            assert response.get_json()['success'] is False
+    
     def test_analyze_photo_no_file(self, client):
         """Test analysis without file upload"""
         response = client.post('/api/ml/analyze')
@@ -113,6 +200,69 @@ class TestAPIEndpoints:
         data = response.get_json()
         assert data['success'] is False
     
+    def test_rescore_photo(self, client, sample_image_file):
+        """Test re-scoring a previously analyzed photo by image_id"""
+        response = client.post(
+            '/api/ml/analyze',
+            data={'photo': (sample_image_file, 'test.jpg')},
+            content_type='multipart/form-data'
+        )
+        first = response.get_json()['analysis']
+        
+        response = client.post('/api/ml/rescore', json={
+            'image_id': first['image_id'],
+            'weight': 82,
+            'height': 178,
+            'age': 35
+        })
+        
+        assert response.status_code == 200
+        analysis = response.get_json()['analysis']
+        assert analysis['muscle_score'] == first['muscle_score']
+        assert 'bmi' in analysis
+    
+    def test_rescore_parses_metrics(self, client, sample_image_file):
+        """Test numeric strings are accepted and invalid metrics rejected"""
+        response = client.post(
+            '/api/ml/analyze',
+            data={'photo': (sample_image_file, 'test.jpg')},
+            content_type='multipart/form-data'
+        )
+        image_id = response.get_json()['analysis']['image_id']
+        
+        response = client.post('/api/ml/rescore', json={
+            'image_id': image_id,
+            'weight': '80',
+            'height': '178'
+        })
+        assert response.status_code == 200
+        assert 'bmi' in response.get_json()['analysis']
+        
+        for invalid in ({'weight': 'heavy'}, {'height': 0}, {'gender': 5}, {'gender': 'x'}):
+            response = client.post('/api/ml/rescore', json={'image_id': image_id, **invalid})
+            assert response.status_code == 400
+            assert response.get_json()['success'] is False
+    
+    def test_rescore_unknown_image(self, client):
+        """Test re-scoring an image that was never analyzed"""
+        response = client.post('/api/ml/rescore', json={'image_id': 'deadbeef'})
+        
+        assert response.status_code == 404
+        assert response.get_json()['success'] is False
+    
+    def test_rescore_missing_image_id(self, client):
+        """Test re-scoring without image_id"""
+        response = client.post('/api/ml/rescore', json={'weight': 80})
+        
+        assert response.status_code == 400
+    
+    def test_rescore_rejects_malformed_body(self, client):
+        """Test re-scoring with a non-string image_id or a non-object body"""
+        for body in ({'image_id': ['x']}, {'image_id': 5}, ['x']):
+            response = client.post('/api/ml/rescore', json=body)
+            assert response.status_code == 400
+            assert response.get_json()['success'] is False
+    
     def test_compare_photos_success(self, client, sample_image_file):
         """Test successful photo comparison"""
         # Create second image
@@ -141,6 +291,53 @@ class TestAPIEndpoints:
         assert 'after' in comparison
         assert 'improvements' in comparison
     
+    def test_compare_photos_with_metrics(self, client, sample_image_file):
+        """Test comparison passes per-photo body metrics through"""
+        img2_bytes = io.BytesIO()
+        Image.new('RGB', (224, 224), color=(150, 150, 150)).save(img2_bytes, format='JPEG')
+        img2_bytes.seek(0)
+        
+        response = client.post(
+            '/api/ml/compare',
+            data={
+                'photo1': (sample_image_file, 'test1.jpg'),
+                'photo2': (img2_bytes, 'test2.jpg'),
+                'height': '180',
+                'weight1': '90',
+                'weight2': '85'
+            },
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 200
+        comparison = response.get_json()['comparison']
+        assert comparison['before']['bmi'] == pytest.approx(27.78, abs=0.01)
+        assert comparison['after']['bmi'] == pytest.approx(26.23, abs=0.01)
+    
+    def test_compare_photos_raw_body(self, client, sample_image_file):
+        """Test comparison of two photos sent back to back in a raw body"""
+        photo1 = sample_image_file.getvalue()
+        img2_bytes = io.BytesIO()
+        Image.new('RGB', (224, 224), color=(150, 150, 150)).save(img2_bytes, format='JPEG')
+        
+        response = client.post(
+            f'/api/ml/compare?photo1_size={len(photo1)}&height=180&weight1=90&weight2=85',
+            data=photo1 + img2_bytes.getvalue(),
+            content_type='application/octet-stream'
+        )
+        
+        assert response.status_code == 200
+        comparison = response.get_json()['comparison']
+        assert comparison['before']['bmi'] == pytest.approx(27.78, abs=0.01)
+        assert comparison['after']['bmi'] == pytest.approx(26.23, abs=0.01)
+        
+        response = client.post(
+            '/api/ml/compare',
+            data=photo1 + img2_bytes.getvalue(),
+            content_type='application/octet-stream'
+        )
+        assert response.status_code == 400
+    
     def test_compare_photos_missing_photo(self, client, sample_image_file):
         """Test comparison with missing photo"""
         response = client.post(
@@ -178,6 +375,28 @@ class TestAPIEndpoints:
         assert data['total'] == 3
         assert len(data['results']) == 3
     
+    def test_batch_analyze_partial_failure(self, client, sample_image_file):
+        """Test that a corrupt photo only fails its own batch entry"""
+        response = client.post(
+            '/api/ml/batch-analyze',
+            data={'photos[]': [
+                (sample_image_file, 'good.jpg'),
+                (io.BytesIO(b"not an image"), 'broken.jpg'),
+                (io.BytesIO(b"not an image"), 'notes.txt')
+            ]},
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 200
+        results = response.get_json()['results']
+        
+        assert [r['index'] for r in results] == [0, 1, 2]
+        assert results[0]['success'] is True
+        assert 'analysis' in results[0]
+        assert results[1]['success'] is False
+        assert results[1]['filename'] == 'broken.jpg'
+        assert results[2]['success'] is False
+    
     def test_batch_analyze_too_many(self, client):
         """Test batch analysis with too many photos"""
         # Try to upload 11 photos (max is 10)
@@ -199,6 +418,139 @@ class TestAPIEndpoints:
         data = response.get_json()
         assert data['success'] is False
     
+    def test_batch_analyze_stream(self, client):
+        """Test streamed batch analysis beyond the 10-photo cap"""
+        photos = []
+        for i in range(24):
+            img_bytes = io.BytesIO()
+            Image.new('RGB', (160, 120), color=(i * 10, 100, 150)).save(img_bytes, format='JPEG')
+            img_bytes.seek(0)
+            photos.append((img_bytes, f'photo{i}.jpg'))
+        photos.append((io.BytesIO(b"not an image"), 'broken.jpg'))
+        photos.append((io.BytesIO(b"not an image"), 'notes.txt'))
+        
+        response = client.post(
+            '/api/ml/batch-analyze/stream',
+            data={'photos[]': photos},
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        by_index = {line['index']: line for line in lines}
+        
+        assert len(lines) == 26
+        assert sorted(by_index) == list(range(26))
+        assert all(by_index[i]['success'] for i in range(24))
+        assert by_index[5]['filename'] == 'photo5.jpg'
+        assert 'muscle_score' in by_index[5]['analysis']
+        assert by_index[24]['success'] is False
+        assert by_index[25]['error'] == 'Invalid file type'
+    
+    def test_batch_analyze_stream_requires_multipart(self, client):
+        """Test streamed batch analysis rejects non-multipart bodies"""
+        response = client.post('/api/ml/batch-analyze/stream', json={'photos': []})
+        
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
+    
+    def test_progress_timeline(self, client, sample_image_file, mocker):
+        """Test a timeline looks up earlier photos and only infers the new one"""
+        import src.app as service
+        
+        first = client.post(
+            '/api/ml/analyze',
+            data={'photo': (sample_image_file, 'test.jpg')},
+            content_type='multipart/form-data'
+        ).get_json()['analysis']
+        
+        img_bytes = io.BytesIO()
+        Image.new('RGB', (224, 224), color=(91, 101, 111)).save(img_bytes, format='JPEG')
+        forward = mocker.spy(service.analyzer.engine, 'predict')
+        
+        response = client.post('/api/ml/timeline', json={
+            'height': 180,
+            'photos': [
+                {'date': '2024-03-01', 'image': base64.b64encode(img_bytes.getvalue()).decode(), 'weight': 80},
+                {'date': '2024-01-01', 'image_id': first['image_id'], 'weight': 84},
+                {'date': '2024-02-01', 'image_id': 'deadbeef'}
+            ]
+        })
+        
+        assert response.status_code == 200
+        timeline = response.get_json()['timeline']
+        assert forward.call_count == 1
+        assert forward.call_args[0][0].shape[0] == 1
+        
+        assert [photo['index'] for photo in timeline['photos']] == [1, 2, 0]
+        assert timeline['photos'][0]['analysis']['muscle_score'] == first['muscle_score']
+        assert timeline['photos'][0]['analysis']['bmi'] == 25.93
+        assert 'Unknown or expired image_id' in timeline['photos'][1]['error']
+        assert timeline['deltas'][0]['from_index'] == 1
+        assert timeline['deltas'][0]['days'] == 60
+        assert timeline['trends']['body_fat_estimate']['change_per_week'] is not None
+        assert timeline['smoothing_days'] == 14
+    
+    def test_progress_timeline_multipart(self, client, sample_image_file):
+        """Test timeline entries naming uploaded files"""
+        response = client.post(
+            '/api/ml/timeline',
+            data={
+                'photos': json.dumps([
+                    {'date': '2024-01-01T08:30:00', 'file': 'jan'},
+                    {'date': '2024-02-01', 'file': 'feb'}
+                ]),
+                'jan': (sample_image_file, 'jan.jpg'),
+                'feb': (io.BytesIO(sample_image_file.getvalue()), 'feb.jpg'),
+                'smoothing_days': '7'
+            },
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 200
+        timeline = response.get_json()['timeline']
+        assert timeline['photos'][0]['date'] == '2024-01-01T08:30:00'
+        assert timeline['deltas'][0]['muscle_gain'] == 0
+        assert timeline['smoothing_days'] == 7
+    
+    def test_progress_timeline_invalid(self, client):
+        """Test malformed timeline requests are rejected"""
+        for body in (
+            {},
+            {'photos': []},
+            {'photos': [{'image_id': 'abc'}]},
+            {'photos': [{'date': '2024-01-01'}]},
+            {'photos': [{'date': '2024-01-01', 'file': 'missing'}]},
+            {'photos': [{'date': '2024-01-01', 'image_id': 'abc'}], 'smoothing_days': -1}
+        ):
+            response = client.post('/api/ml/timeline', json=body)
+            assert response.status_code == 400
+            assert response.get_json()['success'] is False
+    
+    def test_metrics_endpoint(self, client, sample_image_file):
+        """Test Prometheus metrics cover requests, stages and cache lookups"""
+        client.post(
+            '/api/ml/analyze?include_quality=true',
+            data={'photo': (sample_image_file, 'test.jpg')},
+            content_type='multipart/form-data'
+        )
+        client.get('/api/ml/nonexistent')
+        
+        response = client.get('/metrics')
+        
+        assert response.status_code == 200
+        assert response.content_type.startswith('text/plain; version=0.0.4')
+        text = response.get_data(as_text=True)
+        assert 'ml_requests_total{endpoint="/api/ml/analyze",method="POST"}' in text
+        assert 'ml_request_errors_total{endpoint="unmatched",status="404"}' in text
+        for stage in ('upload_read', 'pose_quality', 'scoring', 'serialize'):
+            assert f'ml_stage_duration_seconds_count{{stage="{stage}"}}' in text
+        assert 'ml_cache_lookups_total{endpoint="/api/ml/analyze",result=' in text
+        assert 'ml_startup_seconds{phase="warmup"}' in text
+        assert 'ml_model_ready 1' in text
+    
     def test_404_endpoint(self, client):
         """Test non-existent endpoint"""
         response = client.get('/api/ml/nonexistent')
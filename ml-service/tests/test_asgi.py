@@ -0,0 +1,311 @@
+"""
+Integration tests for the ASGI front-end
+
+Checks the async routes against the Flask app's responses and serves
+many concurrent connections from one event loop.
+"""
+
+import pytest
+import asyncio
+import sys
+import os
+from PIL import Image
+import io
+import base64
+import json
+
+import httpx
+from starlette.testclient import TestClient
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.app import app as flask_app, _ready
+from src.asgi import app
+
+
+@pytest.fixture(scope='module')
+def client():
+    """Create ASGI test client once the model is warm"""
+    assert _ready.wait(120)
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def flask_client():
+    """Create Flask test client for parity checks"""
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as client:
+        yield client
+
+
+def make_jpeg(color, size=(224, 224)):
+    """Encode a solid-color JPEG"""
+    img_bytes = io.BytesIO()
+    Image.new('RGB', size, color=color).save(img_bytes, format='JPEG')
+    return img_bytes.getvalue()
+
+
+class TestASGIEndpoints:
+    """Test suite for the ASGI routes"""
+
+    def test_health_and_ready(self, client):
+        """Test liveness and readiness probes"""
+        assert client.get('/health').json()['status'] == 'healthy'
+
+        response = client.get('/ready')
+        assert response.status_code == 200
+        assert response.json()['ready'] is True
+
+    def test_analyze_matches_flask(self, client, flask_client):
+        """Test multipart analysis returns the same JSON as the Flask app"""
+        photo = make_jpeg((128, 110, 100))
+        form = {'weight': '80', 'height': '180', 'age': '30'}
+
+        response = client.post(
+            '/api/ml/analyze?include_quality=true',
+            files={'photo': ('test.jpg', photo, 'image/jpeg')},
+            data=form
+        )
+        expected = flask_client.post(
+            '/api/ml/analyze?include_quality=true',
+            data=dict(form, photo=(io.BytesIO(photo), 'test.jpg')),
+            content_type='multipart/form-data'
+        ).get_json()
+
+        assert response.status_code == 200
+        analysis = response.json()['analysis']
+        analysis.pop('queue_wait_ms', None)
+        expected['analysis'].pop('queue_wait_ms', None)
+        assert analysis == expected['analysis']
+
+    def test_analyze_base64(self, client):
+        """Test base64 JSON analysis and rejection of non-images"""
+        payload = base64.b64encode(make_jpeg((90, 90, 90))).decode()
+
+        response = client.post('/api/ml/analyze', json={'image': payload, 'weight': 75, 'height': 175})
+        assert response.status_code == 200
+        assert 'bmi' in response.json()['analysis']
+
+        response = client.post('/api/ml/analyze', json={'image': base64.b64encode(b"nope").decode()})
+        assert response.status_code == 400
+
+    def test_analyze_raw_body_matches_flask(self, client, flask_client):
+        """Test a raw image body with query metrics matches the Flask app"""
+        photo = make_jpeg((110, 95, 80))
+        url = '/api/ml/analyze?weight=80&height=180&gender=female'
+
+        response = client.post(url, content=photo, headers={'Content-Type': 'image/jpeg'})
+        expected = flask_client.post(url, data=photo, content_type='image/jpeg').get_json()
+
+        assert response.status_code == 200
+        analysis = response.json()['analysis']
+        analysis.pop('queue_wait_ms', None)
+        expected['analysis'].pop('queue_wait_ms', None)
+        assert analysis == expected['analysis']
+
+        response = client.post(url, content=b"nope", headers={'Content-Type': 'application/octet-stream'})
+        assert response.status_code == 400
+
+    def test_analyze_errors(self, client):
+        """Test missing data and invalid file types"""
+        assert client.post('/api/ml/analyze').status_code == 400
+
+        response = client.post(
+            '/api/ml/analyze',
+            files={'photo': ('notes.txt', b"not an image", 'text/plain')}
+        )
+        assert response.status_code == 400
+        assert response.json()['success'] is False
+
+    def test_rescore(self, client):
+        """Test re-scoring by image_id"""
+        first = client.post(
+            '/api/ml/analyze',
+            files={'photo': ('test.jpg', make_jpeg((70, 80, 90)), 'image/jpeg')}
+        ).json()['analysis']
+
+        response = client.post('/api/ml/rescore', json={'image_id': first['image_id'], 'weight': 82, 'height': 178})
+        assert response.status_code == 200
+        assert response.json()['analysis']['muscle_score'] == first['muscle_score']
+
+        assert client.post('/api/ml/rescore', json={'image_id': 'deadbeef'}).status_code == 404
+        assert client.post('/api/ml/rescore', json={}).status_code == 400
+        assert client.post('/api/ml/rescore', json={'image_id': ['x']}).status_code == 400
+        assert client.post('/api/ml/rescore', json=['x']).status_code == 400
+
+        response = client.post('/api/ml/rescore', json={'image_id': first['image_id'], 'weight': '80', 'height': '178'})
+        assert response.status_code == 200
+        response = client.post('/api/ml/rescore', json={'image_id': first['image_id'], 'gender': 5})
+        assert response.status_code == 400
+
+    def test_compare_with_metrics(self, client):
+        """Test comparison with per-photo metrics"""
+        response = client.post(
+            '/api/ml/compare',
+            files={
+                'photo1': ('a.jpg', make_jpeg((120, 120, 120)), 'image/jpeg'),
+                'photo2': ('b.jpg', make_jpeg((140, 140, 140)), 'image/jpeg')
+            },
+            data={'height': '180', 'weight1': '90', 'weight2': '85'}
+        )
+
+        assert response.status_code == 200
+        comparison = response.json()['comparison']
+        assert comparison['before']['bmi'] == pytest.approx(27.78, abs=0.01)
+        assert comparison['after']['bmi'] == pytest.approx(26.23, abs=0.01)
+        assert 'improvements' in comparison
+
+    def test_compare_raw_body(self, client):
+        """Test comparison of two photos sent back to back in a raw body"""
+        photo1 = make_jpeg((120, 120, 120))
+        photo2 = make_jpeg((140, 140, 140))
+
+        response = client.post(
+            f'/api/ml/compare?photo1_size={len(photo1)}&height=180&weight1=90&weight2=85',
+            content=photo1 + photo2,
+            headers={'Content-Type': 'application/octet-stream'}
+        )
+
+        assert response.status_code == 200
+        comparison = response.json()['comparison']
+        assert comparison['after']['bmi'] == pytest.approx(26.23, abs=0.01)
+
+    def test_batch_partial_failure(self, client):
+        """Test a bad photo only fails its own batch entry"""
+        response = client.post(
+            '/api/ml/batch-analyze',
+            files=[
+                ('photos[]', ('good.jpg', make_jpeg((100, 100, 100)), 'image/jpeg')),
+                ('photos[]', ('broken.jpg', b"not an image", 'image/jpeg')),
+                ('photos[]', ('notes.txt', b"not an image", 'text/plain'))
+            ]
+        )
+
+        assert response.status_code == 200
+        results = response.json()['results']
+        assert [r['index'] for r in results] == [0, 1, 2]
+        assert [r['success'] for r in results] == [True, False, False]
+        assert results[1]['filename'] == 'broken.jpg'
+
+    def test_batch_analyze_stream(self, client):
+        """Test streamed batch analysis emits one NDJSON line per photo"""
+        files = [
+            ('photos[]', (f'{i}.jpg', make_jpeg((i * 15, 60, 90), size=(96, 96)), 'image/jpeg'))
+            for i in range(12)
+        ] + [('photos[]', ('notes.txt', b"not an image", 'text/plain'))]
+
+        response = client.post('/api/ml/batch-analyze/stream', files=files)
+
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        by_index = {line['index']: line for line in lines}
+
+        assert sorted(by_index) == list(range(13))
+        assert all(by_index[i]['success'] for i in range(12))
+        assert by_index[12]['error'] == 'Invalid file type'
+
+    def test_progress_timeline_matches_flask(self, client, flask_client):
+        """Test the timeline route matches Flask, including uploaded files"""
+        photos = [
+            {'date': '2024-01-01', 'image': base64.b64encode(make_jpeg((60, 70, 80))).decode()},
+            {'date': '2024-02-01', 'file': 'feb', 'weight': 81},
+            {'date': '2024-03-01', 'image_id': 'deadbeef'}
+        ]
+        form = {'photos': json.dumps(photos), 'height': '180'}
+
+        asgi_data = client.post(
+            '/api/ml/timeline',
+            data=form,
+            files={'feb': ('feb.jpg', make_jpeg((65, 75, 85)), 'image/jpeg')}
+        ).json()
+        flask_data = flask_client.post(
+            '/api/ml/timeline',
+            data=dict(form, feb=(io.BytesIO(make_jpeg((65, 75, 85))), 'feb.jpg')),
+            content_type='multipart/form-data'
+        ).get_json()
+
+        assert asgi_data['success'] is True
+        for data in (asgi_data, flask_data):
+            for photo in data['timeline']['photos']:
+                photo.get('analysis', {}).pop('queue_wait_ms', None)
+        assert asgi_data == flask_data
+        assert len(asgi_data['timeline']['deltas']) == 1
+
+        assert client.post('/api/ml/timeline', json={'photos': []}).status_code == 400
+
+    def test_body_too_large(self, client):
+        """Test uploads over the size limit get 413"""
+        response = client.post(
+            '/api/ml/analyze',
+            files={'photo': ('big.jpg', b"\0" * (11 * 1024 * 1024), 'image/jpeg')}
+        )
+
+        assert response.status_code == 413
+        assert response.json()['success'] is False
+
+    def test_invalid_content_length(self):
+        """Test a malformed Content-Length header gets 400 before the app runs"""
+        from src.asgi import MaxBodySize
+
+        async def unreachable(scope, receive, send):
+            raise AssertionError("app called")
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        for value in (b'abc', b'-5'):
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {'type': 'http', 'path': '/api/ml/analyze', 'headers': [(b'content-length', value)]}
+            asyncio.run(MaxBodySize(unreachable, 1024)(scope, receive, send))
+
+            assert sent[0]['status'] == 400
+            assert json.loads(sent[1]['body'])['error'] == 'Invalid Content-Length'
+
+    def test_metrics_endpoint(self, client):
+        """Test requests through the ASGI app are counted per route"""
+        from src import metrics
+
+        before = metrics.REQUESTS.value('/api/ml/analyze', 'POST')
+        client.post(
+            '/api/ml/analyze',
+            content=make_jpeg((33, 66, 99)),
+            headers={'Content-Type': 'image/jpeg'}
+        )
+
+        response = client.get('/metrics')
+
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+        assert metrics.REQUESTS.value('/api/ml/analyze', 'POST') == before + 1
+        assert 'ml_cache_lookups_total{endpoint="/api/ml/analyze"' in response.text
+        assert 'ml_stage_duration_seconds_count{stage="upload_read"}' in response.text
+
+    def test_404_endpoint(self, client):
+        """Test non-existent endpoint"""
+        response = client.get('/api/ml/nonexistent')
+
+        assert response.status_code == 404
+        assert response.json()['success'] is False
+
+    def test_concurrent_connections(self, client):
+        """Test many in-flight requests on one event loop"""
+        photos = [make_jpeg((i, 255 - i, 128)) for i in range(0, 96, 3)]
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as http:
+                return await asyncio.gather(*[
+                    http.post('/api/ml/analyze', files={'photo': (f'{i}.jpg', photo, 'image/jpeg')})
+                    for i, photo in enumerate(photos)
+                ])
+
+        responses = asyncio.run(run())
+
+        assert [r.status_code for r in responses] == [200] * len(photos)
+        assert all(r.json()['success'] for r in responses)
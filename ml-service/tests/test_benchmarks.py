@@ -0,0 +1,120 @@
+"""
+Smoke tests for the benchmark harnesses
+
+Runs each harness on tiny inputs so a change that breaks a benchmark is
+caught by the test suite rather than on the next performance run.
+"""
+
+import pytest
+import json
+import sys
+import os
+
+# Add parent and benchmarks directories to path to import the harnesses
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import analyzer_suite
+import load_test
+from src.app import _ready
+from src.photoAnalyzer import ProgressPhotoAnalyzer
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    """Analyzer without cache or micro-batching, as the suite uses it"""
+    analyzer = ProgressPhotoAnalyzer()
+    analyzer.quality_max_side = 1024
+    return analyzer
+
+
+class TestAnalyzerSuite:
+    """Test suite for benchmarks/analyzer_suite.py"""
+
+    def test_suite_runs_on_small_images(self, analyzer):
+        """Test every case kind runs and reports complete results"""
+        images = {
+            name: [analyzer_suite.synthetic_jpeg(64, 48, seed) for seed in (0, 1)]
+            for name in ('224px', '1080p')
+        }
+        cases = [
+            case for case in analyzer_suite.build_cases(analyzer, images)
+            if case[0].endswith(('/224px', '/batch4', '/batch64'))
+        ]
+
+        results = analyzer_suite.run_suite(cases, iterations=2, warmup=1, rounds=2)
+
+        assert set(results) == {
+            'preprocess_image/224px', 'analyze_photo/224px', 'compare_photos/224px',
+            'detect_pose_quality/224px', 'analyze_photos/1080p/batch4', 'analyses_from_raw/batch64'
+        }
+        for result in results.values():
+            assert result['calls'] == 4
+            assert 0 < result['best_p50_ms']
+            assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+            assert result['throughput_ips'] > 0
+            assert result['peak_alloc_mb'] >= 0
+        assert results['analyze_photos/1080p/batch4']['images_per_call'] == 4
+
+    def test_compare_flags_regressions(self, capsys):
+        """Test the baseline comparison ignores noise and flags real growth"""
+        base = {'best_p50_ms': 10.0, 'peak_alloc_mb': 20.0}
+        results = {
+            'steady': dict(base, best_p50_ms=10.3),
+            'slower': dict(base, best_p50_ms=14.0),
+            'tiny': {'best_p50_ms': 0.2, 'peak_alloc_mb': 0.1},
+            'bigger': dict(base, peak_alloc_mb=30.0),
+            'added': base
+        }
+        baseline = {
+            'steady': base,
+            'slower': base,
+            'tiny': {'best_p50_ms': 0.1, 'peak_alloc_mb': 0.05},
+            'bigger': base
+        }
+
+        regressions = analyzer_suite.compare(results, baseline, threshold=0.15)
+
+        assert regressions == ['slower', 'bigger']
+        assert 'new' in capsys.readouterr().out
+
+
+class TestLoadTest:
+    """Test suite for benchmarks/load_test.py"""
+
+    def test_short_run_against_flask(self, monkeypatch, tmp_path, capsys):
+        """Test a one-second stage of every request kind against the in-process app"""
+        assert _ready.wait(120)
+        output = tmp_path / "load.json"
+        monkeypatch.setattr(sys, 'argv', [
+            'load_test.py', '--server', 'flask', '--rates', '2', '--duration', '1',
+            '--width', '160', '--height', '120', '--output', str(output)
+        ])
+
+        load_test.main()
+
+        report = json.loads(output.read_text())
+        stage, = report['stages']
+        assert report['server'] == 'flask'
+        assert stage['offered_rps'] == 2
+        assert stage['error_rate'] == 0
+        assert stage['requests'] == sum(kind['requests'] for kind in stage['by_kind'].values())
+        assert 'Knee' in capsys.readouterr().out
+
+    def test_find_knee(self):
+        """Test the knee is the last stage meeting throughput, error and SLO targets"""
+        def stage(rate, achieved, p99, error_rate=0.0):
+            return {
+                'offered_rps': rate, 'sent_rps': rate, 'achieved_rps': achieved,
+                'requests': 10, 'error_rate': error_rate, 'p99_ms': p99
+            }
+
+        stages = [stage(1, 1, 200), stage(2, 2, 400), stage(4, 3, 900), stage(8, 8, 300)]
+        sustained, failed = load_test.find_knee(stages, slo_ms=1000)
+        assert (sustained['offered_rps'], failed['offered_rps']) == (2, 4)
+
+        sustained, failed = load_test.find_knee([stage(1, 1, 1500)], slo_ms=1000)
+        assert sustained is None and failed['offered_rps'] == 1
+
+        sustained, failed = load_test.find_knee(stages[:2], slo_ms=1000)
+        assert sustained['offered_rps'] == 2 and failed is None
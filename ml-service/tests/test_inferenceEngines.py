@@ -0,0 +1,199 @@
+"""
+Unit tests for pluggable inference engines
+
+Uses a small three-head model with the analyzer's input/output layout so
+TFLite conversion stays fast.
+"""
+
+import pytest
+import numpy as np
+import sys
+import os
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tensorflow.keras import layers, models, Model
+
+from src.inferenceEngines import BucketedEngine, KerasEngine, TFLiteEngine, create_engine
+from src.metrics import FORWARD_BUCKET_SECONDS, FORWARD_PADDING_ROWS
+from src.exportEngines import convert, parity_report
+
+
+@pytest.fixture(scope='module')
+def small_model():
+    """Tiny model with (224, 224, 3) input and three sigmoid heads"""
+    inputs = layers.Input(shape=(224, 224, 3))
+    x = layers.Conv2D(8, 3, strides=4, activation='relu')(inputs)
+    x = layers.GlobalAveragePooling2D()(x)
+    outputs = [
+        layers.Dense(1, activation='sigmoid', name=name)(x)
+        for name in ('body_fat', 'muscle_score', 'posture_score')
+    ]
+    return Model(inputs=inputs, outputs=outputs)
+
+
+@pytest.fixture(scope='module')
+def samples():
+    """Preprocessed-range sample inputs"""
+    rng = np.random.default_rng(0)
+    return rng.uniform(-1, 1, (8, 224, 224, 3)).astype(np.float32)
+
+
+class ShapeRecorder:
+    """Wraps an engine and records every batch size it runs"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.name = engine.name
+        self.img_size = engine.img_size
+        self.sizes = []
+
+    def warmup(self, batch_sizes=(1,)):
+        self.engine.warmup(batch_sizes)
+
+    def predict(self, batch):
+        self.sizes.append(len(batch))
+        return self.engine.predict(batch)
+
+
+class TestInferenceEngines:
+    """Test suite for engine creation and parity"""
+
+    def test_keras_engine_outputs(self, small_model, samples):
+        """Test Keras engine output shapes for several batch sizes"""
+        engine = create_engine('keras', model=small_model)
+        engine.warmup()
+
+        assert isinstance(engine, KerasEngine)
+        for n in (1, 3):
+            outputs = engine.predict(samples[:n])
+            assert len(outputs) == 3
+            assert all(output.shape == (n, 1) for output in outputs)
+
+    @pytest.mark.parametrize('name,quantize_int8,tolerance', [
+        ('tflite-fp16', False, 0.5),
+        ('tflite-int8', True, 3.0),
+    ])
+    def test_tflite_engine_parity(self, tmp_path, small_model, samples, name, quantize_int8, tolerance):
+        """Test TFLite engines match Keras within tolerance (0-100 scale)"""
+        path = tmp_path / f"{name}.tflite"
+        path.write_bytes(convert(small_model, samples, quantize_int8=quantize_int8))
+
+        engine = create_engine(name, artifact_path=str(path))
+        baseline = create_engine('keras', model=small_model)
+
+        assert isinstance(engine, TFLiteEngine)
+        for n in (1, 3):
+            outputs = engine.predict(samples[:n])
+            expected = baseline.predict(samples[:n])
+            for output, reference in zip(outputs, expected):
+                assert output.shape == (n, 1)
+                assert np.max(np.abs(output - reference)) * 100 < tolerance
+
+        report = parity_report(baseline, [engine], samples, iterations=3)
+        assert set(report) == {'keras', name}
+        assert report[name]['max_abs_diff']['muscle'] < tolerance
+        assert report[name]['latency']['p50_ms'] > 0
+
+    def test_model_version(self, tmp_path, small_model):
+        """Test versions follow the weights and the engine, not the instance"""
+        keras = create_engine('keras', model=small_model)
+        assert keras.model_version == create_engine('keras', model=small_model, buckets=(1, 4)).model_version
+        assert keras.model_version.startswith('keras-')
+
+        changed = models.clone_model(small_model)
+        changed.set_weights([weight + 0.01 for weight in small_model.get_weights()])
+        assert create_engine('keras', model=changed).model_version != keras.model_version
+
+        path = tmp_path / "model.tflite"
+        path.write_bytes(convert(small_model))
+        fp16 = create_engine('tflite-fp16', artifact_path=str(path))
+        assert fp16.model_version.startswith('tflite-fp16-')
+        assert fp16.model_version == create_engine('tflite-fp16', artifact_path=str(path)).model_version
+
+    def test_tflite_outputs_mapped_by_head_name(self, tmp_path, samples):
+        """Test TFLite outputs follow head names, not signature order"""
+        inputs = layers.Input(shape=(224, 224, 3))
+        x = layers.GlobalAveragePooling2D()(layers.Conv2D(8, 3, strides=4, activation='relu')(inputs))
+        heads = {
+            name: layers.Dense(1, activation='sigmoid', name=name)(x)
+            for name in ('posture_score', 'body_fat', 'muscle_score')
+        }
+        model = Model(inputs=inputs, outputs=list(heads.values()))
+        path = tmp_path / "model.tflite"
+        path.write_bytes(convert(model))
+
+        outputs = create_engine('tflite-fp16', artifact_path=str(path)).predict(samples[:2])
+        expected = dict(zip(heads, model(samples[:2])))
+        for output, name in zip(outputs, ('body_fat', 'muscle_score', 'posture_score')):
+            assert np.max(np.abs(output - expected[name].numpy())) * 100 < 0.5
+
+    def test_tflite_positional_outputs_rejected(self, tmp_path, small_model):
+        """Test an artifact without head-named outputs fails to load"""
+        import tensorflow as tf
+
+        saved_model_dir = str(tmp_path / "saved_model")
+        small_model.export(saved_model_dir, verbose=False)
+        path = tmp_path / "model.tflite"
+        path.write_bytes(tf.lite.TFLiteConverter.from_saved_model(saved_model_dir).convert())
+
+        with pytest.raises(ValueError, match='re-export'):
+            TFLiteEngine(str(path))
+
+    def test_create_engine_errors(self, small_model):
+        """Test invalid engine configuration is rejected"""
+        with pytest.raises(ValueError):
+            create_engine('keras')
+        with pytest.raises(ValueError):
+            create_engine('tflite-int8')
+        with pytest.raises(ValueError):
+            create_engine('onnx', model=small_model)
+
+    def test_bucketed_engine_pads_and_slices(self, small_model, samples):
+        """Test padded batches give each real row its unpadded outputs"""
+        plain = create_engine('keras', model=small_model)
+        recorder = ShapeRecorder(create_engine('keras', model=small_model))
+        engine = BucketedEngine(recorder, buckets=(1, 2, 4))
+        engine.warmup()
+        recorder.sizes.clear()
+        padding_before = FORWARD_PADDING_ROWS.value('4')
+        timed_before = FORWARD_BUCKET_SECONDS.snapshot('4')[0]
+
+        batch = np.concatenate([samples, samples[:3]])
+        for n in (1, 3, 4, 11):
+            outputs = engine.predict(batch[:n])
+            for output, reference in zip(outputs, plain.predict(batch[:n])):
+                assert output.shape == (n, 1)
+                np.testing.assert_allclose(output, reference, atol=1e-6)
+
+        # 3 -> 4, 11 -> 4 + 4 + 4 (last chunk of 3 padded)
+        assert recorder.sizes == [1, 4, 4, 4, 4, 4]
+        assert FORWARD_PADDING_ROWS.value('4') - padding_before == 2
+        assert FORWARD_BUCKET_SECONDS.snapshot('4')[0] - timed_before == 5
+
+    def test_bucketed_engine_warms_every_bucket(self, small_model):
+        """Test warmup compiles all buckets, whatever sizes are requested"""
+        engine = create_engine('keras', model=small_model, buckets=(1, 2, 4, 8))
+        engine.warmup((1, 3))
+
+        assert isinstance(engine, BucketedEngine)
+        assert engine.name == 'keras'
+        assert engine.engine.warmed_batch_sizes == {1, 2, 4, 8}
+        assert engine.warmed_batch_sizes == {1, 2, 3, 4, 8}
+        assert engine.bucket_for(3) == 4
+        assert engine.bucket_for(8) == 8
+        with pytest.raises(ValueError):
+            engine.bucket_for(9)
+        with pytest.raises(ValueError):
+            BucketedEngine(engine.engine, buckets=(0, 2))
+
+    def test_xla_engine_parity(self, small_model, samples):
+        """Test the XLA-compiled forward pass matches the plain graph"""
+        xla = create_engine('keras', model=small_model, buckets=(1, 4), jit_compile=True)
+        xla.warmup()
+        plain = create_engine('keras', model=small_model)
+
+        assert xla.engine.jit_compile
+        for output, reference in zip(xla.predict(samples[:3]), plain.predict(samples[:3])):
+            np.testing.assert_allclose(output, reference, atol=1e-5)
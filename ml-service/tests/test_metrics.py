@@ -0,0 +1,233 @@
+"""
+Unit tests for the Prometheus metrics registry
+"""
+
+import pytest
+import contextvars
+import glob
+import json
+import subprocess
+import sys
+import os
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src import metrics
+from src.metrics import Counter, Gauge, Histogram
+
+
+class TestMetricTypes:
+    """Test suite for Counter, Gauge and Histogram"""
+
+    def test_counter_renders_per_label_set(self):
+        """Test counters add up per label values and render sorted"""
+        counter = Counter('test_requests_total', 'Requests.', ('endpoint',))
+        counter.inc('/b')
+        counter.inc('/a', amount=2)
+        counter.inc('/b')
+
+        assert counter.render() == [
+            '# HELP test_requests_total Requests.',
+            '# TYPE test_requests_total counter',
+            'test_requests_total{endpoint="/a"} 2',
+            'test_requests_total{endpoint="/b"} 2'
+        ]
+
+    def test_label_values_escaped(self):
+        """Test quotes, backslashes and newlines in label values"""
+        counter = Counter('test_total', 'Test.', ('path',))
+        counter.inc('a"b\\c\nd')
+
+        assert counter.render()[-1] == 'test_total{path="a\\"b\\\\c\\nd"} 1'
+
+    def test_histogram_buckets_cumulative(self):
+        """Test bucket counts are cumulative and end with +Inf, sum and count"""
+        histogram = Histogram('test_seconds', 'Latency.', ('stage',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, 'decode')
+
+        assert histogram.render()[2:] == [
+            'test_seconds_bucket{stage="decode",le="0.1"} 2',
+            'test_seconds_bucket{stage="decode",le="1"} 3',
+            'test_seconds_bucket{stage="decode",le="+Inf"} 4',
+            'test_seconds_sum{stage="decode"} 3.65',
+            'test_seconds_count{stage="decode"} 4'
+        ]
+        assert histogram.snapshot('decode') == (4, pytest.approx(3.65))
+        assert histogram.snapshot('resize') == (0, 0.0)
+
+    def test_gauge_without_labels(self):
+        """Test an unlabelled gauge keeps its last value"""
+        gauge = Gauge('test_ready', 'Ready.')
+        gauge.set(0)
+        gauge.set(1)
+
+        assert gauge.render()[-1] == 'test_ready 1'
+
+
+class TestRecording:
+    """Test suite for the module-level recording helpers"""
+
+    @pytest.fixture(autouse=True)
+    def clean_registry(self):
+        """Start every test from empty metrics"""
+        metrics.reset()
+        yield
+        metrics.reset()
+
+    def test_timed_records_stage(self):
+        """Test a timed block lands in the stage histogram"""
+        with metrics.timed('decode'):
+            pass
+
+        count, total = metrics.STAGE_SECONDS.snapshot('decode')
+        assert count == 1
+        assert 0 <= total < 1
+
+    def test_timed_records_on_error(self):
+        """Test a failing stage is still timed and the error propagates"""
+        with pytest.raises(ValueError):
+            with metrics.timed('forward'):
+                raise ValueError("boom")
+
+        assert metrics.STAGE_SECONDS.snapshot('forward')[0] == 1
+
+    def test_record_request_counts_errors(self):
+        """Test requests are counted per endpoint and 4xx/5xx as errors"""
+        metrics.record_request('/api/ml/analyze', 'POST', 200, 0.02)
+        metrics.record_request('/api/ml/analyze', 'POST', 400, 0.001)
+
+        assert metrics.REQUESTS.value('/api/ml/analyze', 'POST') == 2
+        assert metrics.ERRORS.value('/api/ml/analyze', '400') == 1
+        assert metrics.ERRORS.value('/api/ml/analyze', '200') == 0
+        assert metrics.REQUEST_SECONDS.snapshot('/api/ml/analyze')[0] == 2
+
+    def test_record_startup_and_render(self):
+        """Test start-up phases are exported in seconds"""
+        metrics.record_startup({'import_ms': 1500.0, 'warmup_ms': 250.0}, ready=True)
+        text = metrics.render()
+
+        assert 'ml_startup_seconds{phase="import"} 1.5\n' in text
+        assert 'ml_startup_seconds{phase="warmup"} 0.25\n' in text
+        assert 'ml_model_ready 1\n' in text
+        assert text.endswith('\n')
+
+    def test_endpoint_context(self):
+        """Test the endpoint label is per context and defaults outside a request"""
+        def serve():
+            metrics.set_endpoint('/api/ml/compare')
+            return metrics.current_endpoint()
+
+        assert contextvars.Context().run(serve) == '/api/ml/compare'
+        assert contextvars.Context().run(metrics.current_endpoint) == 'none'
+
+
+class TestMultiprocess:
+    """Test suite for merging the values of several processes"""
+
+    @pytest.fixture(autouse=True)
+    def clean_registry(self, monkeypatch, tmp_path):
+        """Start from empty metrics, writing to a temporary directory"""
+        metrics.reset()
+        monkeypatch.setattr(metrics, '_writer', metrics._SnapshotWriter(str(tmp_path)))
+        yield
+        metrics.reset()
+
+    def record_in_subprocess(self, directory, code):
+        """Run code in a fresh interpreter sharing the metrics directory"""
+        env = dict(os.environ, ML_METRICS_DIR=directory)
+        subprocess.run(
+            [sys.executable, '-c', 'from src import metrics\n' + code],
+            cwd=os.path.join(os.path.dirname(__file__), '..'),
+            env=env,
+            check=True
+        )
+
+    def test_render_sums_processes(self, tmp_path):
+        """Test counters and histograms add up over processes, including exited ones"""
+        self.record_in_subprocess(str(tmp_path), (
+            "metrics.REQUESTS.inc('/api/ml/analyze', 'POST', amount=2)\n"
+            "metrics.FORWARD_BUCKET_SECONDS.observe(0.02, '4')\n"
+            "metrics.MODEL_READY.set(1)"
+        ))
+        metrics.REQUESTS.inc('/api/ml/analyze', 'POST')
+        metrics.FORWARD_BUCKET_SECONDS.observe(0.2, '4')
+        metrics.MODEL_READY.set(0)
+
+        text = metrics.render()
+
+        assert 'ml_requests_total{endpoint="/api/ml/analyze",method="POST"} 3\n' in text
+        assert 'ml_forward_bucket_duration_seconds_count{bucket="4"} 2\n' in text
+        assert 'ml_forward_bucket_duration_seconds_bucket{bucket="4",le="0.025"} 1\n' in text
+        # The exited process's gauge no longer counts
+        assert 'ml_model_ready 0\n' in text
+        assert metrics.REQUESTS.value('/api/ml/analyze', 'POST') == 1
+
+    def test_exited_processes_folded(self, tmp_path):
+        """Test files of exited processes fold into one aggregate without double counting"""
+        for _ in range(2):
+            self.record_in_subprocess(str(tmp_path), (
+                "metrics.REQUESTS.inc('/health', 'GET', amount=2)\n"
+                "metrics.FORWARD_BUCKET_SECONDS.observe(0.02, '4')\n"
+                "metrics.MODEL_READY.set(1)"
+            ))
+        assert len(glob.glob(str(tmp_path / 'metrics-*.json'))) == 2
+
+        merged = metrics.merge_processes(str(tmp_path))
+
+        assert merged['ml_requests_total'] == {('/health', 'GET'): 4}
+        assert merged['ml_forward_bucket_duration_seconds'][('4',)][1] == pytest.approx(0.04)
+        assert merged['ml_model_ready'] == {}
+        assert not glob.glob(str(tmp_path / 'metrics-*.json'))
+
+        # Later scrapes forget deleted files; later exits add to the aggregate
+        assert metrics.merge_processes(str(tmp_path))['ml_requests_total'] == {('/health', 'GET'): 4}
+        with open(tmp_path / metrics.AGGREGATE_FILE) as f:
+            assert json.load(f)['folded'] == []
+        self.record_in_subprocess(str(tmp_path), "metrics.REQUESTS.inc('/health', 'GET')")
+        assert metrics.merge_processes(str(tmp_path))['ml_requests_total'] == {('/health', 'GET'): 5}
+
+    def test_interrupted_fold_not_counted_twice(self, tmp_path):
+        """Test a file folded but not yet deleted is only deleted"""
+        self.record_in_subprocess(str(tmp_path), "metrics.REQUESTS.inc('/health', 'GET', amount=3)")
+        [path] = glob.glob(str(tmp_path / 'metrics-*.json'))
+        metrics.merge_processes(str(tmp_path))
+        # As if the process merging had died between the aggregate write and the delete
+        with open(tmp_path / metrics.AGGREGATE_FILE) as f:
+            aggregate = json.load(f)
+        aggregate['folded'] = [os.path.basename(path)]
+        with open(tmp_path / metrics.AGGREGATE_FILE, 'w') as f:
+            json.dump(aggregate, f)
+        with open(path, 'w') as f:
+            json.dump({'pid': 999999999, 'metrics': {'ml_requests_total': [[['/health', 'GET'], 3]]}}, f)
+
+        assert metrics.merge_processes(str(tmp_path))['ml_requests_total'] == {('/health', 'GET'): 3}
+        assert not os.path.exists(path)
+
+    def test_gauges_of_live_processes(self, tmp_path):
+        """Test gauges combine over live processes with their mode"""
+        # Another live process (this pid, its own file)
+        metrics.MODEL_READY.set(1)
+        metrics.STARTUP_SECONDS.set(2.0, 'build')
+        metrics._SnapshotWriter(str(tmp_path)).write()
+        metrics.MODEL_READY.set(0)
+        metrics.STARTUP_SECONDS.set(1.0, 'build')
+
+        merged = metrics.merge_processes(str(tmp_path))
+
+        assert merged['ml_model_ready'] == {(): 0}
+        assert merged['ml_startup_seconds'] == {('build',): 2.0}
+
+    def test_write_skips_unchanged_values(self, tmp_path):
+        """Test nothing is written without values or changes"""
+        metrics._writer.write()
+        assert not os.listdir(tmp_path)
+
+        metrics.REQUESTS.inc('/health', 'GET')
+        metrics._writer.write()
+        modified = os.stat(metrics._writer.path).st_mtime_ns
+        metrics._writer.write()
+
+        assert os.listdir(tmp_path) == [os.path.basename(metrics._writer.path)]
+        assert os.stat(metrics._writer.path).st_mtime_ns == modified
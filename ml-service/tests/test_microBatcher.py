@@ -0,0 +1,138 @@
+"""
+Unit tests for the micro-batching scheduler
+
+Uses a NumPy stand-in for the model so batching behaviour can be checked
+without TensorFlow.
+"""
+
+import pytest
+import numpy as np
+import threading
+import sys
+import os
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.microBatcher import MicroBatchScheduler
+
+
+def make_batch(value, n=1):
+    """Create an (n, 224, 224, 3) batch filled with value"""
+    return np.full((n, 224, 224, 3), value, dtype=np.float32)
+
+
+class RecordingModel:
+    """Fake three-head model that records the batch sizes it receives"""
+
+    def __init__(self):
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+
+    def __call__(self, batch):
+        with self.lock:
+            self.batch_sizes.append(len(batch))
+        means = batch.reshape(len(batch), -1).mean(axis=1, keepdims=True)
+        return means, means * 2, means * 3
+
+
+class TestMicroBatchScheduler:
+    """Test suite for MicroBatchScheduler"""
+
+    @pytest.fixture
+    def model(self):
+        return RecordingModel()
+
+    def test_single_request(self, model):
+        """Test a lone request is served after the wait window"""
+        scheduler = MicroBatchScheduler(model, max_batch_size=4, max_wait_ms=1)
+
+        outputs, queue_wait_ms = scheduler.predict(make_batch(0.5), timeout=5)
+        scheduler.stop()
+
+        assert len(outputs) == 3
+        assert outputs[0].shape == (1, 1)
+        assert outputs[1][0][0] == pytest.approx(1.0)
+        assert queue_wait_ms >= 0
+
+    def test_concurrent_requests_share_forward_pass(self, model):
+        """Test concurrent submissions are grouped and fanned back out"""
+        scheduler = MicroBatchScheduler(model, max_batch_size=8, max_wait_ms=200)
+
+        futures = [scheduler.submit(make_batch(i / 10.0)) for i in range(8)]
+        results = [future.result(timeout=5) for future in futures]
+        scheduler.stop()
+
+        assert model.batch_sizes == [8]
+        for i, (outputs, queue_wait_ms) in enumerate(results):
+            assert outputs[0][0][0] == pytest.approx(i / 10.0)
+            assert outputs[2][0][0] == pytest.approx(3 * i / 10.0)
+
+    def test_max_batch_size_respected(self, model):
+        """Test batches never exceed max_batch_size"""
+        scheduler = MicroBatchScheduler(model, max_batch_size=4, max_wait_ms=50)
+
+        futures = [scheduler.submit(make_batch(0.1, n=3)) for _ in range(4)]
+        for future in futures:
+            outputs, _ = future.result(timeout=5)
+            assert outputs[0].shape == (3, 1)
+        scheduler.stop()
+
+        assert all(size <= 4 for size in model.batch_sizes)
+        assert sum(model.batch_sizes) == 12
+
+    def test_errors_propagate_to_callers(self):
+        """Test a failing forward pass fails every future in the batch"""
+        def failing_model(batch):
+            raise RuntimeError("model exploded")
+
+        scheduler = MicroBatchScheduler(failing_model, max_batch_size=4, max_wait_ms=1)
+
+        with pytest.raises(RuntimeError, match="model exploded"):
+            scheduler.predict(make_batch(0.5), timeout=5)
+        scheduler.stop()
+
+    def test_submit_after_stop(self, model):
+        """Test submitting to a stopped scheduler fails fast"""
+        scheduler = MicroBatchScheduler(model)
+        scheduler.stop()
+
+        with pytest.raises(RuntimeError):
+            scheduler.submit(make_batch(0.5))
+
+    def test_invalid_batch_size(self, model):
+        """Test max_batch_size must be positive"""
+        with pytest.raises(ValueError):
+            MicroBatchScheduler(model, max_batch_size=0)
+
+    def test_bounded_queue_blocks_submitters(self):
+        """Test submit() blocks while max_queue requests are waiting"""
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_model(batch):
+            started.set()
+            release.wait(timeout=5)
+            means = batch.reshape(len(batch), -1).mean(axis=1, keepdims=True)
+            return means, means, means
+
+        scheduler = MicroBatchScheduler(slow_model, max_batch_size=1, max_wait_ms=1, max_queue=1)
+        running = scheduler.submit(make_batch(0.1))
+        assert started.wait(timeout=5)
+        queued = scheduler.submit(make_batch(0.2))
+
+        submitted = threading.Event()
+        blocked = threading.Thread(target=lambda: (scheduler.submit(make_batch(0.3)), submitted.set()))
+        blocked.start()
+        assert not submitted.wait(timeout=0.2)
+
+        release.set()
+        assert submitted.wait(timeout=5)
+        assert queued.result(timeout=5)[0][0][0][0] == pytest.approx(0.2)
+        assert running.result(timeout=5)[0][0][0][0] == pytest.approx(0.1)
+        scheduler.stop()
+
+    def test_invalid_queue_size(self, model):
+        """Test max_queue must not be negative"""
+        with pytest.raises(ValueError):
+            MicroBatchScheduler(model, max_queue=-1)
@@ -0,0 +1,330 @@
+"""
+Unit tests for the shared model server and its remote engine
+
+The server is exercised in-process with a NumPy stand-in for the model;
+one test checks analyses through the remote engine against a local one.
+"""
+
+import pytest
+import numpy as np
+import importlib.util
+import subprocess
+import threading
+import sys
+import os
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.inferenceEngines import cpu_quota, thread_counts
+from src.modelServer import ModelServer, RemoteEngine
+
+GUNICORN_CONF = os.path.join(os.path.dirname(__file__), '..', 'gunicorn.conf.py')
+
+
+def make_batch(value, n=1):
+    """Create an (n, 224, 224, 3) batch filled with value"""
+    return np.full((n, 224, 224, 3), value, dtype=np.float32)
+
+
+class RecordingModel:
+    """Fake three-head model that records the batch sizes it receives"""
+
+    def __init__(self):
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+
+    def __call__(self, batch):
+        with self.lock:
+            self.batch_sizes.append(len(batch))
+        means = batch.reshape(len(batch), -1).mean(axis=1, keepdims=True)
+        return means, means * 2, means * 3
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    """Unix socket path for one test"""
+    return str(tmp_path / "model.sock")
+
+
+@pytest.fixture
+def model():
+    return RecordingModel()
+
+
+@pytest.fixture
+def server(model, socket_path):
+    """Running server around the fake model"""
+    server = ModelServer(model, socket_path=socket_path, max_batch_size=8, max_wait_ms=50).start()
+    yield server
+    server.stop()
+
+
+class TestCpuQuota:
+    """Test suite for CPU quota detection"""
+
+    @pytest.fixture(autouse=True)
+    def eight_cpus(self, monkeypatch):
+        monkeypatch.setattr(os, 'sched_getaffinity', lambda pid: set(range(8)), raising=False)
+
+    def write(self, path, text):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+    def test_cgroup_v2_quota(self, tmp_path):
+        """Test cpu.max quotas are rounded up to whole CPUs"""
+        self.write(tmp_path / 'cpu.max', '150000 100000\n')
+        assert cpu_quota(str(tmp_path)) == 2
+
+    def test_cgroup_v2_unlimited(self, tmp_path):
+        """Test an unlimited quota falls back to the usable CPUs"""
+        self.write(tmp_path / 'cpu.max', 'max 100000\n')
+        assert cpu_quota(str(tmp_path)) == 8
+
+    def test_cgroup_v1_quota(self, tmp_path):
+        """Test the v1 quota/period pair is used without cpu.max"""
+        self.write(tmp_path / 'cpu' / 'cpu.cfs_quota_us', '50000\n')
+        self.write(tmp_path / 'cpu' / 'cpu.cfs_period_us', '100000\n')
+        assert cpu_quota(str(tmp_path)) == 1
+
+        self.write(tmp_path / 'cpu' / 'cpu.cfs_quota_us', '-1\n')
+        assert cpu_quota(str(tmp_path)) == 8
+
+    def test_quota_capped_by_affinity(self, tmp_path):
+        """Test a quota above the usable CPUs is capped"""
+        self.write(tmp_path / 'cpu.max', '1600000 100000\n')
+        assert cpu_quota(str(tmp_path)) == 8
+
+    def test_thread_counts(self, monkeypatch):
+        """Test derived thread counts and their overrides"""
+        monkeypatch.delenv('ML_TF_INTRA_OP_THREADS', raising=False)
+        monkeypatch.delenv('ML_TF_INTER_OP_THREADS', raising=False)
+        assert thread_counts(1) == (1, 1)
+        assert thread_counts(4) == (4, 2)
+
+        monkeypatch.setenv('ML_TF_INTRA_OP_THREADS', '3')
+        monkeypatch.setenv('ML_TF_INTER_OP_THREADS', '1')
+        assert thread_counts(4) == (3, 1)
+
+
+class TestModelServer:
+    """Test suite for ModelServer and RemoteEngine"""
+
+    def test_round_trip(self, server, socket_path):
+        """Test outputs come back with the engine's shapes and values"""
+        engine = RemoteEngine(socket_path)
+        batch = np.random.default_rng(0).uniform(-1, 1, (3, 224, 224, 3)).astype(np.float32)
+
+        outputs = engine.predict(batch)
+
+        for output, expected in zip(outputs, RecordingModel()(batch)):
+            assert output.shape == (3, 1)
+            assert output.dtype == np.float32
+            np.testing.assert_array_equal(output, expected)
+
+    def test_clients_share_forward_passes(self, server, model, socket_path):
+        """Test requests from separate connections are micro-batched together"""
+        engine = RemoteEngine(socket_path)
+        results = {}
+
+        def run(i):
+            results[i] = engine.predict(make_batch(i / 10.0))
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+        assert len(model.batch_sizes) < 4
+        assert sum(model.batch_sizes) == 4
+        for i, outputs in results.items():
+            assert outputs[2][0][0] == pytest.approx(3 * i / 10.0)
+
+    def test_model_version(self, model, socket_path):
+        """Test clients learn the served model's version"""
+        server = ModelServer(model, socket_path=socket_path, max_wait_ms=1, model_version='keras-abc').start()
+        try:
+            engine = RemoteEngine(socket_path)
+            assert engine.model_version == 'keras-abc'
+            assert engine.predict(make_batch(0.5))[0][0][0] == pytest.approx(0.5)
+        finally:
+            server.stop()
+
+    def test_model_version_follows_server_restart(self, model, socket_path):
+        """Test the version is asked for again after a reconnect, and refreshed by ping"""
+        engine = RemoteEngine(socket_path)
+        server = ModelServer(model, socket_path=socket_path, max_wait_ms=1, model_version='keras-old').start()
+        assert engine.model_version == 'keras-old'
+        server.stop()
+
+        server = ModelServer(model, socket_path=socket_path, max_wait_ms=1, model_version='keras-new').start()
+        try:
+            engine.predict(make_batch(0.5))
+            assert engine.model_version == 'keras-new'
+        finally:
+            server.stop()
+
+        server = ModelServer(model, socket_path=socket_path, max_wait_ms=1, model_version='keras-newer').start()
+        try:
+            assert engine.ping() is True
+            assert engine._model_version == 'keras-newer'
+        finally:
+            server.stop()
+
+    def test_errors_propagate(self, socket_path):
+        """Test a failing forward pass raises in the client"""
+        def failing_model(batch):
+            raise RuntimeError("model exploded")
+
+        server = ModelServer(failing_model, socket_path=socket_path, max_wait_ms=1).start()
+        try:
+            with pytest.raises(RuntimeError, match="model exploded"):
+                RemoteEngine(socket_path).predict(make_batch(0.5))
+        finally:
+            server.stop()
+
+    def test_ping(self, model, socket_path):
+        """Test ping reports whether the server answers"""
+        engine = RemoteEngine(socket_path)
+        assert engine.ping() is False
+
+        server = ModelServer(model, socket_path=socket_path, max_wait_ms=1).start()
+        try:
+            assert engine.ping() is True
+        finally:
+            server.stop()
+        assert engine.ping(timeout=0.5) is False
+
+    def test_reconnects_after_server_restart(self, model, socket_path):
+        """Test a connection broken by a restart is replaced transparently"""
+        engine = RemoteEngine(socket_path)
+        server = ModelServer(model, socket_path=socket_path, max_wait_ms=1).start()
+        engine.predict(make_batch(0.1))
+        server.stop()
+
+        server = ModelServer(model, socket_path=socket_path, max_wait_ms=1).start()
+        try:
+            assert engine.predict(make_batch(0.2))[0][0][0] == pytest.approx(0.2)
+        finally:
+            server.stop()
+
+    def test_warmup_waits_for_server(self, model, socket_path):
+        """Test warmup() blocks until the server listens, and times out without one"""
+        with pytest.raises(TimeoutError):
+            RemoteEngine(socket_path, startup_timeout=0.3).warmup()
+
+        server = ModelServer(model, socket_path=socket_path, max_wait_ms=1)
+        starter = threading.Timer(0.3, server.start)
+        starter.start()
+        try:
+            engine = RemoteEngine(socket_path, startup_timeout=10)
+            engine.warmup((1, 2, 4))
+            assert engine.warmed_up
+            assert engine.warmed_batch_sizes == {1, 2, 4}
+        finally:
+            starter.join()
+            server.stop()
+
+    def test_remote_analyzer_matches_local(self, socket_path):
+        """Test analyses through the model server match in-process inference"""
+        from PIL import Image
+        from src.photoAnalyzer import ProgressPhotoAnalyzer
+
+        local = ProgressPhotoAnalyzer()
+        server = ModelServer(local.engine.predict, socket_path=socket_path, max_wait_ms=1).start()
+        try:
+            remote = ProgressPhotoAnalyzer(engine='remote', engine_path=socket_path)
+            images = [Image.new('RGB', (300, 400), color=(40 * i, 100, 200 - 40 * i)) for i in range(3)]
+
+            assert remote.model is None
+            assert remote.analyze_photos(images, metrics={'weight': 80, 'height': 180}) == \
+                local.analyze_photos(images, metrics={'weight': 80, 'height': 180})
+        finally:
+            server.stop()
+
+    def test_workers_do_not_import_tensorflow(self):
+        """Test the modules an HTTP worker imports leave TensorFlow unloaded"""
+        code = (
+            "import sys\n"
+            "import src.photoAnalyzer, src.modelServer, src.inferenceEngines\n"
+            "print('tensorflow' in sys.modules)\n"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=os.path.join(os.path.dirname(__file__), '..'),
+            capture_output=True,
+            text=True,
+            timeout=60
+        )
+
+        assert result.stdout.strip() == 'False'
+
+
+class TestSupervisor:
+    """Test suite for the model server supervision in gunicorn.conf.py"""
+
+    @pytest.fixture
+    def conf(self, mocker):
+        """A fresh copy of the gunicorn config module with fast restarts"""
+        spec = importlib.util.spec_from_file_location('gunicorn_conf', GUNICORN_CONF)
+        conf = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(conf)
+        conf.RESTART_BACKOFF_SECONDS = 0.01
+        conf.MODEL_SERVER = True
+        yield conf
+        conf.on_exit(mocker.Mock())
+
+    def supervise(self, conf, mocker, command):
+        """Start command as the model server under the supervisor thread"""
+        conf.MODEL_SERVER_COMMAND = [sys.executable, '-c', command]
+        server = mocker.Mock()
+        conf._start_model_server(dict(os.environ))
+        thread = threading.Thread(target=conf._supervise_model_server, args=(server, dict(os.environ)))
+        thread.start()
+        return server, thread
+
+    def test_restarts_then_halts(self, conf, mocker):
+        """Test a crashing server is restarted, then gunicorn is stopped"""
+        conf.MODEL_SERVER_MAX_RESTARTS = 2
+        halt = mocker.patch.object(conf, '_halt_master')
+
+        server, thread = self.supervise(conf, mocker, 'import sys; sys.exit(3)')
+        thread.join(timeout=30)
+
+        assert not thread.is_alive()
+        halt.assert_called_once()
+        assert server.log.info.call_count == 2
+        assert conf._model_server.returncode == 3
+
+    def test_on_exit_stops_without_restart(self, conf, mocker):
+        """Test stopping gunicorn terminates the server and ends supervision"""
+        halt = mocker.patch.object(conf, '_halt_master')
+        server, thread = self.supervise(conf, mocker, 'import time; time.sleep(60)')
+        process = conf._model_server
+
+        conf.on_exit(server)
+        thread.join(timeout=30)
+
+        assert not thread.is_alive()
+        assert process.returncode is not None
+        assert conf._model_server is process
+        halt.assert_not_called()
+        server.log.error.assert_not_called()
+
+    def test_workers_share_a_store_by_default(self, conf, monkeypatch, mocker):
+        """Test an unset store path becomes a temporary file removed on exit"""
+        monkeypatch.delenv('ML_STORE_PATH', raising=False)
+        conf._prepare_store_path()
+        path = os.environ['ML_STORE_PATH']
+        assert os.path.isdir(os.path.dirname(path))
+
+        conf.on_exit(mocker.Mock())
+        assert not os.path.exists(os.path.dirname(path))
+
+        # An explicit empty path keeps the store disabled
+        monkeypatch.setenv('ML_STORE_PATH', '')
+        conf._store_dir = None
+        conf._prepare_store_path()
+        assert os.environ['ML_STORE_PATH'] == ''
+        assert conf._store_dir is None
@@ -6,15 +6,17 @@ Tests the ML model and image processing functionality.
 
 import pytest
 import numpy as np
+import cv2
 from PIL import Image
 import io
+import threading
 import sys
 import os
 
 # Add parent directory to path to import src modules
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from src.photoAnalyzer import ProgressPhotoAnalyzer, get_analyzer
+from src.photoAnalyzer import ProgressPhotoAnalyzer, DecodedImage, get_analyzer
 
 
 class TestProgressPhotoAnalyzer:
@@ -105,6 +107,57 @@ class TestProgressPhotoAnalyzer:
         assert 'posture_improvement' in comparison['improvements']
         assert 'overall_progress' in comparison['improvements']
     
+    def test_analyze_photos_batch(self, analyzer, sample_image):
+        """Test batched analysis matches per-photo analysis"""
+        img2 = Image.new('RGB', (300, 200), color=(150, 150, 150))
+        
+        results = analyzer.analyze_photos([sample_image, img2])
+        
+        assert [r['index'] for r in results] == [0, 1]
+        assert all(r['success'] for r in results)
+        
+        for result, img in zip(results, [sample_image, img2]):
+            single = analyzer.analyze_photo(img)
+            for key in ('body_fat_estimate', 'muscle_score', 'posture_score', 'overall_score'):
+                assert result['analysis'][key] == pytest.approx(single[key], abs=0.05)
+    
+    def test_analyze_photos_error_isolation(self, analyzer, sample_image):
+        """Test that one bad input does not fail the whole batch"""
+        results = analyzer.analyze_photos([sample_image, "not_a_valid_path.jpg", sample_image])
+        
+        assert results[0]['success'] is True
+        assert results[1]['success'] is False
+        assert 'error' in results[1]
+        assert results[2]['success'] is True
+    
+    def test_analyze_photos_per_photo_metrics(self, analyzer, sample_image):
+        """Test per-photo body metrics in batched analysis"""
+        results = analyzer.analyze_photos(
+            [sample_image, sample_image],
+            metrics=[{'weight': 80, 'height': 180, 'age': 30}, None]
+        )
+        
+        assert 'bmi' in results[0]['analysis']
+        assert results[0]['analysis']['model_type'] == 'Hybrid BMI + Visual AI'
+        assert 'bmi' not in results[1]['analysis']
+    
+    def test_compare_photos_single_forward_pass(self, analyzer, sample_image, mocker):
+        """Test comparison runs both photos in one batch with their metrics"""
+        img2 = Image.new('RGB', (224, 224), color=(150, 150, 150))
+        forward = mocker.spy(analyzer.engine, 'predict')
+        
+        comparison = analyzer.compare_photos(
+            sample_image,
+            img2,
+            before_metrics={'weight': 90, 'height': 180, 'age': 30},
+            after_metrics={'weight': 84, 'height': 180, 'age': 30}
+        )
+        
+        assert forward.call_count == 1
+        assert forward.call_args[0][0].shape == (2, 224, 224, 3)
+        assert comparison['before']['bmi'] > comparison['after']['bmi']
+        assert comparison['before']['model_type'] == 'Hybrid BMI + Visual AI'
+    
     def test_detect_pose_quality(self, analyzer, sample_image):
         """Test pose quality detection"""
         quality = analyzer.detect_pose_quality(sample_image)
@@ -120,6 +173,36 @@ class TestProgressPhotoAnalyzer:
         assert 0 <= quality['contrast'] <= 100
         assert 0 <= quality['quality_score'] <= 100
     
+    def test_pose_quality_bounded_resolution(self, analyzer):
+        """Test downsampled pose quality stays within documented tolerance"""
+        rng = np.random.default_rng(0)
+        height, width = 3024, 4032
+        img = np.zeros((height, width, 3), dtype=np.uint8)
+        img[..., 0] = np.arange(width) * 200 // width
+        img[..., 1] = (np.arange(height) * 180 // height)[:, None]
+        for _ in range(30):
+            center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+            axes = (int(rng.integers(20, width // 4)), int(rng.integers(20, height // 4)))
+            color = tuple(int(c) for c in rng.integers(0, 255, 3))
+            cv2.ellipse(img, center, axes, 0, 0, 360, color, -1)
+        img = cv2.GaussianBlur(img, (0, 0), 3)
+        
+        full = analyzer.detect_pose_quality(img)
+        fast = analyzer.detect_pose_quality(img, max_side=1024)
+        
+        assert abs(fast['brightness'] - full['brightness']) <= 0.1
+        assert abs(fast['contrast'] - full['contrast']) <= 0.5
+        assert abs(fast['edge_clarity'] - full['edge_clarity']) <= 2.0
+        assert abs(fast['quality_score'] - full['quality_score']) <= 1.0
+    
+    def test_pose_quality_batch(self, analyzer, sample_image):
+        """Test batch pose quality isolates failures"""
+        results = analyzer.detect_pose_quality_batch([sample_image, "not_a_valid_path.jpg"])
+        
+        assert results[0]['success'] is True
+        assert results[0]['quality'] == analyzer.detect_pose_quality(sample_image)
+        assert results[1]['success'] is False
+    
     def test_calculate_confidence(self, analyzer):
         """Test confidence calculation"""
         # Similar values should give high confidence
@@ -130,6 +213,51 @@ class TestProgressPhotoAnalyzer:
         confidence_low = analyzer._calculate_confidence(0.1, 0.5, 0.9)
         assert confidence_low >= 0.5  # Always at least 50%
     
+    def test_vectorized_scoring_matches_scalar(self, analyzer):
+        """Test batch scoring gives exactly the per-photo results"""
+        rng = np.random.default_rng(0)
+        raw = [tuple(row) for row in rng.random((300, 3)).astype(np.float32)]
+        # Muscle-score range boundaries, and float64 outputs mixed in
+        raw += [(0.3, 0.4, 0.7), (0.1, 0.7, 0.4), (0.5, 0.55, 0.5)]
+        
+        metrics = []
+        for idx in range(len(raw)):
+            if idx % 4 == 0:
+                metrics.append(None)
+            elif idx % 4 == 1:
+                metrics.append({'weight': None, 'height': 180.0, 'age': None, 'gender': 'male'})
+            else:
+                metrics.append({
+                    'weight': float(rng.uniform(40, 160)),
+                    'height': float(rng.uniform(140, 210)),
+                    'age': int(rng.integers(16, 80)) if idx % 3 else None,
+                    'gender': 'female' if idx % 5 == 0 else 'male'
+                })
+        
+        entries = [(row, 1.234, f'key{idx}') for idx, row in enumerate(raw)]
+        expected = [analyzer._analysis_from_entry(entry, m) for entry, m in zip(entries, metrics)]
+        
+        assert analyzer._analyses_from_entries(entries, metrics) == expected
+        
+    def test_vectorized_scoring_isolates_bad_metrics(self, analyzer, mocker):
+        """Test a malformed metric only fails its own photo; the rest are batch-scored"""
+        raw = [((np.float32(0.3), np.float32(0.6), np.float32(0.5)), None, None)] * 4
+        batch = mocker.spy(analyzer, '_build_analyses')
+        single = mocker.spy(analyzer, '_build_analysis')
+        results = analyzer.analyses_from_raw(raw, metrics=[
+            {'weight': 80, 'height': 180},
+            {'weight': 'heavy', 'height': 180},
+            None,
+            {'weight': 70, 'height': 175, 'gender': 'other'}
+        ])
+        
+        assert [r['success'] for r in results] == [True, False, True, False]
+        assert results[0]['analysis']['bmi'] == 24.69
+        assert results[1]['error'] == 'weight must be a number'
+        assert batch.call_count == 1
+        assert len(batch.call_args.args[0]) == 2
+        assert single.call_count == 0
+    
     def test_get_analyzer_singleton(self):
         """Test singleton pattern for get_analyzer()"""
         analyzer1 = get_analyzer()
@@ -155,6 +283,360 @@ class TestProgressPhotoAnalyzer:
         for output in outputs:
             assert output.shape == (1, 1)
     
+    def test_inference_engine_matches_predict(self, analyzer, sample_image):
+        """Test compiled engine outputs match model.predict"""
+        processed = analyzer.preprocess_image(sample_image)
+        
+        expected = analyzer.model.predict(processed, verbose=0)
+        outputs = analyzer.engine.predict(processed)
+        
+        assert analyzer.engine.warmed_up is True
+        assert len(outputs) == 3
+        for output, reference in zip(outputs, expected):
+            assert output.shape == (1, 1)
+            np.testing.assert_allclose(output, reference, atol=1e-5)
+    
+    def test_warmup_records_batch_sizes_and_timings(self, analyzer):
+        """Test warm-up runs each batch size once and is timed"""
+        assert 1 in analyzer.engine.warmed_batch_sizes
+        assert analyzer.startup_timings['build_ms'] > 0
+        
+        warmup_before = analyzer.startup_timings['warmup_ms']
+        analyzer.warmup((1, 2))
+        
+        assert {1, 2} <= analyzer.engine.warmed_batch_sizes
+        assert analyzer.startup_timings['warmup_ms'] >= warmup_before
+    
+    def test_model_artifact_loads_without_building(self, analyzer, tmp_path, mocker):
+        """Test a .keras artifact loads with no MobileNetV2 build and same outputs"""
+        artifact = str(tmp_path / 'fitness_model.keras')
+        analyzer.model.save(artifact)
+        build = mocker.patch.object(ProgressPhotoAnalyzer, '_build_model', side_effect=AssertionError)
+        
+        loaded = ProgressPhotoAnalyzer(model_path=artifact)
+        batch = np.random.default_rng(0).uniform(-1, 1, (2, 224, 224, 3)).astype(np.float32)
+        
+        build.assert_not_called()
+        for output, reference in zip(loaded.engine.predict(batch), analyzer.engine.predict(batch)):
+            np.testing.assert_allclose(output, reference, atol=1e-6)
+    
+    def test_micro_batching_reports_queue_wait(self, analyzer, sample_image):
+        """Test analysis through the micro-batching scheduler"""
+        expected = analyzer.analyze_photo(sample_image)
+        
+        analyzer.enable_micro_batching(max_batch_size=4, max_wait_ms=1)
+        try:
+            analysis = analyzer.analyze_photo(sample_image)
+        finally:
+            analyzer.scheduler.stop()
+        
+        assert analysis['queue_wait_ms'] >= 0
+        assert analysis['overall_score'] == pytest.approx(expected['overall_score'], abs=0.05)
+    
+    def test_cache_hit_skips_inference(self, analyzer, sample_image, mocker):
+        """Test repeated photos are served from the cache"""
+        img_bytes = io.BytesIO()
+        sample_image.save(img_bytes, format='JPEG')
+        data = img_bytes.getvalue()
+        
+        analyzer.enable_cache(max_entries=8)
+        first = analyzer.analyze_photo(data)
+        
+        preprocess = mocker.spy(analyzer, 'preprocess_image')
+        second = analyzer.analyze_photo(data, weight=80, height=180)
+        
+        assert preprocess.call_count == 0
+        assert second['muscle_score'] == first['muscle_score']
+        assert 'bmi' in second
+        assert analyzer.cache.stats()['hits'] == 1
+        assert analyzer.cache.stats()['misses'] == 1
+    
+    def test_submit_raw_matches_infer_raw(self, analyzer, sample_image):
+        """Test the non-blocking path returns the same raw outputs"""
+        expected = analyzer._infer_raw([sample_image, "missing.jpg"])
+        
+        analyzer.enable_micro_batching(max_batch_size=4, max_wait_ms=1.0)
+        try:
+            results = analyzer.submit_raw([sample_image, "missing.jpg"]).result(timeout=30)
+        finally:
+            analyzer.scheduler.stop()
+            analyzer.scheduler = None
+        
+        assert results[0][0] == expected[0][0]
+        assert results[0][1] is not None
+        assert isinstance(results[1], Exception)
+    
+    def test_submit_raw_writes_off_scheduler_thread(self, analyzer, sample_image, tmp_path, mocker):
+        """Test cache and store writes of submitted batches skip the scheduler's thread"""
+        analyzer.enable_cache()
+        analyzer.enable_store(str(tmp_path / "analyses.db"))
+        threads = []
+        put_many = analyzer.store.put_many
+        mocker.patch.object(
+            analyzer.store, 'put_many',
+            side_effect=lambda items: threads.append(threading.current_thread().name) or put_many(items)
+        )
+        
+        analyzer.enable_micro_batching(max_batch_size=4, max_wait_ms=1.0)
+        try:
+            results = analyzer.submit_raw([sample_image]).result(timeout=30)
+        finally:
+            analyzer.scheduler.stop()
+            analyzer.scheduler = None
+        
+        assert threads and threads[0].startswith('analysis-writer')
+        assert analyzer.cache.get(results[0][2]) is not None
+        assert analyzer.store.get(results[0][2]) is not None
+    
+    def test_two_stage_matches_analyze_photo(self, analyzer, sample_image):
+        """Test visual + scoring stages reproduce analyze_photo"""
+        analyzer.enable_cache()
+        
+        visual = analyzer.analyze_visual(sample_image)
+        scored = analyzer.score_visual(visual, weight=70, height=175, age=28, gender='female')
+        expected = analyzer.analyze_photo(sample_image, weight=70, height=175, age=28, gender='female')
+        
+        assert visual['image_id'] is not None
+        assert scored == expected
+    
+    def test_rescore_by_image_id(self, analyzer, sample_image, mocker):
+        """Test re-scoring a cached image without running the model"""
+        analyzer.enable_cache()
+        image_id = analyzer.analyze_photo(sample_image)['image_id']
+        
+        forward = mocker.spy(analyzer.engine, 'predict')
+        rescored = analyzer.rescore(image_id, weight=90, height=180)
+        
+        assert forward.call_count == 0
+        assert rescored['image_id'] == image_id
+        assert 'bmi' in rescored
+        
+        with pytest.raises(KeyError):
+            analyzer.rescore('unknown')
+    
+    def test_store_survives_restart(self, analyzer, sample_image, tmp_path, mocker):
+        """Test stored outputs answer repeat photos after the cache is gone"""
+        path = str(tmp_path / "analyses.db")
+        analyzer.enable_store(path)
+        first = analyzer.analyze_photo(sample_image, weight=80, height=180)
+        
+        # A restart: empty cache, store reopened from disk
+        analyzer.cache = None
+        analyzer.enable_store(path)
+        forward = mocker.spy(analyzer.engine, 'predict')
+        
+        assert analyzer.analyze_photo(sample_image, weight=80, height=180) == first
+        assert forward.call_count == 0
+        assert analyzer.rescore(first['image_id'], weight=80, height=180) == first
+    
+    def test_rescore_from_another_worker(self, analyzer, sample_image, tmp_path):
+        """Test an id analyzed by one worker rescores on another sharing the store"""
+        path = str(tmp_path / "analyses.db")
+        analyzer.enable_cache()
+        analyzer.enable_store(path)
+        first = analyzer.analyze_photo(sample_image, weight=80, height=180)
+        
+        # A second worker started before the photo was stored
+        other = ProgressPhotoAnalyzer()
+        # Workers load one weights file; these test models are freshly initialized
+        other._pinned_version = analyzer.model_version
+        other.enable_cache()
+        other.enable_store(path, preload=False)
+        
+        assert other.rescore(first['image_id'], weight=80, height=180) == first
+    
+    def test_store_preloads_cache(self, analyzer, sample_image, tmp_path, mocker):
+        """Test a restart preloads stored outputs into the in-memory cache"""
+        path = str(tmp_path / "analyses.db")
+        analyzer.enable_store(path)
+        first = analyzer.analyze_photo(sample_image)
+        
+        # A restart: fresh cache filled from the store, store reads unused
+        analyzer.enable_cache()
+        store = analyzer.enable_store(path)
+        lookup = mocker.spy(store, 'get')
+        
+        assert analyzer.analyze_photo(sample_image) == first
+        assert lookup.call_count == 0
+        assert analyzer.cache.stats()['hits'] == 1
+    
+    def test_store_keyed_by_model_version(self, analyzer, sample_image, tmp_path, mocker):
+        """Test outputs stored by another model version are not reused"""
+        path = str(tmp_path / "analyses.db")
+        analyzer.enable_store(path)
+        analyzer.analyze_photo(sample_image)
+        assert analyzer.model_version.startswith('keras-')
+        
+        analyzer._pinned_version = 'keras-retrained'
+        analyzer.enable_store(path, preload=False)
+        forward = mocker.spy(analyzer.engine, 'predict')
+        analyzer.analyze_photo(sample_image)
+        
+        assert forward.call_count == 1
+        assert analyzer.store.stats()['size'] == 2
+    
+    def test_model_version_change_drops_previous_outputs(self, analyzer, sample_image, tmp_path, mocker):
+        """Test a new engine version clears the cache and re-keys the store"""
+        analyzer.enable_cache()
+        analyzer.enable_store(str(tmp_path / "analyses.db"))
+        analyzer.analyze_photo(sample_image)
+        
+        # A model server restarted with other weights
+        mocker.patch.object(
+            type(analyzer.engine), 'model_version',
+            new_callable=mocker.PropertyMock, return_value='keras-retrained'
+        )
+        assert analyzer.sync_model_version() == 'keras-retrained'
+        assert len(analyzer.cache) == 0
+        assert analyzer.store.model_version == 'keras-retrained'
+        
+        forward = mocker.spy(analyzer.engine, 'predict')
+        analyzer.analyze_photo(sample_image)
+        assert forward.call_count == 1
+    
+    def test_pose_quality_stored(self, analyzer, sample_image, tmp_path, mocker):
+        """Test stored pose quality answers repeat photos without decoding"""
+        img_bytes = io.BytesIO()
+        sample_image.save(img_bytes, format='JPEG')
+        analyzer.enable_store(str(tmp_path / "analyses.db"))
+        first = analyzer.detect_pose_quality(analyzer.decode(img_bytes.getvalue(), ))
+        
+        decoded = analyzer.decode(img_bytes.getvalue(), )
+        plane = mocker.spy(analyzer, '_quality_plane')
+        
+        assert analyzer.detect_pose_quality(decoded) == first
+        assert plane.call_count == 0
+        assert decoded._image is None
+        # Another analysis resolution, or decode mode, is computed afresh
+        analyzer.detect_pose_quality(decoded, max_side=64)
+        assert plane.call_count == 1
+        analyzer.detect_pose_quality(DecodedImage(img_bytes.getvalue(), quality_draft_size=(64, 64)))
+        assert plane.call_count == 2
+    
+    def test_analyze_timeline(self, analyzer, sample_image):
+        """Test a timeline mixing uploads and image_ids"""
+        import datetime
+        
+        analyzer.enable_cache()
+        first = analyzer.analyze_photo(sample_image)
+        later = Image.new('RGB', (224, 224), color=(150, 150, 150))
+        
+        timeline = analyzer.analyze_timeline([
+            {'date': datetime.date(2024, 2, 1), 'image': later},
+            {'date': datetime.date(2024, 1, 1), 'image_id': first['image_id']}
+        ])
+        
+        assert [photo['index'] for photo in timeline['photos']] == [1, 0]
+        assert timeline['photos'][0]['analysis'] == first
+        assert timeline['deltas'][0]['days'] == 31
+    
+    def test_preprocess_pool_matches_in_process(self, analyzer, sample_image):
+        """Test pooled preprocessing gives the same analyses, failures included"""
+        def jpeg(color):
+            buffer = io.BytesIO()
+            Image.new('RGB', (640, 480), color=color).save(buffer, format='JPEG')
+            return buffer.getvalue()
+        
+        def inputs():
+            return [
+                jpeg((200, 120, 90)),
+                analyzer.decode(jpeg((40, 90, 160))),
+                sample_image,
+                b'not an image'
+            ]
+        
+        expected = analyzer.analyze_photos(inputs())
+        
+        pool = analyzer.enable_preprocess_pool(workers=2, queue_size=2)
+        try:
+            results = analyzer.analyze_photos(inputs())
+        finally:
+            pool.close()
+        
+        assert results[:3] == expected[:3]
+        assert not results[3]['success']
+    
+    def test_fast_decode_parity(self, analyzer):
+        """Test draft-mode JPEG decode keeps scores within tolerance"""
+        # Photo-like 12MP JPEG: smooth gradients plus a bright subject
+        height, width = 3024, 4032
+        yy, xx = np.mgrid[0:height, 0:width]
+        img_array = np.stack([
+            (xx * 255 // width),
+            (yy * 255 // height),
+            np.full((height, width), 96)
+        ], axis=-1).astype(np.uint8)
+        img_array[800:2400, 1500:2500] = (210, 170, 150)
+        img_bytes = io.BytesIO()
+        Image.fromarray(img_array).save(img_bytes, format='JPEG', quality=90)
+        data = img_bytes.getvalue()
+        
+        analyzer.fast_decode = False
+        full = analyzer.preprocess_image(data)
+        full_outputs = analyzer.engine.predict(full)
+        
+        analyzer.fast_decode = True
+        fast = analyzer.preprocess_image(data)
+        fast_outputs = analyzer.engine.predict(fast)
+        
+        # Inputs in [-1, 1]; mean pixel error well under 1%
+        assert np.mean(np.abs(fast - full)) < 0.02
+        # Head outputs within 1 point on the 0-100 score scale
+        for fast_output, full_output in zip(fast_outputs, full_outputs):
+            assert abs(fast_output[0][0] - full_output[0][0]) * 100 < 1.0
+    
+    def test_decoded_image_single_decode(self, analyzer, sample_image, mocker):
+        """Test analysis and pose quality share one decode"""
+        img_bytes = io.BytesIO()
+        sample_image.save(img_bytes, format='JPEG')
+        data = img_bytes.getvalue()
+        
+        expected_quality = analyzer.detect_pose_quality(Image.open(io.BytesIO(data)).convert('RGB'))
+        expected_analysis = analyzer.analyze_photo(data)
+        
+        image_open = mocker.spy(Image, 'open')
+        decoded = analyzer.decode(data, )
+        analysis = analyzer.analyze_photo(decoded)
+        quality = analyzer.detect_pose_quality(decoded)
+        
+        assert image_open.call_count == 1
+        assert isinstance(decoded, DecodedImage)
+        assert decoded.gray.shape == (224, 224)
+        assert quality == expected_quality
+        assert analysis['overall_score'] == expected_analysis['overall_score']
+    
+    def test_model_input_independent_of_pose_quality(self, analyzer):
+        """Test pose quality decodes large JPEGs separately from the model input"""
+        analyzer.quality_max_side = 1024
+        img = Image.fromarray(np.random.RandomState(0).randint(0, 255, (1536, 2048, 3), dtype=np.uint8))
+        img_bytes = io.BytesIO()
+        img.save(img_bytes, format='JPEG')
+        data = img_bytes.getvalue()
+        
+        plain = analyzer.decode(data)
+        expected = plain.model_input(analyzer.img_size)
+        
+        with_quality = analyzer.decode(data)
+        analyzer.detect_pose_quality(with_quality)
+        
+        assert np.array_equal(with_quality.model_input(analyzer.img_size), expected)
+        assert with_quality.image.size == plain.image.size == (512, 384)
+        assert with_quality.quality_image.size == (2048, 1536)
+    
+    def test_decoded_image_cache_hit_skips_decode(self, analyzer, sample_image):
+        """Test a cached DecodedImage is never decoded"""
+        img_bytes = io.BytesIO()
+        sample_image.save(img_bytes, format='JPEG')
+        
+        analyzer.enable_cache()
+        analyzer.analyze_photo(analyzer.decode(img_bytes.getvalue()))
+        
+        decoded = analyzer.decode(img_bytes.getvalue())
+        analyzer.analyze_photo(decoded)
+        
+        assert decoded._image is None
+        assert analyzer.cache.stats()['hits'] == 1
+    
     def test_analyze_different_image_sizes(self, analyzer):
         """Test analysis with different input image sizes"""
         sizes = [(100, 100), (500, 500), (1920, 1080)]
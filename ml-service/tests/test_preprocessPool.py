@@ -0,0 +1,113 @@
+"""
+Unit tests for the decode/preprocess process pool
+"""
+
+import pytest
+import numpy as np
+from PIL import Image
+import io
+import threading
+import sys
+import os
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.photoAnalyzer import to_model_input
+from src.preprocessPool import PreprocessPool
+
+
+def encode(size=(640, 480), seed=0, fmt='JPEG'):
+    """Encode a random RGB image"""
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def reference(data, draft_size):
+    """In-process model input for encoded bytes"""
+    img = Image.open(io.BytesIO(data))
+    if draft_size is not None:
+        img.draft('RGB', draft_size)
+    return to_model_input(img.convert('RGB'))
+
+
+@pytest.fixture(scope='module')
+def pool():
+    """Two workers sharing three slots"""
+    pool = PreprocessPool(workers=2, queue_size=3)
+    yield pool
+    pool.close()
+
+
+class TestPreprocessPool:
+    """Test suite for PreprocessPool"""
+
+    def test_matches_in_process_preprocessing(self, pool):
+        """Test pooled tensors are bit-identical to to_model_input()"""
+        jobs = [
+            (encode(seed=1), (224, 224)),
+            (encode(size=(1200, 900), seed=2), (224, 224)),
+            (encode(seed=3), None),
+            (encode(size=(300, 500), seed=4, fmt='PNG'), (224, 224))
+        ]
+
+        tensors = pool.preprocess_many(jobs)
+
+        for tensor, (data, draft_size) in zip(tensors, jobs):
+            expected = reference(data, draft_size)
+            assert tensor.shape == (1, 224, 224, 3)
+            assert tensor.dtype == np.float32
+            assert np.array_equal(tensor, expected)
+
+    def test_bad_image_fails_only_its_entry(self, pool):
+        """Test a corrupt upload yields its exception in its own position"""
+        results = pool.preprocess_many([
+            (encode(seed=5), (224, 224)),
+            (b'not an image', (224, 224)),
+            (encode(seed=6), (224, 224))
+        ])
+
+        assert isinstance(results[1], Exception)
+        assert isinstance(results[0], np.ndarray)
+        assert isinstance(results[2], np.ndarray)
+        assert pool.stats()['slots_in_use'] == 0
+
+    def test_more_images_than_slots(self, pool):
+        """Test requests larger than the slot count complete in order"""
+        jobs = [(encode(size=(256, 256), seed=seed), (224, 224)) for seed in range(8)]
+
+        tensors = pool.preprocess_many(jobs)
+
+        for tensor, (data, draft_size) in zip(tensors, jobs):
+            assert np.array_equal(tensor, reference(data, draft_size))
+
+    def test_concurrent_callers_share_slots(self, pool):
+        """Test concurrent requests each get their own tensors back"""
+        jobs = {seed: [(encode(size=(256, 256), seed=seed * 10 + i), (224, 224)) for i in range(3)]
+                for seed in range(4)}
+        results = {}
+
+        def run(seed):
+            results[seed] = pool.preprocess_many(jobs[seed])
+
+        threads = [threading.Thread(target=run, args=(seed,)) for seed in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+
+        for seed, tensors in results.items():
+            for tensor, (data, draft_size) in zip(tensors, jobs[seed]):
+                assert np.array_equal(tensor, reference(data, draft_size))
+        assert len(results) == 4
+        assert pool.stats() == {'workers': 2, 'queue_size': 3, 'slots_in_use': 0}
+
+    def test_invalid_sizes(self):
+        """Test pool and queue sizes must be positive"""
+        with pytest.raises(ValueError):
+            PreprocessPool(workers=0)
+        with pytest.raises(ValueError):
+            PreprocessPool(workers=1, queue_size=0)
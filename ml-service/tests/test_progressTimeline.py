@@ -0,0 +1,95 @@
+"""
+Unit tests for progress timeline assembly
+"""
+
+import pytest
+import numpy as np
+import datetime
+import sys
+import os
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.progressTimeline import build_timeline, day_number, progress_delta, smooth
+
+
+def analysis(body_fat, muscle, posture=50.0, overall=60.0):
+    """Analyze_photos() success entry with the given scores"""
+    return {'success': True, 'analysis': {
+        'body_fat_estimate': body_fat,
+        'muscle_score': muscle,
+        'posture_score': posture,
+        'overall_score': overall
+    }}
+
+
+class TestProgressTimeline:
+    """Test suite for build_timeline() and its helpers"""
+
+    def test_progress_delta(self):
+        """Test deltas use compare_photos signs: positive is better"""
+        delta = progress_delta(analysis(20, 50)['analysis'], analysis(18, 53, 55, 64)['analysis'])
+
+        assert delta == {
+            'body_fat_change': 2,
+            'muscle_gain': 3,
+            'posture_improvement': 5,
+            'overall_progress': 4
+        }
+
+    def test_day_number(self):
+        """Test dates and datetimes share one day axis"""
+        assert day_number(datetime.datetime(2024, 5, 1, 12)) - day_number(datetime.date(2024, 5, 1)) == 0.5
+
+    def test_orders_by_date_and_skips_failures(self):
+        """Test photos are sorted by date and failed photos get no deltas"""
+        dates = [datetime.date(2024, 3, 1), datetime.date(2024, 1, 1), datetime.date(2024, 2, 1)]
+        results = [analysis(18, 60), analysis(22, 50), {'success': False, 'error': 'bad photo'}]
+
+        timeline = build_timeline(dates, results)
+
+        assert [photo['index'] for photo in timeline['photos']] == [1, 2, 0]
+        assert timeline['photos'][0]['date'] == '2024-01-01'
+        assert timeline['photos'][1]['error'] == 'bad photo'
+        assert len(timeline['deltas']) == 1
+        assert timeline['deltas'][0]['from_index'] == 1
+        assert timeline['deltas'][0]['to_index'] == 0
+        assert timeline['deltas'][0]['days'] == 60
+        assert timeline['deltas'][0]['body_fat_change'] == 4
+        assert len(timeline['trends']['muscle_score']['smoothed']) == 2
+
+    def test_linear_trend(self):
+        """Test the weekly change of a steady trend"""
+        start = datetime.date(2024, 1, 1)
+        dates = [start + datetime.timedelta(days=7 * week) for week in range(5)]
+        results = [analysis(25 - 0.5 * week, 40 + week) for week in range(5)]
+
+        trends = build_timeline(dates, results)['trends']
+
+        assert trends['body_fat_estimate']['change_per_week'] == pytest.approx(-0.5)
+        assert trends['muscle_score']['change_per_week'] == pytest.approx(1.0)
+        # Smoothing lags behind a rising series
+        assert trends['muscle_score']['smoothed'][0] == 40
+        assert 42 < trends['muscle_score']['smoothed'][-1] < 44
+
+    def test_single_photo(self):
+        """Test a one-photo timeline has no deltas and no slope"""
+        timeline = build_timeline([datetime.date(2024, 1, 1)], [analysis(20, 50)])
+
+        assert timeline['deltas'] == []
+        assert timeline['trends']['body_fat_estimate'] == {'smoothed': [20], 'change_per_week': None}
+
+    def test_smooth_weights_by_elapsed_time(self):
+        """Test same-day photos count equally and older ones decay by half-life"""
+        values = np.array([[10.0], [20.0], [40.0]])
+
+        smoothed = smooth(np.array([0.0, 0.0, 14.0]), values, half_life_days=14)
+
+        assert smoothed[1, 0] == pytest.approx(15.0)
+        assert smoothed[2, 0] == pytest.approx((0.5 * 10 + 0.5 * 20 + 40) / 2)
+
+    def test_rejects_non_positive_smoothing(self):
+        """Test the smoothing half-life must be positive"""
+        with pytest.raises(ValueError):
+            build_timeline([datetime.date(2024, 1, 1)], [analysis(20, 50)], smoothing_days=0)
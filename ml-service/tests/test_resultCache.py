@@ -0,0 +1,117 @@
+"""
+Unit tests for the content-addressed analysis cache
+"""
+
+import pytest
+import numpy as np
+from PIL import Image
+import io
+import sys
+import os
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.resultCache import AnalysisCache, content_key
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestContentKey:
+    """Test suite for content_key()"""
+
+    def test_bytes_and_path_agree(self, tmp_path):
+        """Test a file path hashes the same as its bytes"""
+        img_bytes = io.BytesIO()
+        Image.new('RGB', (50, 50), color=(10, 20, 30)).save(img_bytes, format='PNG')
+        path = tmp_path / "photo.png"
+        path.write_bytes(img_bytes.getvalue())
+
+        assert content_key(img_bytes.getvalue()) == content_key(str(path))
+
+    def test_different_content_different_key(self):
+        """Test different pixels give different keys"""
+        img1 = Image.new('RGB', (50, 50), color=(10, 20, 30))
+        img2 = Image.new('RGB', (50, 50), color=(10, 20, 31))
+
+        assert content_key(img1) != content_key(img2)
+        assert content_key(img1) == content_key(img1.copy())
+
+    def test_numpy_shape_is_part_of_key(self):
+        """Test arrays with the same bytes but different shapes differ"""
+        arr = np.zeros((10, 20, 3), dtype=np.uint8)
+
+        assert content_key(arr) != content_key(arr.reshape(20, 10, 3))
+
+    def test_invalid_input(self):
+        """Test unsupported input types are rejected"""
+        with pytest.raises(ValueError):
+            content_key(42)
+
+
+class TestAnalysisCache:
+    """Test suite for AnalysisCache"""
+
+    def test_hit_and_miss_counters(self):
+        """Test lookups update hit/miss counters"""
+        cache = AnalysisCache(max_entries=4)
+
+        assert cache.get('a') is None
+        cache.put('a', (0.1, 0.2, 0.3))
+        assert cache.get('a') == (0.1, 0.2, 0.3)
+
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['hit_rate'] == 0.5
+        assert stats['size'] == 1
+
+    def test_lru_eviction(self):
+        """Test least recently used entries are evicted first"""
+        cache = AnalysisCache(max_entries=2)
+
+        cache.put('a', (1, 1, 1))
+        cache.put('b', (2, 2, 2))
+        cache.get('a')
+        cache.put('c', (3, 3, 3))
+
+        assert cache.get('b') is None
+        assert cache.get('a') == (1, 1, 1)
+        assert cache.get('c') == (3, 3, 3)
+        assert cache.stats()['evictions'] == 1
+
+    def test_ttl_expiry(self):
+        """Test entries expire after ttl_seconds"""
+        clock = FakeClock()
+        cache = AnalysisCache(max_entries=4, ttl_seconds=10, clock=clock)
+
+        cache.put('a', (1, 1, 1))
+        clock.now = 9
+        assert cache.get('a') == (1, 1, 1)
+
+        clock.now = 11
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+    def test_clear(self):
+        """Test clear drops entries and counters"""
+        cache = AnalysisCache()
+        cache.put('a', (1, 1, 1))
+        cache.get('a')
+        cache.clear()
+
+        assert len(cache) == 0
+        assert cache.stats()['hits'] == 0
+
+    def test_invalid_size(self):
+        """Test max_entries must be positive"""
+        with pytest.raises(ValueError):
+            AnalysisCache(max_entries=0)
@@ -0,0 +1,150 @@
+"""
+Unit tests for head fine-tuning on cached backbone features
+"""
+
+import pytest
+import numpy as np
+from PIL import Image
+import sys
+import os
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.photoAnalyzer import ProgressPhotoAnalyzer
+from src.trainHeads import (
+    FEATURE_DIM, export_weights, extract_features, feature_extractor, load_features,
+    read_labels, train_heads
+)
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return ProgressPhotoAnalyzer()
+
+
+@pytest.fixture
+def labeled_photos(tmp_path):
+    """Ten photos whose labels follow their brightness, plus one broken file"""
+    rng = np.random.default_rng(0)
+    lines = ['path,body_fat,muscle_score,posture_score']
+    for i in range(10):
+        level = 25 * i
+        pixels = np.clip(rng.normal(level, 10, (240, 180, 3)), 0, 255).astype(np.uint8)
+        Image.fromarray(pixels).save(tmp_path / f"photo_{i}.jpg")
+        lines.append(f"photo_{i}.jpg,{10 + 3 * i},{80 - 5 * i},{50 + 2 * i}")
+    (tmp_path / "broken.jpg").write_bytes(b'not an image')
+    lines.append("broken.jpg,20,50,50")
+
+    labels_path = tmp_path / "labels.csv"
+    labels_path.write_text('\n'.join(lines) + '\n')
+    return str(labels_path)
+
+
+class TestTrainHeads:
+    """Test suite for the fine-tuning pipeline"""
+
+    def test_read_labels(self, labeled_photos, tmp_path):
+        """Test labels are scaled to 0-1 and paths resolved next to the CSV"""
+        paths, targets = read_labels(labeled_photos)
+
+        assert len(paths) == 11
+        assert paths[0] == str(tmp_path / "photo_0.jpg")
+        assert targets.shape == (11, 3)
+        np.testing.assert_allclose(targets[1], [0.13, 0.75, 0.52], rtol=1e-6)
+
+    def test_read_labels_rejects_bad_rows(self, tmp_path):
+        """Test missing columns and out-of-range values are reported"""
+        path = tmp_path / "labels.csv"
+        path.write_text("path,body_fat\na.jpg,20\n")
+        with pytest.raises(ValueError, match="missing columns"):
+            read_labels(str(path))
+
+        path.write_text("path,body_fat,muscle_score,posture_score\na.jpg,20,150,50\n")
+        with pytest.raises(ValueError, match="Line 2"):
+            read_labels(str(path))
+
+    def test_features_are_cached(self, analyzer, labeled_photos, tmp_path):
+        """Test features match the backbone and a second run reuses them"""
+        cache_dir = str(tmp_path / "features")
+        paths, targets = read_labels(labeled_photos)
+
+        manifest = extract_features(analyzer, paths, targets, cache_dir, batch_size=4)
+        features, cached_targets, usable = load_features(cache_dir)
+
+        assert manifest['extracted'] == 11
+        assert manifest['failed'] == [10]
+        assert isinstance(features, np.memmap)
+        assert features.shape == (11, FEATURE_DIM)
+        assert list(usable) == list(range(10))
+        np.testing.assert_array_equal(cached_targets, targets)
+
+        expected = feature_extractor(analyzer.model).predict_on_batch(analyzer.preprocess_image(paths[3]))
+        np.testing.assert_allclose(features[3], np.asarray(expected)[0], atol=1e-5)
+
+        assert extract_features(analyzer, paths, targets, cache_dir)['extracted'] == 0
+
+    def test_features_rebuilt_when_photos_change(self, analyzer, labeled_photos, tmp_path):
+        """Test a changed photo invalidates the cache"""
+        cache_dir = str(tmp_path / "features")
+        paths, targets = read_labels(labeled_photos)
+        extract_features(analyzer, paths, targets, cache_dir)
+
+        Image.new('RGB', (200, 200), color=(255, 0, 0)).save(paths[0])
+
+        assert extract_features(analyzer, paths, targets, cache_dir)['extracted'] == 11
+
+    def test_train_fits_labels(self):
+        """Test heads trained on cached features fit a learnable target"""
+        rng = np.random.default_rng(1)
+        features = rng.uniform(0, 2, (80, FEATURE_DIM)).astype(np.float32)
+        targets = (1 / (1 + np.exp(-2 * (features[:, :3] - 1)))).astype(np.float32)
+
+        head_model, report = train_heads(features, targets, epochs=300, val_fraction=0)
+
+        assert report['train_rows'] == 80
+        assert report['val_mae'] is None
+        assert report['epochs'] == 300
+        assert max(report['train_mae'].values()) < 5
+
+    def test_validation_split_stops_early(self):
+        """Test a held-out split is reported and stops training without improvement"""
+        rng = np.random.default_rng(2)
+        features = rng.uniform(0, 2, (40, FEATURE_DIM)).astype(np.float32)
+        targets = rng.uniform(0, 1, (40, 3)).astype(np.float32)
+
+        _, report = train_heads(features, targets, epochs=500, val_fraction=0.25, patience=10)
+
+        assert report['train_rows'] == 30
+        assert report['val_rows'] == 10
+        assert report['epochs'] == report['best_epoch'] + 10 < 500
+        assert set(report['val_mae']) == {'body_fat', 'muscle_score', 'posture_score'}
+
+    def test_export_loads_through_model_path(self, analyzer, labeled_photos, tmp_path):
+        """Test exported weights reproduce the head model through model_path"""
+        cache_dir = str(tmp_path / "features")
+        paths, targets = read_labels(labeled_photos)
+        extract_features(analyzer, paths, targets, cache_dir)
+        features, targets, usable = load_features(cache_dir)
+        head_model, _ = train_heads(features, targets, usable, epochs=5)
+
+        output = str(tmp_path / "fine_tuned.weights.h5")
+        export_weights(ProgressPhotoAnalyzer(), head_model, output)
+        tuned = ProgressPhotoAnalyzer(model_path=output)
+
+        outputs = tuned.engine.predict(analyzer.preprocess_image(paths[2]))
+        expected = head_model.predict_on_batch(features[2:3])
+        for output, head in zip(outputs, expected):
+            np.testing.assert_allclose(np.asarray(output), np.asarray(head), atol=1e-4)
+        for name in ('fc1', 'body_fat'):
+            np.testing.assert_array_equal(
+                tuned.model.get_layer(name).get_weights()[0],
+                head_model.get_layer(name).get_weights()[0]
+            )
+
+    def test_export_rejects_unknown_format(self, analyzer, tmp_path):
+        """Test only .weights.h5 and .keras outputs are written"""
+        from src.trainHeads import build_head_model
+
+        with pytest.raises(ValueError):
+            export_weights(analyzer, build_head_model(), str(tmp_path / "model.h5"))
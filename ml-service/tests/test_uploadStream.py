@@ -0,0 +1,126 @@
+"""
+Unit tests for incremental multipart parsing and upload batching
+"""
+
+import pytest
+import sys
+import os
+
+from werkzeug.datastructures import FileStorage, MultiDict
+from werkzeug.test import encode_multipart
+import io
+
+# Add parent directory to path to import src modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.uploadStream import MultipartUploads, UploadBatcher, label_results
+
+
+def multipart(files, fields=None):
+    """Encode (filename, bytes) files as 'photos[]' parts plus form fields"""
+    data = MultiDict(fields or {})
+    for filename, content in files:
+        data.add('photos[]', FileStorage(io.BytesIO(content), filename=filename))
+    return encode_multipart(data)
+
+
+def feed_in_chunks(parser, body, size):
+    """Feed a body in fixed-size chunks, then end it"""
+    completed = []
+    for start in range(0, len(body), size):
+        completed.extend(parser.feed(body[start:start + size]))
+    completed.extend(parser.feed(None))
+    return completed
+
+
+class TestMultipartUploads:
+    """Test suite for MultipartUploads"""
+
+    @pytest.mark.parametrize('chunk_size', [7, 1024, 1 << 20])
+    def test_files_complete_across_chunks(self, chunk_size):
+        """Test files are reassembled whatever the chunking"""
+        files = [('a.jpg', b'A' * 5000), ('b.jpg', b''), ('c.jpg', bytes(range(256)) * 40)]
+        boundary, body = multipart(files, {'note': 'ignored'})
+
+        parser = MultipartUploads(boundary)
+        completed = feed_in_chunks(parser, body, chunk_size)
+
+        assert completed == [(name, content, None) for name, content in files]
+        assert parser.finished
+
+    def test_empty_file_at_any_split(self):
+        """Test an empty file never swallows the next part, wherever the body splits"""
+        files = [('a.jpg', b'A' * 20), ('empty.jpg', b''), ('c.jpg', b'C\r\n\r\n' * 5)]
+        boundary, body = multipart(files)
+
+        for split in range(1, len(body)):
+            parser = MultipartUploads(boundary)
+            completed = parser.feed(body[:split]) + parser.feed(body[split:]) + parser.feed(None)
+
+            assert completed == [(name, content, None) for name, content in files], split
+
+    def test_files_emitted_as_they_complete(self):
+        """Test a file is returned before the rest of the body arrives"""
+        boundary, body = multipart([('a.jpg', b'A' * 100), ('b.jpg', b'B' * 100000)])
+        parser = MultipartUploads(boundary)
+
+        first = parser.feed(body[:len(body) // 2])
+
+        assert first == [('a.jpg', b'A' * 100, None)]
+
+    def test_oversize_file_reported(self):
+        """Test an oversize file is rejected without sinking the rest"""
+        boundary, body = multipart([('big.jpg', b'X' * 2000), ('ok.jpg', b'Y' * 10)])
+        parser = MultipartUploads(boundary, max_file_size=1000)
+
+        completed = feed_in_chunks(parser, body, 256)
+
+        assert completed == [('big.jpg', None, 'File too large'), ('ok.jpg', b'Y' * 10, None)]
+
+    def test_other_fields_skipped(self):
+        """Test parts of other fields are not returned"""
+        boundary, body = multipart([('a.jpg', b'A')])
+        parser = MultipartUploads(boundary, field_name='photo')
+
+        assert feed_in_chunks(parser, body, 64) == []
+
+
+class TestUploadBatcher:
+    """Test suite for UploadBatcher"""
+
+    def test_batches_and_rejections(self):
+        """Test photos are grouped by batch size and bad files reported at once"""
+        files = [(f'{i}.jpg', b'x') for i in range(5)] + [('notes.txt', b'x'), ('5.jpg', b'x')]
+        boundary, body = multipart(files)
+        batcher = UploadBatcher(
+            boundary,
+            batch_size=2,
+            allowed=lambda filename: filename.endswith('.jpg')
+        )
+
+        items, batches = batcher.feed(body)
+        tail_items, tail_batches = batcher.feed(None)
+
+        assert [[index for index, _, _ in batch] for batch in batches + tail_batches] == [[0, 1], [2, 3], [4, 6]]
+        assert items + tail_items == [
+            {'index': 5, 'filename': 'notes.txt', 'success': False, 'error': 'Invalid file type'}
+        ]
+
+    def test_max_photos(self):
+        """Test the photo limit stops the stream with an error line"""
+        boundary, body = multipart([(f'{i}.jpg', b'x') for i in range(4)])
+        batcher = UploadBatcher(boundary, batch_size=8, max_photos=3)
+
+        items, batches = batcher.feed(body)
+
+        assert batcher.stopped
+        assert [index for index, _, _ in batches[0]] == [0, 1, 2]
+        assert items == [{'success': False, 'error': 'Maximum 3 photos per request'}]
+        assert batcher.feed(None) == ([], [])
+
+    def test_label_results(self):
+        """Test results get the batch-analyze item shape"""
+        batch = [(4, 'a.jpg', b''), (7, 'b.jpg', b'')]
+        results = label_results(batch, [{'success': True}, {'success': False}])
+
+        assert [(r['index'], r['filename']) for r in results] == [(4, 'a.jpg'), (7, 'b.jpg')]